@@ -1,5 +1,7 @@
 from django.contrib import admin
 from .models import Room, Complaint, ComplaintImage, Department, Issue_Category
+from .routers import read_database
+from .ticketing import next_ticket_id
 
 @admin.register(Room)
 class RoomAdmin(admin.ModelAdmin):
@@ -26,6 +28,26 @@ class ComplaintAdmin(admin.ModelAdmin):
     ordering = ('-submitted_at',)
     date_hierarchy = 'submitted_at'
 
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        # The changelist with its date hierarchy and filters is a reporting
+        # read; the change form and actions stay on the primary
+        if request.method == 'GET' and request.resolver_match.url_name == 'complaints_complaint_changelist':
+            queryset = queryset.using(read_database(request))
+        return queryset
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        # The admin saves inside a transaction, so take the ticket ID from the
+        # allocator's cached block before it opens, see ticketing.next_id
+        if object_id is None and request.method == 'POST':
+            request.complaint_ticket_id = next_ticket_id()
+        return super().changeform_view(request, object_id, form_url, extra_context)
+
+    def save_model(self, request, obj, form, change):
+        if not change and not obj.ticket_id:
+            obj.ticket_id = getattr(request, 'complaint_ticket_id', '')
+        super().save_model(request, obj, form, change)
+
 @admin.register(Department)
 class DepartmentAdmin(admin.ModelAdmin):
     list_display = ('department_code', 'department_name','status')
@@ -0,0 +1,173 @@
+"""
+Content-addressed media files with reference counts.
+
+Complaint images go through ContentAddressedStorage. An upload is hashed while
+it is written, and the file is named after its SHA-256, so the same bytes are
+only ever stored once. QR images keep their own names, which are already
+derived from the encoded URL they render.
+
+Every stored file that a model field points at has a Blob row counting the
+references. The counts are maintained from signals (see signals.py), and a
+file is deleted once its last reference is gone. Writes that bypass
+save()/delete() must call acquire()/release() themselves.
+
+Reusing a stored file races with deleting it, so both sides go through the
+file's Blob row: code about to reuse a file pins the row first, in the
+transaction that will reference the file, and the delete removes the row and
+the file in one transaction. Whichever comes second waits for the other.
+"""
+import hashlib
+import os
+import posixpath
+import tempfile
+from collections import Counter
+
+from django.core.files.storage import FileSystemStorage
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores every file as <directory>/<first two hex digits>/<sha256><ext>. A
+    file whose content is already stored is not written a second time.
+    """
+
+    def _save(self, name, content):
+        directory = posixpath.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        full_directory = self.path(directory)
+        os.makedirs(full_directory, exist_ok=True)
+
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=full_directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode('utf-8')
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+            hexdigest = digest.hexdigest()
+            name = posixpath.join(directory, hexdigest[:2], hexdigest + extension)
+            full_path = self.path(name)
+            pin(name)
+            if not os.path.exists(full_path):
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(temp_path, self.file_permissions_mode)
+                # Same name means same bytes, so losing a race here is harmless
+                os.replace(temp_path, full_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        # The final name comes from the content, see _save
+        return name
+
+
+blob_storage = ContentAddressedStorage()
+
+
+def file_fields(model):
+    from .models import ComplaintImage, Room
+
+    return {ComplaintImage: ['image', 'thumbnail'], Room: ['qr_code']}.get(model, [])
+
+
+def referenced_names(instance):
+    """Map each file field of `instance` to its file name; deferred fields are left out."""
+    deferred = instance.get_deferred_fields()
+    return {
+        field: getattr(instance, field).name or None
+        for field in file_fields(type(instance)) if field not in deferred
+    }
+
+
+def acquire(names):
+    """Add one reference per occurrence in `names` (empty names are skipped)."""
+    _add_references(Counter(name for name in names if name))
+
+
+def pin(name):
+    """
+    Lock the Blob row of `name`, creating it without references, until the
+    current transaction ends. Call before reusing a stored file, in the
+    transaction that will reference it: until then delete_if_unreferenced
+    cannot remove the file, and if it already did, the file is written again.
+    """
+    _add_references({name: 0})
+
+
+def _add_references(counts):
+    from .models import Blob
+
+    if not counts:
+        return
+    table = connection.ops.quote_name(Blob._meta.db_table)
+    rows = ', '.join(['(%s, %s)'] * len(counts))
+    params = [value for item in counts.items() for value in item]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (name, refcount) VALUES {rows} '
+            f'ON CONFLICT (name) DO UPDATE SET refcount = {table}.refcount + excluded.refcount',
+            params,
+        )
+
+
+def release(names, storage):
+    """
+    Drop one reference per occurrence in `names`. Files left without
+    references are deleted once the transaction commits. Files that have no
+    Blob row (never counted) are left alone.
+    """
+    from .models import Blob
+
+    counts = Counter(name for name in names if name)
+    if not counts:
+        return
+    with transaction.atomic():
+        for name, count in counts.items():
+            Blob.objects.filter(name=name).update(refcount=F('refcount') - count)
+        orphans = list(Blob.objects.filter(name__in=list(counts), refcount__lte=0).values_list('name', flat=True))
+    for name in orphans:
+        transaction.on_commit(lambda name=name: delete_if_unreferenced(name, storage))
+
+
+def delete_if_unreferenced(name, storage):
+    from .models import Blob
+
+    # Somebody may have stored the same content again in the meantime. The
+    # row goes first and the file before the commit, so an upload pinning the
+    # row either commits its reference before this runs or waits, and then
+    # finds the file gone
+    with transaction.atomic():
+        deleted, _ = Blob.objects.filter(name=name, refcount__lte=0).delete()
+        if deleted:
+            storage.delete(name)
+
+
+def rebuild(models=None, blob_model=None):
+    """Recount every reference from scratch; returns {name: refcount}."""
+    if models is None:
+        from .models import Blob as blob_model, ComplaintImage, Room
+
+        models = {ComplaintImage: ['image', 'thumbnail'], Room: ['qr_code']}
+
+    counts = Counter()
+    for model, fields in models.items():
+        for field in fields:
+            counts.update(
+                model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                .values_list(field, flat=True).iterator(chunk_size=2000)
+            )
+    with transaction.atomic():
+        blob_model.objects.all().delete()
+        blob_model.objects.bulk_create(
+            [blob_model(name=name, refcount=count) for name, count in counts.items()], batch_size=1000,
+        )
+    return counts
@@ -0,0 +1,55 @@
+import hashlib
+import json
+
+from django.core.cache import cache
+
+from . import versions
+from .models import Department, Issue_Category
+from .serializers import ROOM_SNAPSHOT_FIELDS, fill_room_from_qr
+
+# Cached trees are keyed by the model versions, so a stale one is never read;
+# the timeout only bounds how long superseded entries occupy the cache
+TREE_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def build_category_tree():
+    departments = {
+        code: {'department_code': code, 'department_name': name, 'issue_categories': []}
+        for code, name in Department.objects.filter(status='active')
+        .order_by('department_name').values_list('department_code', 'department_name')
+    }
+    categories = Issue_Category.objects.filter(status='active', department__in=list(departments)).order_by(
+        'issue_category_name'
+    ).values_list('department_id', 'issue_category_code', 'issue_category_name')
+    for department, code, name in categories:
+        departments[department]['issue_categories'].append(
+            {'issue_category_code': code, 'issue_category_name': name}
+        )
+    return list(departments.values())
+
+
+def category_tree_json():
+    """
+    The active department -> issue category tree as a JSON string, serialized
+    once per Department/Issue_Category version and then served from the cache.
+    """
+    current, _ = versions.current([Department, Issue_Category])
+    key = 'bootstrap:tree:' + hashlib.sha1(repr(current).encode('utf-8')).hexdigest()
+    tree = cache.get(key)
+    if tree is None:
+        tree = json.dumps(build_category_tree())
+        cache.set(key, tree, TREE_CACHE_TIMEOUT)
+    return tree
+
+
+def bootstrap_json(qr_data):
+    """
+    Everything the complaint form needs for a verified QR payload: the room
+    snapshot and the category tree. Raises ValidationError like complaint
+    submission does for unknown or inactive rooms.
+    """
+    room = {}
+    fill_room_from_qr(room, qr_data)
+    snapshot = {field: room[field] for field in ROOM_SNAPSHOT_FIELDS + ['room_status']}
+    # The tree is spliced in as-is instead of being decoded and re-encoded
+    return f'{{"room": {json.dumps(snapshot)}, "departments": {category_tree_json()}}}'
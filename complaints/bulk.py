@@ -0,0 +1,263 @@
+"""
+Set-based writes to many complaints at once.
+
+These skip Complaint.save() and its signals, so they keep the stats rollups,
+the delta-sync change sequence and the live event log up to date themselves.
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from . import events, rollups
+from .changes import mark_changed
+from .models import Complaint, ComplaintEvent, Room
+from .serializers import (
+    DUPLICATE_FIELDS, DUPLICATE_OPEN_MESSAGE, BulkStatusUpdateSerializer, ComplaintBatchItemSerializer,
+    apply_room_snapshot, check_room,
+)
+from .ticketing import next_ticket_ids
+
+# ticket_ids per UPDATE, well under SQLite's bound parameter limit
+UPDATE_BATCH_SIZE = 500
+# Complaints one status update may touch; a filter matching more is refused
+UPDATE_MAX_ROWS = BulkStatusUpdateSerializer.MAX_TICKETS
+
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+NOT_FOUND = 'not_found'
+
+# Complaints per kiosk batch
+INGEST_MAX_ITEMS = 200
+
+CREATED = 'created'
+DUPLICATE = 'duplicate'
+ERROR = 'error'
+CONFLICT_MESSAGE = 'Conflicted with a concurrent submission; send this complaint again.'
+
+
+class TooManyComplaints(Exception):
+    pass
+
+
+def status_update_values(new_status, remarks, username):
+    values = {'status': new_status, 'remarks': remarks}
+    if new_status == 'resolved':
+        values.update(resolved_at=timezone.now(), resolved_by=username)
+    elif new_status != 'closed':
+        # Reopened or put on hold: no longer resolved. Closing keeps the
+        # resolution it had.
+        values.update(resolved_at=None, resolved_by=None)
+    return values
+
+
+def update_status(queryset, new_status, remarks='', username=None, ticket_ids=None):
+    """
+    Move every complaint in `queryset` to `new_status` in one transaction.
+    Complaints already in that status are left untouched. Returns one result
+    per complaint, plus `not_found` entries for requested `ticket_ids` that
+    did not match. Raises TooManyComplaints, changing nothing, when the
+    queryset matches more than UPDATE_MAX_ROWS complaints.
+    """
+    fields = list(dict.fromkeys(['ticket_id'] + rollups.SNAPSHOT_FIELDS + events.PAYLOAD_FIELDS))
+    with transaction.atomic():
+        rows = list(queryset.order_by('ticket_id').values(*fields)[:UPDATE_MAX_ROWS + 1])
+        if len(rows) > UPDATE_MAX_ROWS:
+            raise TooManyComplaints(UPDATE_MAX_ROWS)
+        changed = [row for row in rows if row['status'] != new_status]
+        values = status_update_values(new_status, remarks, username)
+        changed_ids = [row['ticket_id'] for row in changed]
+        for start in range(0, len(changed_ids), UPDATE_BATCH_SIZE):
+            Complaint.objects.filter(ticket_id__in=changed_ids[start:start + UPDATE_BATCH_SIZE]).update(**values)
+
+        deltas = defaultdict(lambda: [0, 0.0])
+        updated_rows = []
+        for row in changed:
+            updated = dict(row, **values)
+            updated_rows.append(updated)
+            for key, (count, total) in rollups.diff(row, updated).items():
+                deltas[key][0] += count
+                deltas[key][1] += total
+        rollups.apply({key: value for key, value in deltas.items() if value[0] or value[1]})
+        mark_changed(changed_ids)
+        if updated_rows:
+            events.record_events(updated_rows, ComplaintEvent.STATUS_CHANGED)
+
+    results = [
+        {
+            'ticket_id': row['ticket_id'],
+            'result': UPDATED if row['status'] != new_status else UNCHANGED,
+            'previous_status': row['status'],
+        }
+        for row in rows
+    ]
+    found = {row['ticket_id'] for row in rows}
+    results += [
+        {'ticket_id': ticket_id, 'result': NOT_FOUND, 'previous_status': None}
+        for ticket_id in dict.fromkeys(ticket_ids or []) if ticket_id not in found
+    ]
+    return results
+
+
+def summarize(results):
+    summary = {UPDATED: 0, UNCHANGED: 0, NOT_FOUND: 0}
+    for result in results:
+        summary[result['result']] += 1
+    return dict(summary, results=results)
+
+
+def room_key(values):
+    return tuple(str(values[field]) for field in Room.KEY_FIELDS)
+
+
+def load_rooms(refs):
+    """Fetch the rooms for a batch of room references in one query; returns (by_id, by_key)."""
+    ids = {ref['id'] for ref in refs if 'id' in ref}
+    keys = [ref for ref in refs if 'id' not in ref]
+    if not ids and not keys:
+        return {}, {}
+    condition = Q(pk__in=ids)
+    if keys:
+        condition |= Q(
+            Block__in={ref['Block'] for ref in keys},
+            room_no__in={ref['room_no'] for ref in keys},
+            bed_no__in={ref['bed_no'] for ref in keys},
+        )
+    rooms = list(Room.objects.filter(condition).values('id', *Room.KEY_FIELDS, 'status'))
+    return {room['id']: room for room in rooms}, {room_key(room): room for room in rooms}
+
+
+def ingest_complaints(items, submitted_by):
+    """
+    Create a batch of complaints queued offline by a kiosk.
+
+    Every item carries a client_key. An item whose key is already stored is
+    reported as a duplicate of the existing ticket instead of being created
+    again, so a batch can be resent safely after a lost response. Rooms,
+    replays and duplicate open complaints are checked for the whole batch with
+    one query each, and the new complaints go in with a single INSERT. Returns
+    one result per item, in input order.
+    """
+    results = [None] * len(items)
+    candidates = []
+    for index, item in enumerate(items):
+        serializer = ComplaintBatchItemSerializer(data=item)
+        if serializer.is_valid():
+            candidates.append((index, dict(serializer.validated_data)))
+        else:
+            client_key = item.get('client_key') if isinstance(item, dict) else None
+            results[index] = {'index': index, 'client_key': client_key, 'status': ERROR, 'errors': serializer.errors}
+
+    for attempt in range(2):
+        try:
+            _ingest(candidates, results, submitted_by)
+            break
+        except IntegrityError:
+            # A concurrent submission of the same client_key or issue and
+            # room won the race; run again, its complaint is now reported as
+            # a duplicate or an error
+            pass
+    else:
+        # Lost the race twice; nothing was created, so the batch can be resent
+        for index, data in candidates:
+            result = results[index]
+            if result is None or (result['status'] == DUPLICATE and 'ticket_id' not in result):
+                results[index] = {
+                    'index': index, 'client_key': data['client_key'], 'status': ERROR,
+                    'errors': {'non_field_errors': [CONFLICT_MESSAGE]},
+                }
+    return results
+
+
+def _ingest(candidates, results, submitted_by):
+    with transaction.atomic():
+        keys = [data['client_key'] for _, data in candidates]
+        stored = dict(Complaint.objects.filter(client_key__in=keys).values_list('client_key', 'ticket_id'))
+        by_id, by_key = load_rooms([data['room_ref'] for _, data in candidates if data['client_key'] not in stored])
+
+        pending = []
+        for index, data in candidates:
+            client_key = data['client_key']
+            if client_key in stored:
+                results[index] = {
+                    'index': index, 'client_key': client_key, 'status': DUPLICATE, 'ticket_id': stored[client_key],
+                }
+                continue
+            ref = data['room_ref']
+            room = by_id.get(ref['id']) if 'id' in ref else by_key.get(room_key(ref))
+            try:
+                check_room(room)
+            except ValidationError as exc:
+                results[index] = {
+                    'index': index, 'client_key': client_key, 'status': ERROR, 'errors': {'non_field_errors': exc.detail},
+                }
+                continue
+            apply_room_snapshot(data, room)
+            pending.append((index, data))
+
+        # Open complaints for the same issue and room, in the table or earlier
+        # in this batch
+        open_keys = set()
+        if pending:
+            open_keys = set(Complaint.objects.open().filter(
+                room_number__in={data['room_number'] for _, data in pending},
+                bed_number__in={data['bed_number'] for _, data in pending},
+                issue_type__in={data['issue_type'] for _, data in pending},
+            ).values_list(*DUPLICATE_FIELDS))
+
+        complaints, indexes, batch_keys = [], [], {}
+        for index, data in pending:
+            client_key = data['client_key']
+            if client_key in batch_keys:
+                # Sent twice within the batch; resolved to the first item's ticket below
+                results[index] = {'index': index, 'client_key': client_key, 'status': DUPLICATE}
+                continue
+            duplicate_key = tuple(data[field] for field in DUPLICATE_FIELDS)
+            if duplicate_key in open_keys:
+                results[index] = {
+                    'index': index, 'client_key': client_key, 'status': ERROR,
+                    'errors': {'non_field_errors': [DUPLICATE_OPEN_MESSAGE]},
+                }
+                continue
+            fields = {name: value for name, value in data.items() if name != 'room_ref'}
+            complaint = Complaint(submitted_by=submitted_by, **fields)
+            if complaint.status in Complaint.OPEN_STATUSES:
+                open_keys.add(duplicate_key)
+            batch_keys[client_key] = complaint
+            complaints.append(complaint)
+            indexes.append(index)
+
+        for complaint, ticket_id in zip(complaints, next_ticket_ids(len(complaints))):
+            complaint.ticket_id = ticket_id
+        Complaint.objects.bulk_create(complaints)
+
+        # bulk_create sends no post_save signals
+        deltas = defaultdict(lambda: [0, 0.0])
+        for complaint in complaints:
+            for key, (count, total) in rollups.diff(None, rollups.snapshot(complaint)).items():
+                deltas[key][0] += count
+                deltas[key][1] += total
+        rollups.apply(dict(deltas))
+        mark_changed([complaint.ticket_id for complaint in complaints])
+        if complaints:
+            events.record_events(
+                [{field: getattr(complaint, field) for field in events.PAYLOAD_FIELDS} for complaint in complaints],
+                ComplaintEvent.CREATED,
+            )
+
+    for index, complaint in zip(indexes, complaints):
+        results[index] = {
+            'index': index, 'client_key': complaint.client_key, 'status': CREATED, 'ticket_id': complaint.ticket_id,
+        }
+    for result in results:
+        if result['status'] == DUPLICATE and 'ticket_id' not in result:
+            result['ticket_id'] = batch_keys[result['client_key']].ticket_id
+
+
+def summarize_ingest(results):
+    summary = {CREATED: 0, DUPLICATE: 0, ERROR: 0}
+    for result in results:
+        summary[result['status']] += 1
+    return dict(summary, results=results)
@@ -0,0 +1,57 @@
+"""
+Change sequence behind the delta-sync endpoint (/api/complaints/changes/).
+
+Every complaint save or delete replaces the complaint's ComplaintChange row,
+giving it the next id. A client that remembers the highest id it has seen
+asks for rows above it and gets each complaint changed since then exactly
+once, deletions included. Ids are assigned at insert time; on SQLite there is
+a single writer, so they also become visible in increasing order.
+"""
+from django.db import transaction
+
+# Changes returned per request when the client does not ask for fewer
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+def mark_changed(ticket_ids, deleted=False, change_model=None):
+    """
+    Move complaints to the end of the change sequence. Called from signals;
+    writes that skip them (queryset.update(), bulk_create) must call it too.
+    """
+    if change_model is None:
+        from .models import ComplaintChange as change_model
+
+    ticket_ids = list(dict.fromkeys(ticket_ids))
+    if not ticket_ids:
+        return
+    with transaction.atomic():
+        change_model.objects.filter(ticket_id__in=ticket_ids).delete()
+        change_model.objects.bulk_create([
+            change_model(ticket_id=ticket_id, deleted=deleted) for ticket_id in ticket_ids
+        ], batch_size=500)
+
+
+def current_token():
+    from .models import ComplaintChange
+
+    return ComplaintChange.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+
+def parse_token(value):
+    # Raises ValueError for anything but a non-negative integer
+    token = int(value or 0)
+    if token < 0:
+        raise ValueError(value)
+    return token
+
+
+def changes_since(token, limit):
+    """
+    Return (changes, has_more): up to `limit` ComplaintChange rows after
+    `token` in sequence order.
+    """
+    from .models import ComplaintChange
+
+    rows = list(ComplaintChange.objects.filter(pk__gt=token).order_by('pk')[:limit + 1])
+    return rows[:limit], len(rows) > limit
@@ -0,0 +1,134 @@
+import asyncio
+import datetime
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ComplaintEvent, Issue_Category
+
+# Query parameters of the event feed, each matching a ComplaintEvent column
+FILTER_FIELDS = ['ward', 'block', 'department']
+PAYLOAD_FIELDS = [
+    'ticket_id', 'status', 'priority', 'issue_type', 'ward', 'block', 'floor',
+    'room_number', 'bed_number', 'submitted_at', 'resolved_at',
+]
+# Events read from the log per query
+BATCH_SIZE = 100
+# Events deleted per statement when purging, keeps each write lock short
+PURGE_BATCH_SIZE = 1000
+
+
+def departments_for(issue_types):
+    # Complaints store the issue category by name (or code); the feed filters
+    # by the owning department's code
+    categories = Issue_Category.objects.filter(
+        Q(issue_category_name__in=issue_types) | Q(issue_category_code__in=issue_types)
+    ).values_list('issue_category_code', 'issue_category_name', 'department_id')
+    departments = {}
+    for code, name, department in categories:
+        departments.setdefault(code, department)
+        departments[name] = department
+    return departments
+
+
+def record_event(complaint, kind):
+    """Append a complaint event to the log; call inside the write's transaction."""
+    return record_events([{field: getattr(complaint, field) for field in PAYLOAD_FIELDS}], kind)[0]
+
+
+def record_events(rows, kind):
+    """Append one event per row (a dict with the PAYLOAD_FIELDS) in a single INSERT."""
+    departments = departments_for({row['issue_type'] for row in rows})
+    events = []
+    for row in rows:
+        payload = {field: row[field] for field in PAYLOAD_FIELDS}
+        payload['department'] = departments.get(row['issue_type'], '')
+        events.append(ComplaintEvent(
+            ticket_id=row['ticket_id'],
+            kind=kind,
+            ward=row['ward'],
+            block=row['block'],
+            department=payload['department'],
+            payload=payload,
+        ))
+    return ComplaintEvent.objects.bulk_create(events)
+
+
+def parse_filters(query_params):
+    return {field: query_params.getlist(field) for field in FILTER_FIELDS if query_params.getlist(field)}
+
+
+def parse_last_event_id(request):
+    # EventSource sends Last-Event-ID when it reconnects; ?last_event_id= lets
+    # a client resume on its first connection too. Raises ValueError.
+    value = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    if not value:
+        return None
+    last_id = int(value)
+    if last_id < 0:
+        raise ValueError(value)
+    return last_id
+
+
+def latest_event_id():
+    return ComplaintEvent.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+
+def fetch_events(after, filters, limit=BATCH_SIZE):
+    # An id that has already been purged resumes from the oldest event kept
+    events = ComplaintEvent.objects.filter(pk__gt=after)
+    for field, values in filters.items():
+        events = events.filter(**{f'{field}__in': values})
+    return list(events.order_by('pk').values('id', 'kind', 'payload')[:limit])
+
+
+def purge_expired():
+    """Delete events older than SSE_EVENT_RETENTION; returns how many were deleted."""
+    cutoff = timezone.now() - datetime.timedelta(seconds=settings.SSE_EVENT_RETENTION)
+    # The newest event is always kept: SQLite numbers rows from the current
+    # maximum id, so an emptied log would hand out ids again that clients
+    # still hold as their Last-Event-ID
+    expired = ComplaintEvent.objects.filter(created_at__lt=cutoff, pk__lt=latest_event_id())
+    deleted = 0
+    while True:
+        batch = list(expired.order_by('pk').values_list('pk', flat=True)[:PURGE_BATCH_SIZE])
+        if not batch:
+            return deleted
+        deleted += ComplaintEvent.objects.filter(pk__in=batch).delete()[0]
+
+
+def format_event(event):
+    return f"id: {event['id']}\nevent: {event['kind']}\ndata: {json.dumps(event['payload'])}\n\n"
+
+
+def retry_field():
+    return f'retry: {settings.SSE_RETRY_MS}\n\n'
+
+
+async def live_events(last_id, filters):
+    """
+    Yield SSE messages for every event after `last_id` as it is written, until
+    SSE_MAX_DURATION runs out; the client then reconnects with Last-Event-ID.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.SSE_MAX_DURATION
+    idle = 0.0
+    yield retry_field()
+    while loop.time() < deadline:
+        events = await sync_to_async(fetch_events)(last_id, filters)
+        for event in events:
+            yield format_event(event)
+            last_id = event['id']
+        if events:
+            idle = 0.0
+            if len(events) == BATCH_SIZE:
+                continue
+        await asyncio.sleep(settings.SSE_POLL_INTERVAL)
+        idle += settings.SSE_POLL_INTERVAL
+        if idle >= settings.SSE_HEARTBEAT_INTERVAL:
+            # Comment line, keeps proxies from closing an idle connection
+            yield ': keepalive\n\n'
+            idle = 0.0
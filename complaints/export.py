@@ -0,0 +1,91 @@
+"""
+Streaming complaint exports for reporting.
+
+Rows are read with values_list() through a server-side iterator, one chunk at
+a time, and written out as they arrive, so memory use stays flat however many
+complaints match. Used by the export action of ComplaintViewSet and the
+export_complaints management command.
+"""
+import csv
+import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+EXPORT_FIELDS = [
+    'ticket_id', 'submitted_at', 'status', 'priority', 'issue_type', 'description',
+    'bed_number', 'room_number', 'block', 'floor', 'ward', 'speciality', 'room_type',
+    'submitted_by', 'assigned_department', 'resolved_by', 'resolved_at', 'remarks',
+]
+CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson'}
+# Rows fetched per round trip, and rows written per piece of output
+CHUNK_SIZE = 2000
+# The one row order of every export, endpoint and command alike, so the same
+# filters always give the same file; complaint_keyset_idx read backwards
+ORDERING = ['submitted_at', 'ticket_id']
+# Spreadsheet apps evaluate a cell that starts with one of these as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def in_date_range(queryset, start=None, end=None):
+    """Complaints submitted between the dates `start` and `end`, inclusive, in local time."""
+    if start:
+        queryset = queryset.filter(submitted_at__gte=day_start(start))
+    if end:
+        queryset = queryset.filter(submitted_at__lt=day_start(end + datetime.timedelta(days=1)))
+    return queryset
+
+
+def day_start(day):
+    # A bound on submitted_at itself rather than a __date lookup, so the
+    # submitted_at indexes still apply
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def export_rows(queryset, chunk_size):
+    # prefetch_related() does not apply to values_list() rows
+    queryset = queryset.prefetch_related(None).order_by(*ORDERING)
+    return queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+
+
+class Echo:
+    # File-like object for csv.writer that hands each line back instead of storing it
+    def write(self, value):
+        return value
+
+
+def csv_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        # A leading ' makes the cell text, so a submitted "=HYPERLINK(...)" is
+        # shown rather than run
+        return "'" + value
+    return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow([csv_value(value) for value in row])
+
+
+def jsonl_lines(rows):
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(dict(zip(EXPORT_FIELDS, row))) + '\n'
+
+
+def stream(queryset, file_format, chunk_size=None):
+    """Yield the export of `queryset` in `file_format` ('csv' or 'jsonl') as strings of up to `chunk_size` rows."""
+    chunk_size = chunk_size or CHUNK_SIZE
+    lines = csv_lines if file_format == 'csv' else jsonl_lines
+    piece = []
+    for line in lines(export_rows(queryset, chunk_size)):
+        piece.append(line)
+        if len(piece) == chunk_size:
+            yield ''.join(piece)
+            piece = []
+    if piece:
+        yield ''.join(piece)
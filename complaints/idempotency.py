@@ -0,0 +1,78 @@
+"""
+Idempotency-Key support for complaint submission.
+
+A client that may retry a submission sends the same Idempotency-Key header
+with every attempt. The first successful response is stored together with a
+hash of the request; later attempts with that key get the stored response back
+without validating or inserting anything. The key row is written in the same
+transaction as the complaint, so two attempts racing each other cannot both
+create one. Rows expire after IDEMPOTENCY_KEY_TTL seconds, see the
+purge_idempotency_keys command.
+"""
+import datetime
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = IdempotencyKey._meta.get_field('key').max_length
+
+
+def expiry_cutoff():
+    return timezone.now() - datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+
+
+def request_hash(request):
+    """SHA-256 over the method, path, user and submitted data, uploads included."""
+    digest = hashlib.sha256()
+    user = request.user.username if request.user.is_authenticated else ''
+    digest.update(f'{request.method} {request.path} {user}\n'.encode())
+    data = request.data
+    items = sorted(data.lists()) if hasattr(data, 'lists') else sorted((key, [value]) for key, value in data.items())
+    for key, values in items:
+        for value in values:
+            if isinstance(value, UploadedFile):
+                digest.update(f'{key}=file:{value.name}:{value.size}:'.encode())
+                for chunk in value.chunks():
+                    digest.update(chunk)
+                value.seek(0)
+            else:
+                digest.update(f'{key}={json.dumps(value, sort_keys=True, cls=DjangoJSONEncoder)}'.encode())
+            digest.update(b'\n')
+    return digest.hexdigest()
+
+
+def replay(key, fingerprint):
+    """The stored response for `key`, a 422 if it was used for another request, or None."""
+    stored = IdempotencyKey.objects.filter(key=key).first()
+    if stored is None:
+        return None
+    if stored.created_at < expiry_cutoff():
+        stored.delete()
+        return None
+    if stored.request_hash != fingerprint:
+        return Response(
+            {'error': f'This {HEADER} was already used for a different request'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    return Response(stored.response, status=stored.status_code, headers={REPLAYED_HEADER: 'true'})
+
+
+def store(key, fingerprint, status_code, data):
+    # Raises IntegrityError when a concurrent attempt stored the key first;
+    # call inside the transaction that created the complaint
+    IdempotencyKey.objects.create(key=key, request_hash=fingerprint, status_code=status_code, response=data)
+
+
+def purge_expired():
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=expiry_cutoff()).delete()
+    return deleted
@@ -0,0 +1,164 @@
+"""
+Background processing of complaint image uploads.
+
+The request only stores the upload and queues an ImageJob. A worker then
+applies the EXIF orientation, drops the metadata, scales the image down,
+re-encodes it as WebP, writes a WebP thumbnail and records the dimensions.
+The upload as sent is never served: the API leaves `image` out until
+processed_at is set, and an upload the worker gives up on is deleted.
+Workers are a thread pool started after the request's transaction commits
+(IMAGE_PIPELINE_THREADS) and/or the process_image_jobs management command,
+which also picks up jobs left behind by a restart.
+"""
+import datetime
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import ComplaintImage, ImageJob
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+# A running job not finished after this long belongs to a dead worker
+STALE_AFTER = datetime.timedelta(minutes=10)
+
+_executor = None
+
+
+def attach_images(complaint, files):
+    """Store uploaded files for a complaint and queue them for processing."""
+    for image_file in files:
+        image = ComplaintImage.objects.create(complaint=complaint, image=image_file)
+        enqueue(image)
+
+
+def enqueue(image):
+    job = ImageJob.objects.create(image=image)
+    if settings.IMAGE_PIPELINE_THREADS:
+        # After commit, so the worker's connection can see the rows
+        transaction.on_commit(lambda: executor().submit(run_job, job.pk))
+    return job
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(settings.IMAGE_PIPELINE_THREADS, thread_name_prefix='image-pipeline')
+    return _executor
+
+
+def runnable_jobs():
+    stale_before = timezone.now() - STALE_AFTER
+    return ImageJob.objects.filter(
+        Q(status=ImageJob.QUEUED) | Q(status=ImageJob.RUNNING, updated_at__lt=stale_before)
+    )
+
+
+def claim(job_id):
+    # The conditional UPDATE makes sure two workers never run the same job
+    claimed = runnable_jobs().filter(pk=job_id).update(
+        status=ImageJob.RUNNING, attempts=F('attempts') + 1, updated_at=timezone.now()
+    )
+    return ImageJob.objects.select_related('image').get(pk=job_id) if claimed else None
+
+
+def run_job(job_id):
+    # Entry point of pool threads, which hold their own database connection
+    close_old_connections()
+    try:
+        job = claim(job_id)
+        if job is not None:
+            process_job(job)
+    finally:
+        close_old_connections()
+
+
+def process_pending(limit=None):
+    """Process queued (and stale) jobs in order; returns how many were claimed."""
+    processed = 0
+    for job_id in runnable_jobs().order_by('created_at').values_list('pk', flat=True)[:limit]:
+        job = claim(job_id)
+        if job is not None:
+            process_job(job)
+            processed += 1
+    return processed
+
+
+def process_job(job):
+    try:
+        process_image(job.image)
+    except Exception as exc:
+        logger.exception('Processing complaint image %s failed', job.image_id)
+        job.status = ImageJob.QUEUED if job.attempts < MAX_ATTEMPTS else ImageJob.FAILED
+        job.error = f'{type(exc).__name__}: {exc}'
+        with transaction.atomic():
+            job.save(update_fields=['status', 'error', 'updated_at'])
+            if job.status == ImageJob.FAILED:
+                discard_upload(job.image)
+    else:
+        job.delete()
+
+
+def discard_upload(image):
+    # The upload still carries its metadata, GPS position included; once the
+    # pipeline gives up on it, it is not kept. Releasing the name deletes the
+    # file unless another image uses the same content, see complaints.blobs
+    image.image = ''
+    image.save(update_fields=['image'])
+
+
+def encode_webp(image):
+    buffer = BytesIO()
+    # Nothing but the pixels is written: no EXIF, no ICC profile
+    image.save(buffer, 'WEBP', quality=settings.IMAGE_WEBP_QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def prepare(source):
+    image = ImageOps.exif_transpose(source)
+    if image.mode not in ('RGB', 'RGBA'):
+        has_alpha = image.mode in ('LA', 'PA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+    limit = settings.IMAGE_MAX_DIMENSION
+    image.thumbnail((limit, limit), Image.LANCZOS)  # only ever scales down
+    return image
+
+
+def process_image(image):
+    with image.image.open('rb') as handle:
+        source = Image.open(handle)
+        source.load()
+    picture = prepare(source)
+    thumbnail = picture.copy()
+    size = settings.IMAGE_THUMBNAIL_SIZE
+    thumbnail.thumbnail((size, size), Image.LANCZOS)
+
+    webp = encode_webp(picture)
+    thumbnail_webp = encode_webp(thumbnail)
+    # One transaction from storing the files to referencing them, so a file
+    # reused from another image cannot be deleted in between, see blobs.pin
+    with transaction.atomic():
+        # Content-addressed storage renames the files after their hash
+        image.image.save('image.webp', ContentFile(webp), save=False)
+        image.thumbnail.save('thumbnail.webp', ContentFile(thumbnail_webp), save=False)
+        image.width, image.height = picture.size
+        image.size = len(webp)
+        image.processed_at = timezone.now()
+        # The upload is released (and deleted if nothing else uses it) by the
+        # reference counting in complaints.blobs
+        image.save(update_fields=['image', 'thumbnail', 'width', 'height', 'size', 'processed_at'])
+
+
+def enqueue_unprocessed():
+    """Queue every image that was stored before the pipeline existed."""
+    images = ComplaintImage.objects.filter(processed_at__isnull=True, job__isnull=True)
+    jobs = ImageJob.objects.bulk_create([ImageJob(image_id=pk) for pk in images.values_list('pk', flat=True)])
+    return len(jobs)
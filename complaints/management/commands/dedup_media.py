@@ -0,0 +1,118 @@
+import datetime
+import hashlib
+import posixpath
+import re
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from complaints import blobs
+from complaints.changes import mark_changed
+from complaints.models import ComplaintImage, Room
+
+CONTENT_ADDRESSED = re.compile(r'(^|/)([0-9a-f]{2})/\2[0-9a-f]{62}\.\w+$')
+# Files younger than this may belong to an upload whose row is not committed yet
+GRACE_PERIOD = datetime.timedelta(hours=1)
+
+
+def walk(storage, directory):
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for filename in files:
+        yield posixpath.join(directory, filename)
+    for subdirectory in directories:
+        yield from walk(storage, posixpath.join(directory, subdirectory))
+
+
+def content_name(storage, name):
+    digest = hashlib.sha256()
+    with storage.open(name, 'rb') as handle:
+        for chunk in handle.chunks():
+            digest.update(chunk)
+    hexdigest = digest.hexdigest()
+    extension = posixpath.splitext(name)[1].lower()
+    return posixpath.join(posixpath.dirname(name), hexdigest[:2], hexdigest + extension)
+
+
+class Command(BaseCommand):
+    help = (
+        'Move complaint images onto shared content-addressed files, recount media '
+        'references and delete files nothing refers to.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without changing it.')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        storage = ComplaintImage._meta.get_field('image').storage
+        directories = [
+            ('complaint_images', storage),
+            ('qr_codes', Room._meta.get_field('qr_code').storage),
+        ]
+
+        # Complaint images stored under their upload names get the name of
+        # their content; identical files end up on the same name
+        plan = {}
+        for field in ['image', 'thumbnail']:
+            names = ComplaintImage.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+            for name in names.values_list(field, flat=True).distinct():
+                if CONTENT_ADDRESSED.search(name) or name in plan:
+                    continue
+                if not storage.exists(name):
+                    self.stderr.write(f'Missing file: {name}')
+                    continue
+                plan[name] = content_name(storage, name)
+
+        first_source = {}
+        for source, target in plan.items():
+            first_source.setdefault(target, source)
+        created = {target: source for target, source in first_source.items() if not storage.exists(target)}
+        added_bytes = sum(storage.size(source) for source in created.values())
+
+        if not dry_run:
+            with transaction.atomic():
+                for target, source in created.items():
+                    with storage.open(source, 'rb') as handle:
+                        storage.save(source, handle)
+                moved = []
+                for source, target in plan.items():
+                    for field in ['image', 'thumbnail']:
+                        rows = ComplaintImage.objects.filter(**{field: source})
+                        moved += rows.values_list('complaint_id', flat=True)
+                        rows.update(**{field: target})
+                # The image URLs of these complaints changed, see complaints.changes
+                mark_changed(moved)
+                referenced = set(blobs.rebuild())
+        else:
+            referenced = {plan.get(name, name) for name in self.referenced_names()}
+
+        cutoff = timezone.now() - GRACE_PERIOD
+        removed = reclaimed = 0
+        for directory, directory_storage in directories:
+            for name in list(walk(directory_storage, directory)):
+                if name in referenced or name.endswith('.part'):
+                    continue
+                if directory_storage.get_modified_time(name) > cutoff and name not in plan:
+                    continue
+                reclaimed += directory_storage.size(name)
+                removed += 1
+                if not dry_run:
+                    directory_storage.delete(name)
+                self.stdout.write(name)
+
+        verb = 'Would merge' if dry_run else 'Merged'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {len(plan)} image file(s) into {len(set(plan.values()))} content-addressed file(s); '
+            f'{"would delete" if dry_run else "deleted"} {removed} file(s), '
+            f'reclaiming {max(reclaimed - added_bytes, 0)} bytes.'
+        ))
+
+    def referenced_names(self):
+        for model, fields in [(ComplaintImage, ['image', 'thumbnail']), (Room, ['qr_code'])]:
+            for field in fields:
+                yield from model.objects.exclude(**{field: ''}).exclude(
+                    **{f'{field}__isnull': True}
+                ).values_list(field, flat=True)
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.dateparse import parse_date
+
+from complaints import export
+from complaints.models import Complaint
+from complaints.views import ComplaintViewSet
+
+
+def date_argument(value):
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is None:
+        raise CommandError(f'Invalid date {value!r}, expected YYYY-MM-DD')
+    return day
+
+
+class Command(BaseCommand):
+    help = 'Stream every complaint matching the given filters to a CSV or JSONL file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', dest='file_format', choices=list(export.CONTENT_TYPES), default='csv')
+        parser.add_argument('--output', help='File to write; defaults to standard output.')
+        parser.add_argument('--from', dest='start', help='First submission date, YYYY-MM-DD.')
+        parser.add_argument('--to', dest='end', help='Last submission date, YYYY-MM-DD.')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Database to read from, e.g. replica.')
+        # The same exact-match filters as the complaint list
+        for field in ComplaintViewSet.filterset_fields:
+            parser.add_argument(f"--{field.replace('_', '-')}", dest=field)
+
+    def handle(self, *args, **options):
+        start = date_argument(options['start']) if options['start'] else None
+        end = date_argument(options['end']) if options['end'] else None
+        filters = {field: options[field] for field in ComplaintViewSet.filterset_fields if options[field] is not None}
+        queryset = Complaint.objects.using(options['database']).filter(**filters)
+        queryset = export.in_date_range(queryset, start, end)
+
+        pieces = export.stream(queryset, options['file_format'])
+        if not options['output']:
+            for piece in pieces:
+                self.stdout.write(piece, ending='')
+            return
+        with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+            for piece in pieces:
+                output.write(piece)
@@ -0,0 +1,31 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from complaints.provisioning import import_rooms, parse_rooms, summarize
+
+
+class Command(BaseCommand):
+    help = 'Create rooms (and their QR codes) in bulk from a CSV or JSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with a header row of Room field names, or a JSON list of rooms.')
+        parser.add_argument('--format', dest='file_format', choices=['csv', 'json'],
+                            help='File format; defaults to the file extension.')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Processes used to render QR codes (default: one per CPU, 0 renders inline).')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['file_format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        try:
+            with open(path, 'rb') as handle:
+                rows = parse_rooms(handle.read(), file_format)
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        result = summarize(import_rooms(rows, workers=options['workers']))
+        for row in result['rows']:
+            if row['status'] == 'error':
+                self.stderr.write(f"Row {row['row']}: {row['errors']}")
+        self.stdout.write(self.style.SUCCESS(f"Created {result['created']} room(s), {result['failed']} failed."))
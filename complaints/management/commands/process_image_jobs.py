@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from complaints.images import enqueue_unprocessed, process_pending
+
+
+class Command(BaseCommand):
+    help = 'Process queued complaint images: strip EXIF, resize, convert to WebP and make thumbnails.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit instead of polling.')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between polls of an empty queue.')
+        parser.add_argument(
+            '--backfill', action='store_true', help='First queue images uploaded before the pipeline existed.',
+        )
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            self.stdout.write(f'Queued {enqueue_unprocessed()} existing image(s).')
+
+        while True:
+            processed = process_pending(limit=100)
+            if processed:
+                self.stdout.write(f'Processed {processed} image job(s).')
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS('Image queue is empty.'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from complaints.models import Room
+
+
+class Command(BaseCommand):
+    help = 'Delete QR code images that no room refers to any more.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='List the files without deleting them.')
+
+    def handle(self, *args, **options):
+        field = Room._meta.get_field('qr_code')
+        storage = field.storage
+        directory = field.upload_to.rstrip('/')
+        referenced = set(Room.objects.exclude(qr_code='').exclude(qr_code__isnull=True).values_list('qr_code', flat=True))
+
+        _, files = storage.listdir(directory) if storage.exists(directory) else ([], [])
+        removed = 0
+        for filename in files:
+            name = f'{directory}/{filename}'
+            if name in referenced:
+                continue
+            if not options['dry_run']:
+                storage.delete(name)
+            removed += 1
+            self.stdout.write(name)
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {removed} unreferenced QR code image(s).'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from complaints import events
+
+
+class Command(BaseCommand):
+    help = 'Delete live feed events older than SSE_EVENT_RETENTION.'
+
+    def handle(self, *args, **options):
+        deleted = events.purge_expired()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired complaint event(s).'))
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from complaints import qr as qr_payload
+from complaints.models import Room, build_qr_code, render_qr_png
+
+
+class Command(BaseCommand):
+    help = 'Compare QR version, PNG size and render time of the QR payload formats.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help='Renders per format.')
+
+    def handle(self, *args, **options):
+        room = Room(
+            pk=1024, bed_no='B-12', room_no='ICU-204', Block='North', Floor_no=2, ward='Cardiology',
+            speciality='Cardiology', room_type='Private',
+        )
+        iterations = options['iterations']
+        self.stdout.write(f"{'format':<8} {'url chars':>9} {'version':>7} {'modules':>7} {'png bytes':>9} {'ms/render':>9}")
+        formats = (
+            ('legacy', qr_payload.LEGACY), ('compact', qr_payload.COMPACT), ('room id', qr_payload.COMPACT_ROOM_ID),
+        )
+        for label, version in formats:
+            url = qr_payload.build_url(room.get_qr_payload(version))
+            qr = build_qr_code(url)
+            png = render_qr_png(url)
+
+            start = time.perf_counter()
+            for _ in range(iterations):
+                render_qr_png(url)
+            elapsed = (time.perf_counter() - start) / iterations * 1000
+
+            self.stdout.write(
+                f"{label:<8} {len(url):>9} {qr.version:>7} {qr.modules_count:>7} {len(png):>9} {elapsed:>9.2f}"
+            )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from complaints import rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the complaint statistics rollup table from the complaints table.'
+
+    def handle(self, *args, **options):
+        rollups.rebuild()
+        self.stdout.write(self.style.SUCCESS('Complaint statistics rebuilt.'))
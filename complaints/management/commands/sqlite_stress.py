@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from complaints import stress
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare concurrent complaint submission throughput of the plain SQLite '
+        'configuration and SQLITE_PRODUCTION_PROFILE on scratch databases.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent writers.')
+        parser.add_argument('--requests', type=int, default=200, help='Submissions per writer.')
+
+    def handle(self, *args, **options):
+        profiles = (('development', {}), ('production', settings.SQLITE_PRODUCTION_PROFILE))
+        self.stdout.write(f"{'profile':<12} {'committed':>9} {'locked':>7} {'seconds':>8} {'commits/s':>10} {'journal':>8}")
+        rates = []
+        for label, profile in profiles:
+            result = stress.run(profile, threads=options['threads'], requests=options['requests'])
+            rates.append(result['per_second'])
+            self.stdout.write(
+                f"{label:<12} {result['committed']:>9} {result['failed']:>7} "
+                f"{result['seconds']:>8.2f} {result['per_second']:>10.1f} {result['journal_mode']:>8}"
+            )
+        if rates[0]:
+            self.stdout.write(self.style.SUCCESS(f'Production profile: {rates[1] / rates[0]:.1f}x the commits per second.'))
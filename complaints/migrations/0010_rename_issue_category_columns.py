@@ -1,6 +1,36 @@
 from django.db import migrations
 
 
+def rename_columns(apps, schema_editor, renames):
+    # Only databases created before 0004 was regenerated still carry the
+    # camelCase columns; fresh databases already use the snake_case names.
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        columns = {
+            column.name
+            for column in connection.introspection.get_table_description(cursor, 'complaints_issue_category')
+        }
+    for old_name, new_name in renames:
+        if old_name in columns:
+            schema_editor.execute(
+                f'ALTER TABLE complaints_issue_category RENAME COLUMN "{old_name}" TO "{new_name}"'
+            )
+
+
+def forwards(apps, schema_editor):
+    rename_columns(apps, schema_editor, [
+        ('issueCategoryCode', 'issue_category_code'),
+        ('issueCategoryname', 'issue_category_name'),
+    ])
+
+
+def backwards(apps, schema_editor):
+    rename_columns(apps, schema_editor, [
+        ('issue_category_code', 'issueCategoryCode'),
+        ('issue_category_name', 'issueCategoryname'),
+    ])
+
+
 class Migration(migrations.Migration):
 
     dependencies = [
@@ -8,20 +38,5 @@ class Migration(migrations.Migration):
     ]
 
     operations = [
-        migrations.RunSQL(
-            # Forward SQL
-            """
-            ALTER TABLE complaints_issue_category 
-            RENAME COLUMN "issueCategoryCode" TO "issue_category_code";
-            ALTER TABLE complaints_issue_category 
-            RENAME COLUMN "issueCategoryname" TO "issue_category_name";
-            """,
-            # Reverse SQL
-            """
-            ALTER TABLE complaints_issue_category 
-            RENAME COLUMN "issue_category_code" TO "issueCategoryCode";
-            ALTER TABLE complaints_issue_category 
-            RENAME COLUMN "issue_category_name" TO "issueCategoryname";
-            """
-        ),
-    ] 
\ No newline at end of file
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0010_rename_issue_category_columns'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='complaint',
+            name='issue_type',
+            field=models.CharField(max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['-submitted_at'], name='complaint_submitted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['status', '-submitted_at'], name='complaint_status_sub_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['priority', '-submitted_at'], name='complaint_priority_sub_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['issue_type', '-submitted_at'], name='complaint_issue_sub_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['ward', '-submitted_at'], name='complaint_ward_sub_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['block', '-submitted_at'], name='complaint_block_sub_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(condition=models.Q(('status__in', ['open', 'in_progress'])), fields=['room_number', 'bed_number', 'issue_type'], name='complaint_open_room_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0011_complaint_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='complaint',
+            name='complaint_submitted_idx',
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['-submitted_at', '-ticket_id'], name='complaint_keyset_idx'),
+        ),
+    ]
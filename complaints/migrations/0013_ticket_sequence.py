@@ -0,0 +1,25 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0012_complaint_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketSequence',
+            fields=[
+                ('day', models.DateField(primary_key=True, serialize=False)),
+                ('last_value', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='complaint',
+            name='ticket_id',
+            field=models.CharField(editable=False, max_length=20, primary_key=True, serialize=False),
+        ),
+    ]
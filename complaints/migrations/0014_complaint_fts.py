@@ -0,0 +1,87 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:09
+
+import complaints.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+FTS_TABLE = 'complaints_complaint_fts'
+
+CREATE_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        ticket_id UNINDEXED, description, tokenize = 'porter unicode61'
+    )
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON complaints_complaint BEGIN
+        INSERT INTO {FTS_TABLE} (ticket_id, description) VALUES (new.ticket_id, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE OF description ON complaints_complaint
+    WHEN old.description IS NOT new.description BEGIN
+        DELETE FROM {FTS_TABLE} WHERE ticket_id = old.ticket_id;
+        INSERT INTO {FTS_TABLE} (ticket_id, description) VALUES (new.ticket_id, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON complaints_complaint BEGIN
+        DELETE FROM {FTS_TABLE} WHERE ticket_id = old.ticket_id;
+    END
+    """,
+    f"INSERT INTO {FTS_TABLE} (ticket_id, description) SELECT ticket_id, description FROM complaints_complaint",
+]
+
+DROP_SQL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_insert",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_update",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_delete",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def fts5_supported(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def create_fts(apps, schema_editor):
+    # Other databases, and SQLite builds without FTS5, fall back to LIKE
+    # searches in complaints.search
+    if not fts5_supported(schema_editor.connection):
+        return
+    for sql in CREATE_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0013_ticket_sequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComplaintSearchIndex',
+            fields=[
+                ('complaint', models.OneToOneField(db_column='ticket_id', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='complaints.complaint')),
+                ('description', complaints.models.FullTextField()),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'complaints_complaint_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_fts, drop_fts),
+    ]
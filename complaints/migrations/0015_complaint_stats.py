@@ -0,0 +1,34 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:11
+
+from django.db import migrations, models
+
+
+def backfill(apps, schema_editor):
+    from complaints.rollups import rebuild
+
+    rebuild(apps.get_model('complaints', 'Complaint'), apps.get_model('complaints', 'ComplaintStat'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0014_complaint_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComplaintStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('dimension', models.CharField(max_length=20)),
+                ('value', models.CharField(blank=True, max_length=100)),
+                ('count', models.IntegerField(default=0)),
+                ('total', models.FloatField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'dimension', 'value'), name='complaint_stat_key')],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:15
+
+from django.db import migrations, models
+
+
+def backfill(apps, schema_editor):
+    from complaints.changes import mark_changed
+
+    Complaint = apps.get_model('complaints', 'Complaint')
+    ticket_ids = Complaint.objects.order_by('submitted_at', 'ticket_id').values_list('ticket_id', flat=True)
+    mark_changed(ticket_ids, change_model=apps.get_model('complaints', 'ComplaintChange'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0016_complaint_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComplaintChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ticket_id', models.CharField(max_length=20, unique=True)),
+                ('deleted', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:21
+
+import complaints.blobs
+from django.db import migrations, models
+
+
+def count_references(apps, schema_editor):
+    # Existing files keep their names; `manage.py dedup_media` moves duplicates
+    # onto content-addressed names
+    from complaints.blobs import rebuild
+
+    rebuild(
+        {
+            apps.get_model('complaints', 'ComplaintImage'): ['image', 'thumbnail'],
+            apps.get_model('complaints', 'Room'): ['qr_code'],
+        },
+        apps.get_model('complaints', 'Blob'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0019_image_pipeline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('refcount', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='complaintimage',
+            name='image',
+            field=models.ImageField(storage=complaints.blobs.ContentAddressedStorage(), upload_to='complaint_images/'),
+        ),
+        migrations.AlterField(
+            model_name='complaintimage',
+            name='thumbnail',
+            field=models.ImageField(blank=True, null=True, storage=complaints.blobs.ContentAddressedStorage(), upload_to='complaint_images/thumbnails/'),
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
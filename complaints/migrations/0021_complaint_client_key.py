@@ -0,0 +1,22 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0020_media_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='complaint',
+            name='client_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='complaint',
+            constraint=models.UniqueConstraint(condition=models.Q(('client_key__isnull', False)), fields=('client_key',), name='complaint_client_key_uniq'),
+        ),
+    ]
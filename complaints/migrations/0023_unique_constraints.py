@@ -0,0 +1,98 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:30
+
+import django.db.models.functions.text
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+OPEN_STATUSES = ['open', 'in_progress']
+OPEN_ROOM_FIELDS = ['room_number', 'bed_number', 'issue_type', 'block', 'floor', 'ward', 'speciality', 'room_type']
+ROOM_KEY_FIELDS = ['bed_no', 'room_no', 'Block', 'Floor_no', 'ward', 'speciality', 'room_type']
+
+
+def duplicate_groups(queryset, *fields):
+    # order_by() so a default ordering does not split the groups
+    return queryset.order_by().values(*fields).annotate(rows=Count('pk')).filter(rows__gt=1)
+
+
+def check_duplicates(apps, schema_editor):
+    # Rooms, departments and categories cannot be merged automatically; stop
+    # with a list of what to clean up rather than a bare IntegrityError
+    Room = apps.get_model('complaints', 'Room')
+    Department = apps.get_model('complaints', 'Department')
+    Issue_Category = apps.get_model('complaints', 'Issue_Category')
+    problems = [
+        'Room ' + ', '.join(f'{field}={group[field]}' for field in ROOM_KEY_FIELDS) + f" ({group['rows']} rows)"
+        for group in duplicate_groups(Room.objects.all(), *ROOM_KEY_FIELDS)
+    ]
+    problems += [
+        f"Department name {group['name']!r}, ignoring case ({group['rows']} rows)"
+        for group in duplicate_groups(Department.objects.annotate(name=Lower('department_name')), 'name')
+    ]
+    problems += [
+        f"Issue category name {group['name']!r} in department {group['department']}, ignoring case ({group['rows']} rows)"
+        for group in duplicate_groups(
+            Issue_Category.objects.annotate(name=Lower('issue_category_name')), 'name', 'department'
+        )
+    ]
+    if problems:
+        raise RuntimeError(
+            'Remove or rename these duplicates before applying the unique constraints:\n  ' + '\n  '.join(problems)
+        )
+
+
+def close_duplicate_open_complaints(apps, schema_editor):
+    # At most one complaint per issue and bed may stay open or in progress:
+    # keep the newest of each group and close the others
+    from complaints.changes import mark_changed
+    from complaints.rollups import rebuild
+
+    Complaint = apps.get_model('complaints', 'Complaint')
+    open_complaints = Complaint.objects.filter(status__in=OPEN_STATUSES)
+    closed = []
+    for group in duplicate_groups(open_complaints, *OPEN_ROOM_FIELDS):
+        keep, *older = open_complaints.filter(**{field: group[field] for field in OPEN_ROOM_FIELDS}).order_by(
+            '-submitted_at', '-ticket_id'
+        )
+        for complaint in older:
+            note = f'Closed as a duplicate of {keep.ticket_id}'
+            complaint.remarks = f'{complaint.remarks}\n{note}' if complaint.remarks else note
+            complaint.status = 'closed'
+            complaint.save(update_fields=['status', 'remarks'])
+            closed.append(complaint.ticket_id)
+    if closed:
+        # The historical model sends no signals to keep these in step
+        rebuild(Complaint, apps.get_model('complaints', 'ComplaintStat'))
+        mark_changed(closed, change_model=apps.get_model('complaints', 'ComplaintChange'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0022_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicates, migrations.RunPython.noop),
+        migrations.RunPython(close_duplicate_open_complaints, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='complaint',
+            name='complaint_open_room_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='complaint',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['open', 'in_progress'])), fields=('room_number', 'bed_number', 'issue_type', 'block', 'floor', 'ward', 'speciality', 'room_type'), name='complaint_open_room_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='department',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('department_name'), name='department_name_ci_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='issue_category',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('issue_category_name'), models.F('department'), name='issue_category_name_ci_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='room',
+            constraint=models.UniqueConstraint(fields=('bed_no', 'room_no', 'Block', 'Floor_no', 'ward', 'speciality', 'room_type'), name='room_key_uniq'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0023_unique_constraints'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='complaintevent',
+            index=models.Index(fields=['created_at'], name='complaintevent_created_idx'),
+        ),
+    ]
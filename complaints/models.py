@@ -1,18 +1,52 @@
 from django.db import models
+from django.db.models.functions import Lower
+from django.core.serializers.json import DjangoJSONEncoder
 import qrcode
 from io import BytesIO
-from django.core.files import File
+from django.core.files.base import ContentFile
 from PIL import Image
-import uuid
-import base64
-import json
-import hmac
 import hashlib
 from django.conf import settings
+from . import qr as qr_payload
+from .blobs import blob_storage, pin
+from .ticketing import next_ticket_id
+
+
+def build_qr_code(qr_data):
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+        # Any mask scans; picking one skips scoring all eight, most of make()'s time
+        mask_pattern=0,
+    )
+    qr.add_data(qr_data)
+    qr.make(fit=True)
+    return qr
+
+
+def render_qr_png(qr_data):
+    # Module level so it can be shipped to a process pool, see provisioning.py
+    qr = build_qr_code(qr_data)
+
+    # Create QR code image: one pixel per module scaled up by box_size gives the
+    # same black-on-white PNG as qr.make_image() without drawing every module
+    matrix = qr.get_matrix()
+    size = len(matrix)
+    qr_image = Image.new('1', (size, size))
+    qr_image.putdata([0 if module else 1 for row in matrix for module in row])
+    qr_image = qr_image.resize((size * qr.box_size, size * qr.box_size), Image.NEAREST)
+    buffer = BytesIO()
+    qr_image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
 
 # Create your models here.
 class Room(models.Model):
     STATUS_CHOICES = [('active', 'Active'), ('inactive', 'Inactive')]
+    # Fields that identify a bed; no two rooms may share all of them
+    KEY_FIELDS = ['bed_no', 'room_no', 'Block', 'Floor_no', 'ward', 'speciality', 'room_type']
     
     bed_no = models.CharField(max_length=10)
     room_no = models.CharField(max_length=20)
@@ -27,11 +61,22 @@ class Room(models.Model):
     qr_code = models.ImageField(upload_to='qr_codes/', blank=True, null=True)
     dataenc = models.CharField(max_length=500, blank=True, null=True)  # Store base64 encoded data
     
+    class Meta:
+        constraints = [
+            # Same columns as KEY_FIELDS
+            models.UniqueConstraint(
+                fields=['bed_no', 'room_no', 'Block', 'Floor_no', 'ward', 'speciality', 'room_type'],
+                name='room_key_uniq',
+            ),
+        ]
+
     def __str__(self):
         return f"Room {self.room_no} - Bed {self.bed_no} - {self.Block}"
     
     def get_room_data(self):
-        # Create a dictionary of room data
+        # Create a dictionary of room data. Status is left out on purpose: it is
+        # checked against the database on every complaint, and keeping it out of
+        # the payload means toggling it does not require a new QR code
         room_data = {
             'bed_no': self.bed_no,
             'room_no': self.room_no,
@@ -40,54 +85,100 @@ class Room(models.Model):
             'ward': self.ward,
             'speciality': self.speciality,
             'room_type': self.room_type,
-            'status': self.status
         }
         # Convert to JSON string and then to base64
-        json_data = json.dumps(room_data)
-        return base64.b64encode(json_data.encode()).decode()
-    
+        return qr_payload.encode_legacy(room_data)
+
+    def get_qr_payload(self, version=None):
+        # Payload stored in dataenc and carried by the QR code
+        version = version or settings.QR_PAYLOAD_VERSION
+        if version == qr_payload.LEGACY:
+            return self.get_room_data()
+        values = {field: getattr(self, field) for field in qr_payload.ROOM_FIELDS}
+        return qr_payload.encode_compact(values, self.pk if version == qr_payload.COMPACT_ROOM_ID else None)
+
+    def get_qr_url(self):
+        # The URL with encoded data and HMAC signature
+        return qr_payload.build_url(self.dataenc)
+
+    def get_qr_file_name(self, qr_data):
+        # Content-addressed: the name changes exactly when the encoded URL does
+        digest = hashlib.sha256(qr_data.encode('utf-8')).hexdigest()[:16]
+        return self.qr_code.field.generate_filename(self, f'qr_code_{self.room_no}_{self.bed_no}_{digest}.png')
+
+    def refresh_qr_code(self):
+        """
+        Point qr_code at the image for the current payload, rendering it only if
+        no file with that content exists yet. File names carry a hash of the
+        encoded URL, so unchanged rooms reuse their image. The image this
+        replaces is released by the reference counting in complaints.blobs.
+        """
+        self.dataenc = self.get_qr_payload()
+        qr_data = self.get_qr_url()
+        storage = self.qr_code.storage
+        name = self.get_qr_file_name(qr_data)
+
+        if self.qr_code.name == name and storage.exists(name):
+            return
+
+        pin(name)  # before reusing or writing the file, see complaints.blobs
+        if not storage.exists(name):
+            name = storage.save(name, ContentFile(render_qr_png(qr_data)))
+        self.qr_code.name = name
+
     def save(self, *args, **kwargs):
-        # Generate base64 encoded data
-        self.dataenc = self.get_room_data()
-        
-        # Generate HMAC signature
-        signature = hmac.new(
-            settings.QR_CODE_SECRET_KEY.encode('utf-8'),
-            self.dataenc.encode('utf-8'),
-            hashlib.sha256
-        ).hexdigest()
-
-        # Generate QR code
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        # Add the URL with encoded data and signature
-        qr_data = f"http://localhost:5173/ComplaintForm?data={self.dataenc}&signature={signature}"
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-        
-        # Create QR code image
-        qr_image = qr.make_image(fill_color="black", back_color="white")
-        
-        # Save QR code to model
-        buffer = BytesIO()
-        qr_image.save(buffer, format='PNG')
-        filename = f'qr_code_{self.room_no}_{self.bed_no}.png'
-        self.qr_code.save(filename, File(buffer), save=False)
-        
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not set(update_fields) - {'status'}:
+            return super().save(*args, **kwargs)
+
+        if self.pk is None:
+            # The payload carries the primary key, so it can only be built once
+            # the row exists
+            super().save(*args, **kwargs)
+            self.refresh_qr_code()
+            return super().save(update_fields=['dataenc', 'qr_code'])
+
+        self.refresh_qr_code()
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'dataenc', 'qr_code'}
         super().save(*args, **kwargs)
 
 
+# Statuses that count as an active complaint, and the condition of the
+# partial complaint_open_room_uniq index
+OPEN_STATUSES = ['open', 'in_progress']
+
+
+class InlinedIn(models.Lookup):
+    """
+    `lhs IN (...)` with the values written into the SQL as literals rather
+    than bound as parameters. For constant values only.
+    """
+    lookup_name = 'inlined_in'
+    prepare_rhs = False
+
+    def as_sql(self, compiler, connection):
+        lhs, params = self.process_lhs(compiler, connection)
+        values = ', '.join("'%s'" % value.replace("'", "''") for value in self.rhs)
+        return f'{lhs} IN ({values})', params
+
+
+class ComplaintQuerySet(models.QuerySet):
+    def open(self):
+        # Inlined: SQLite only uses the partial complaint_open_room_uniq index
+        # when the query repeats the index condition literally. The column is
+        # still compiled by Django, so table aliases in subqueries work
+        return self.filter(InlinedIn(models.F('status'), OPEN_STATUSES))
+
+
 class Complaint(models.Model):
     
     PRIORITY_CHOICES = [('low', 'Low'), ('medium', 'Medium'), ('high', 'High')]
     STATUS_CHOICES = [('open', 'Open'), ('in_progress', 'In_Progress'), ('resolved', 'Resolved'),('closed','Closed'),('on_hold','On_Hold')]
+    OPEN_STATUSES = OPEN_STATUSES
 
     # Make ticket_id the primary key
-    ticket_id = models.CharField(max_length=12, primary_key=True, editable=False)
+    ticket_id = models.CharField(max_length=20, primary_key=True, editable=False)
     submitted_at = models.DateTimeField(auto_now_add=True)
 
     # Room details (copied, not related)
@@ -112,30 +203,230 @@ class Complaint(models.Model):
     resolved_by = models.CharField(max_length=100, blank=True, null=True)
     resolved_at = models.DateTimeField(blank=True, null=True)
     remarks = models.TextField(blank=True, null=True)
+    # Idempotency key of a kiosk batch submission, see bulk.ingest_complaints
+    client_key = models.CharField(max_length=64, blank=True, null=True, editable=False)
+
+    objects = ComplaintQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Default list ordering, with ticket_id as the keyset pagination tiebreaker
+            models.Index(fields=['-submitted_at', '-ticket_id'], name='complaint_keyset_idx'),
+            # filterset_fields of ComplaintViewSet, each paired with submitted_at
+            # so the filtered page comes out pre-sorted
+            models.Index(fields=['status', '-submitted_at'], name='complaint_status_sub_idx'),
+            models.Index(fields=['priority', '-submitted_at'], name='complaint_priority_sub_idx'),
+            models.Index(fields=['issue_type', '-submitted_at'], name='complaint_issue_sub_idx'),
+            models.Index(fields=['ward', '-submitted_at'], name='complaint_ward_sub_idx'),
+            models.Index(fields=['block', '-submitted_at'], name='complaint_block_sub_idx'),
+        ]
+        constraints = [
+            # Partial so SQLite adds it as a unique index; a plain unique column
+            # would rebuild the table and drop the FTS triggers of migration 0014
+            models.UniqueConstraint(
+                fields=['client_key'], condition=models.Q(client_key__isnull=False), name='complaint_client_key_uniq',
+            ),
+            # At most one open/in-progress complaint per issue and bed. Partial,
+            # so it only indexes active complaints; the leading columns serve
+            # the duplicate lookups of bulk.ingest_complaints too
+            models.UniqueConstraint(
+                fields=['room_number', 'bed_number', 'issue_type', 'block', 'floor', 'ward', 'speciality', 'room_type'],
+                condition=models.Q(status__in=OPEN_STATUSES),
+                name='complaint_open_room_uniq',
+            ),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.ticket_id:
-            # Generate ticket ID
-            self.ticket_id = "SVN" + str(uuid.uuid4().int)[:5].zfill(5)
+            # Generate ticket ID, unless the caller took one already
+            self.ticket_id = next_ticket_id()
+        if self._state.adding:
+            # Ticket IDs are always fresh, so never fall back to an UPDATE
+            kwargs.setdefault('force_insert', True)
         super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Ticket {self.ticket_id} - Room {self.room_number} ({self.ward})"
     
 
+class FullTextField(models.TextField):
+    """Column of an SQLite FTS5 table; supports the `match` lookup."""
+
+
+@FullTextField.register_lookup
+class Match(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+class ComplaintSearchIndex(models.Model):
+    # FTS5 table over complaint descriptions, created and kept in sync by
+    # triggers in migration 0014; only present on SQLite builds with FTS5
+    complaint = models.OneToOneField(
+        'Complaint', primary_key=True, db_column='ticket_id',
+        related_name='search_index', on_delete=models.DO_NOTHING,
+    )
+    description = FullTextField()
+    rank = models.FloatField()  # FTS5 hidden column, bm25 score of the current MATCH
+
+    class Meta:
+        managed = False
+        db_table = 'complaints_complaint_fts'
+
+
+class ComplaintStat(models.Model):
+    # Rollup row maintained by complaints.rollups: complaints per dimension
+    # value and day, plus resolve time totals and histogram bins
+    day = models.DateField()
+    dimension = models.CharField(max_length=20)
+    value = models.CharField(max_length=100, blank=True)
+    count = models.IntegerField(default=0)
+    total = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'dimension', 'value'], name='complaint_stat_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.dimension}={self.value}: {self.count}"
+
+
+class ComplaintEvent(models.Model):
+    # Append-only log of complaint creations and status changes, read by the
+    # live event feed (complaints.events); the id is the SSE event id. Kept
+    # for SSE_EVENT_RETENTION, see events.purge_expired
+    CREATED = 'created'
+    STATUS_CHANGED = 'status_changed'
+    KIND_CHOICES = [(CREATED, 'Created'), (STATUS_CHANGED, 'Status changed')]
+
+    ticket_id = models.CharField(max_length=20)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    ward = models.CharField(max_length=50)
+    block = models.CharField(max_length=50)
+    department = models.CharField(max_length=6, blank=True)  # department_code of the issue category
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Events older than SSE_EVENT_RETENTION are purged by created_at
+            models.Index(fields=['created_at'], name='complaintevent_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.kind} {self.ticket_id}"
+
+
+class ComplaintChange(models.Model):
+    # Latest write to each complaint, see complaints.changes. A complaint's row
+    # is replaced on every save or delete, so the autoincrement id is a change
+    # sequence that only grows and each complaint appears at most once
+    ticket_id = models.CharField(max_length=20, unique=True)
+    deleted = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"#{self.pk} {self.ticket_id}{' (deleted)' if self.deleted else ''}"
+
+
+class ModelVersion(models.Model):
+    # Bumped on every save/delete of a reference-data model, see
+    # complaints.versions; drives ETag/Last-Modified of its endpoints
+    model = models.CharField(max_length=100, primary_key=True)  # app_label.model_name
+    version = models.PositiveBigIntegerField(default=0)
+    modified_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.model} v{self.version}"
+
+
+class TicketSequence(models.Model):
+    # Last ticket sequence number handed out per day, see ticketing.reserve_block
+    day = models.DateField(primary_key=True)
+    last_value = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.day}: {self.last_value}"
+
+
 class ComplaintImage(models.Model):
     complaint = models.ForeignKey('Complaint', related_name='images', on_delete=models.CASCADE)
-    image = models.ImageField(upload_to='complaint_images/')
+    # Stored once per distinct content, see complaints.blobs
+    image = models.ImageField(upload_to='complaint_images/', storage=blob_storage)
+    # Filled in by the image pipeline (complaints.images) once the upload has
+    # been re-encoded as WebP; until then `image` is the file as uploaded,
+    # and it is emptied if processing fails for good
+    thumbnail = models.ImageField(upload_to='complaint_images/thumbnails/', storage=blob_storage, blank=True, null=True)
+    width = models.PositiveIntegerField(blank=True, null=True)
+    height = models.PositiveIntegerField(blank=True, null=True)
+    size = models.PositiveIntegerField(blank=True, null=True)  # bytes
+    processed_at = models.DateTimeField(blank=True, null=True)
 
     def __str__(self):
         return f"Image for Complaint {self.complaint.ticket_id}"
 
+class Blob(models.Model):
+    # Number of model fields pointing at a stored media file, see complaints.blobs
+    name = models.CharField(max_length=255, primary_key=True)
+    refcount = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount})"
+
+
+class ImageJob(models.Model):
+    # Pending work for the image pipeline; the row is deleted once the image
+    # has been processed
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (FAILED, 'Failed')]
+
+    image = models.OneToOneField('ComplaintImage', related_name='job', on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='imagejob_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Image job {self.pk} ({self.status})"
+
+
+class IdempotencyKey(models.Model):
+    # Response to a complaint submission sent with an Idempotency-Key header,
+    # replayed to retries until IDEMPOTENCY_KEY_TTL runs out, see
+    # complaints.idempotency
+    key = models.CharField(max_length=255, primary_key=True)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField()
+    response = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return self.key
+
 class Department(models.Model):
     department_code = models.CharField(max_length=6, primary_key=True)
     department_name = models.CharField(max_length=20, unique=True)
     STATUS_CHOICES = [('active', 'Active'), ('inactive', 'Inactive')]
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='inactive')
 
+    class Meta:
+        constraints = [
+            # department_name is unique as typed; this makes it unique ignoring case
+            models.UniqueConstraint(Lower('department_name'), name='department_name_ci_uniq'),
+        ]
+
     def __str__(self):
         return self.department_name
     
@@ -146,5 +437,10 @@ class Issue_Category(models.Model):
     STATUS_CHOICES = [('active', 'Active'), ('inactive', 'Inactive')]
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='inactive')
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(Lower('issue_category_name'), 'department', name='issue_category_name_ci_uniq'),
+        ]
+
     def __str__(self):
         return f"{self.issue_category_name} ({self.department.department_name})"
\ No newline at end of file
@@ -1,7 +1,206 @@
-from rest_framework.pagination import LimitOffsetPagination
+import base64
+import datetime
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from django.db.models.constants import LOOKUP_SEP
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 class CustomLimitOffsetPagination(LimitOffsetPagination):
     default_limit = 10  # Default number of items per page
     max_limit = 100     # Maximum number of items allowed per page
     # The 'limit' query parameter can be used to specify the page size
-    # The 'offset' query parameter can be used to specify the starting point 
\ No newline at end of file
+    # The 'offset' query parameter can be used to specify the starting point
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Keyset pagination: the cursor carries the ordering values of the row at the
+    page boundary, so every page is a single indexed range scan with no COUNT
+    and no OFFSET, however deep the client pages.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = 10
+    max_page_size = 100
+    ordering = ('-submitted_at',)
+    tiebreaker = 'ticket_id'  # Unique, keeps the key total when the ordering values tie
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, queryset, view)
+        values, self.reverse = self.decode_cursor(request, queryset.model)
+
+        ordering = self.ordering
+        if self.reverse:
+            ordering = [self.invert(field) for field in ordering]
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self.keyset_filter(ordering, values))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if self.reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = values is not None
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_ordering(self, request, queryset, view):
+        # Honour ?ordering= through the view's OrderingFilter, then append the
+        # tiebreaker so the key identifies exactly one row
+        ordering = None
+        for backend in getattr(view, 'filter_backends', []):
+            if issubclass(backend, OrderingFilter):
+                ordering = backend().get_ordering(request, queryset, view)
+                break
+        ordering = [field for field in (ordering or self.ordering) if field.lstrip('-') != self.tiebreaker]
+        descending = ordering[0].startswith('-') if ordering else False
+        return ordering + [('-' if descending else '') + self.tiebreaker]
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith('-') else '-' + field
+
+    def keyset_filter(self, ordering, values):
+        # (a, b, c) after (x, y, z) expands to
+        #   a >= x AND (a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z))
+        # with the comparison flipped for descending fields. The redundant
+        # leading bound is what lets the database range-scan the index.
+        def after(field):
+            name = field.lstrip('-')
+            return name + ('__lt' if field.startswith('-') else '__gt')
+
+        first = ordering[0]
+        condition = Q(**{first.lstrip('-') + ('__lte' if first.startswith('-') else '__gte'): values[0]})
+        expanded = Q()
+        for position, field in enumerate(ordering):
+            equal = {prior.lstrip('-'): values[i] for i, prior in enumerate(ordering[:position])}
+            expanded |= Q(**equal, **{after(field): values[position]})
+        return condition & expanded
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            padding = '=' * (-len(encoded) % 4)
+            cursor = json.loads(base64.urlsafe_b64decode(encoded + padding))
+            values, ordering, reverse = cursor['v'], cursor['o'], bool(cursor.get('r'))
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        # A cursor only continues the ordering it was issued for
+        if ordering != self.ordering or not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        # The values come from the client: convert them the way the model
+        # would, so a tampered cursor is a 404 rather than an error in the query
+        try:
+            values = [self.to_python(model, field, value) for field, value in zip(self.ordering, values)]
+        except (ValidationError, FieldDoesNotExist, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    @staticmethod
+    def to_python(model, field, value):
+        *path, name = field.lstrip('-').split(LOOKUP_SEP)
+        for step in path:
+            model = model._meta.get_field(step).related_model
+        value = model._meta.get_field(name).to_python(value)
+        if value is None:
+            raise ValueError('Cursor values cannot be null')
+        return value
+
+    def encode_cursor(self, obj, reverse):
+        values = []
+        for field in self.ordering:
+            value = getattr(obj, field.lstrip('-'))
+            if isinstance(value, datetime.datetime):
+                value = value.isoformat()
+            values.append(value)
+        cursor = {'v': values, 'o': self.ordering}
+        if reverse:
+            cursor['r'] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(cursor, separators=(',', ':')).encode()).decode().rstrip('=')
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, 'offset')
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+
+class SelectablePagination(BasePagination):
+    """
+    Limit/offset pagination by default; ?pagination=cursor (or any request that
+    already carries a cursor) switches to keyset pagination.
+    """
+    style_query_param = 'pagination'
+    offset_class = CustomLimitOffsetPagination
+    cursor_class = KeysetCursorPagination
+
+    def get_paginator(self, request):
+        if (request.query_params.get(self.style_query_param) == 'cursor'
+                or self.cursor_class.cursor_query_param in request.query_params):
+            return self.cursor_class()
+        return self.offset_class()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.paginator = self.get_paginator(request)
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.offset_class().get_paginated_response_schema(schema)
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+    @property
+    def display_page_controls(self):
+        return getattr(self.paginator, 'display_page_controls', False)
@@ -0,0 +1,173 @@
+import csv
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction
+
+from .models import Room, render_qr_png
+from . import blobs, versions
+from .room_cache import invalidate_rooms
+from .serializers import RoomImportSerializer
+
+# Below this many images the process pool costs more than it saves
+POOL_THRESHOLD = 50
+# Rooms per bulk_import request, rendered inline in a few seconds; larger
+# imports go through the import_rooms command
+API_MAX_ROWS = 1000
+
+
+def parse_rooms(content, fmt):
+    """
+    Parse an uploaded room list. `content` is text or bytes in CSV (header row
+    with the Room field names) or JSON (a list of objects) format.
+    """
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+    if fmt == 'csv':
+        return [dict(row) for row in csv.DictReader(io.StringIO(content))]
+    if fmt == 'json':
+        rows = json.loads(content)
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValueError('Expected a JSON list of room objects.')
+        return rows
+    raise ValueError(f'Unsupported format: {fmt}')
+
+
+def room_key(data):
+    return tuple(str(data[field]) for field in Room.KEY_FIELDS)
+
+
+def render_qr_codes(rooms, workers=0, written=None):
+    """
+    Build the payloads and store the QR images of freshly inserted rooms,
+    without touching the database. The names of the files it stores are
+    appended to `written`. With `workers` other than 0 the images render in a
+    process pool, one process per CPU if `workers` is None.
+    """
+    storage = Room._meta.get_field('qr_code').storage
+    pending = []
+    for room in rooms:
+        # The payload carries the primary key, known only after bulk_create
+        room.dataenc = room.get_qr_payload()
+        qr_data = room.get_qr_url()
+        name = room.get_qr_file_name(qr_data)
+        if storage.exists(name):
+            room.qr_code.name = name
+        else:
+            pending.append((room, name, qr_data))
+
+    payloads = [qr_data for _, _, qr_data in pending]
+    written = [] if written is None else written
+    if workers == 0 or len(pending) < POOL_THRESHOLD:
+        images = map(render_qr_png, payloads)
+        _store_images(storage, pending, images, written)
+    else:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            images = pool.map(render_qr_png, payloads, chunksize=64)
+            _store_images(storage, pending, images, written)
+
+
+def _store_images(storage, pending, images, written):
+    for (room, name, _), png in zip(pending, images):
+        room.qr_code.name = storage.save(name, ContentFile(png))
+        written.append(room.qr_code.name)
+
+
+def import_rooms(rows, workers=0):
+    """
+    Validate, insert and render QR codes for a batch of rooms.
+
+    Uniqueness is checked for the whole batch with a single query instead of
+    one query per row. See _store_rooms for how rooms and QR codes are
+    written. QR codes render inline unless `workers` asks for a process pool,
+    see render_qr_codes; only the import_rooms command does, so request
+    workers never fork. Returns a per-row report in input order.
+    """
+    report = [None] * len(rows)
+    candidates = []
+    for index, row in enumerate(rows):
+        serializer = RoomImportSerializer(data=row)
+        if serializer.is_valid():
+            candidates.append((index, serializer.validated_data))
+        else:
+            report[index] = {'row': index, 'status': 'error', 'errors': serializer.errors}
+
+    for attempt in range(2):
+        rooms, indexes = _new_rooms(candidates, report)
+        try:
+            _store_rooms(rooms, workers)
+            break
+        except IntegrityError:
+            # A concurrent import added some of the same rooms after the
+            # check (room_key_uniq); check again against what it committed
+            candidates = [(index, data) for index, data in candidates if report[index] is None]
+    else:
+        for index in indexes:
+            report[index] = {'row': index, 'status': 'error', 'errors': {
+                'non_field_errors': ['Conflicted with a concurrent import; send this room again.'],
+            }}
+        rooms = []
+
+    for index, room in zip(indexes, rooms):
+        report[index] = {'row': index, 'status': 'created', 'id': room.pk}
+    return report
+
+
+def _new_rooms(candidates, report):
+    # Rooms for the candidates that are neither stored already nor repeated
+    # in the batch; the others are reported as duplicates
+    blocks = {data['Block'] for _, data in candidates}
+    existing = {
+        room_key(dict(zip(Room.KEY_FIELDS, values)))
+        for values in Room.objects.filter(Block__in=blocks).values_list(*Room.KEY_FIELDS)
+    }
+
+    rooms, indexes, seen = [], [], set()
+    for index, data in candidates:
+        key = room_key(data)
+        if key in existing or key in seen:
+            report[index] = {'row': index, 'status': 'error', 'errors': {
+                'non_field_errors': [RoomImportSerializer.duplicate_message],
+            }}
+            continue
+        seen.add(key)
+        rooms.append(Room(**data))
+        indexes.append(index)
+    return rooms, indexes
+
+
+def _store_rooms(rooms, workers):
+    # Rendering takes milliseconds per image, so it runs outside any
+    # transaction instead of holding SQLite's write lock: one short transaction
+    # inserts the rooms, a second records their QR codes. If anything fails
+    # after the insert, the rooms and the images written for them are removed.
+    with transaction.atomic():
+        Room.objects.bulk_create(rooms, batch_size=500)
+    written = []
+    try:
+        render_qr_codes(rooms, workers=workers, written=written)
+        with transaction.atomic():
+            Room.objects.bulk_update(rooms, ['dataenc', 'qr_code'], batch_size=500)
+            # bulk_update sends no post_save signals; the rooms are new, so
+            # there are no previous images to release
+            blobs.acquire(room.qr_code.name for room in rooms)
+            if rooms:
+                versions.bump(Room)
+    except Exception:
+        Room.objects.filter(pk__in=[room.pk for room in rooms]).delete()
+        storage = Room._meta.get_field('qr_code').storage
+        for name in written:
+            storage.delete(name)
+        raise
+    for room in rooms:
+        room._blob_names = blobs.referenced_names(room)
+    # bulk_create sends no post_save signals
+    invalidate_rooms()
+
+
+def summarize(report):
+    created = sum(1 for row in report if row['status'] == 'created')
+    return {'created': created, 'failed': len(report) - created, 'rows': report}
@@ -0,0 +1,113 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+
+from django.conf import settings
+
+# Payload formats carried in the QR code's `data` parameter:
+#   1 - legacy: base64 of a JSON object with full field names, signed with a
+#       64 hex character HMAC-SHA256
+#   2 - compact: base64url (unpadded) of a version byte followed by the room
+#       fields joined with a unit separator, signed with a truncated
+#       HMAC-SHA256 in base64url
+#   3 - compact with room id: as 2, with the room's primary key before the
+#       fields so the server can load the room directly
+LEGACY = 1
+COMPACT = 2
+COMPACT_ROOM_ID = 3
+COMPACT_VERSIONS = (COMPACT, COMPACT_ROOM_ID)
+
+ROOM_FIELDS = ['bed_no', 'room_no', 'Block', 'Floor_no', 'ward', 'speciality', 'room_type']
+SEPARATOR = '\x1f'
+COMPACT_SIGNATURE_BYTES = 12  # 96 bits, 16 base64url characters
+
+
+def b64url_encode(raw):
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def b64url_decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _hmac(data):
+    return hmac.new(
+        settings.QR_CODE_SECRET_KEY.encode('utf-8'),
+        data.encode('utf-8'),
+        hashlib.sha256
+    )
+
+
+def encode_legacy(values):
+    return base64.b64encode(json.dumps(values).encode()).decode()
+
+
+def encode_compact(values, room_id=None):
+    packed = [str(values[field]) for field in ROOM_FIELDS]
+    version = COMPACT
+    if room_id is not None:
+        packed.insert(0, str(room_id))
+        version = COMPACT_ROOM_ID
+    return b64url_encode(bytes([version]) + SEPARATOR.join(packed).encode('utf-8'))
+
+
+def payload_version(data):
+    # Legacy payloads are base64 JSON and always start with '{'; compact ones
+    # start with their version byte
+    try:
+        # altchars lets the same call read standard and urlsafe alphabets
+        first = base64.b64decode(data[:4], altchars=b'-_')[:1]
+    except (binascii.Error, ValueError):
+        return None
+    if first == b'{':
+        return LEGACY
+    if first and first[0] in COMPACT_VERSIONS:
+        return first[0]
+    return None
+
+
+def sign(data):
+    if payload_version(data) in COMPACT_VERSIONS:
+        return b64url_encode(_hmac(data).digest()[:COMPACT_SIGNATURE_BYTES])
+    return _hmac(data).hexdigest()
+
+
+def verify(data, signature):
+    """Check a QR `data`/`signature` pair in either payload format."""
+    if not data or not signature or payload_version(data) is None:
+        return False
+    return hmac.compare_digest(sign(data), signature)
+
+
+def decode(data):
+    """
+    Return the room fields carried by a payload of any format, plus 'id' for
+    payloads that carry the room's primary key, or None if it cannot be
+    decoded. Does not check the signature.
+    """
+    version = payload_version(data)
+    try:
+        if version == LEGACY:
+            values = json.loads(base64.b64decode(data))
+        elif version in COMPACT_VERSIONS:
+            parts = b64url_decode(data)[1:].decode('utf-8').split(SEPARATOR)
+            fields = ['id'] + ROOM_FIELDS if version == COMPACT_ROOM_ID else ROOM_FIELDS
+            if len(parts) != len(fields):
+                return None
+            values = dict(zip(fields, parts))
+        else:
+            return None
+        if not isinstance(values, dict) or any(field not in values for field in ROOM_FIELDS):
+            return None
+        values['Floor_no'] = int(values['Floor_no'])
+        if 'id' in values:
+            values['id'] = int(values['id'])
+    except (binascii.Error, ValueError, TypeError):
+        return None
+    return values
+
+
+def build_url(data):
+    return f"{settings.QR_CODE_BASE_URL}?data={data}&signature={sign(data)}"
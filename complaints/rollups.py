@@ -0,0 +1,200 @@
+"""
+Incremental complaint statistics.
+
+Every complaint contributes to a handful of ComplaintStat rows: one per
+dimension value on the day it was submitted, plus, once it has a resolved_at,
+its time to resolve on the day it was resolved. Writes apply the difference
+between a complaint's old and new contributions in a single upsert, so the
+stats endpoint only ever reads rollup rows.
+"""
+import datetime
+import math
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+DIMENSIONS = ['status', 'priority', 'ward', 'block', 'issue_type']
+SNAPSHOT_FIELDS = DIMENSIONS + ['submitted_at', 'resolved_at']
+
+SUBMITTED = 'submitted'
+RESOLVED = 'resolved'
+RESOLVE_TIME = 'resolve_time'  # histogram of resolve times, value is the bin
+
+# Resolve time histogram bins grow by 2**(1/4), about 19% per bin; the
+# estimate for a bin is its geometric midpoint
+BIN_BASE = 2 ** 0.25
+PERCENTILES = [50, 90, 95]
+BUCKETS = ['day', 'week', 'month']
+
+
+def resolve_bin(seconds):
+    return 0 if seconds < 1 else int(math.log(seconds, BIN_BASE)) + 1
+
+
+def bin_estimate(index):
+    return 0.0 if index == 0 else BIN_BASE ** (index - 0.5)
+
+
+def local_day(value):
+    return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+
+
+def snapshot(complaint):
+    # Reads __dict__ so a deferred field never triggers a query; None means
+    # the instance did not have everything loaded
+    values = {field: complaint.__dict__.get(field) for field in SNAPSHOT_FIELDS}
+    if any(field not in complaint.__dict__ for field in SNAPSHOT_FIELDS) or values['submitted_at'] is None:
+        return None
+    return values
+
+
+def stored_state(model, pk, using):
+    """
+    The snapshot fields of a complaint as stored, locked until the current
+    transaction ends where the database supports it. Diffing against this
+    rather than the instance as it was loaded means two requests saving the
+    same complaint cannot both count one change.
+    """
+    queryset = model._base_manager.using(using).filter(pk=pk)
+    if transaction.get_connection(using).in_atomic_block:
+        queryset = queryset.select_for_update()
+    return queryset.values(*SNAPSHOT_FIELDS).first()
+
+
+def contributions(state):
+    """Map (day, dimension, value) -> [count, total] for one complaint state."""
+    rows = defaultdict(lambda: [0, 0.0])
+    if state is None:
+        return rows
+    day = local_day(state['submitted_at'])
+    rows[(day, SUBMITTED, '')][0] += 1
+    for dimension in DIMENSIONS:
+        rows[(day, dimension, str(state[dimension] or ''))][0] += 1
+
+    resolved_at = state['resolved_at']
+    if resolved_at is not None:
+        seconds = max((resolved_at - state['submitted_at']).total_seconds(), 0.0)
+        resolved_day = local_day(resolved_at)
+        rows[(resolved_day, RESOLVED, '')][0] += 1
+        rows[(resolved_day, RESOLVED, '')][1] += seconds
+        rows[(resolved_day, RESOLVE_TIME, str(resolve_bin(seconds)))][0] += 1
+    return rows
+
+
+def diff(old_state, new_state):
+    deltas = defaultdict(lambda: [0, 0.0])
+    for key, (count, total) in contributions(new_state).items():
+        deltas[key][0] += count
+        deltas[key][1] += total
+    for key, (count, total) in contributions(old_state).items():
+        deltas[key][0] -= count
+        deltas[key][1] -= total
+    return {key: value for key, value in deltas.items() if value[0] or value[1]}
+
+
+def apply(deltas):
+    """Add count/total deltas to ComplaintStat rows in one statement."""
+    if not deltas:
+        return
+    from .models import ComplaintStat
+
+    table = connection.ops.quote_name(ComplaintStat._meta.db_table)
+    rows, params = [], []
+    for (day, dimension, value), (count, total) in deltas.items():
+        rows.append('(%s, %s, %s, %s, %s)')
+        params += [connection.ops.adapt_datefield_value(day), dimension, value, count, total]
+    sql = (
+        f'INSERT INTO {table} (day, dimension, value, count, total) VALUES {", ".join(rows)} '
+        f'ON CONFLICT (day, dimension, value) DO UPDATE SET '
+        f'count = {table}.count + excluded.count, total = {table}.total + excluded.total'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def record(old_state, new_state):
+    apply(diff(old_state, new_state))
+
+
+def rebuild(complaint_model=None, stat_model=None):
+    """Recompute every rollup row from the complaints table."""
+    if complaint_model is None:
+        from .models import Complaint as complaint_model, ComplaintStat as stat_model
+
+    totals = defaultdict(lambda: [0, 0.0])
+    for state in complaint_model.objects.values(*SNAPSHOT_FIELDS).iterator(chunk_size=2000):
+        for key, (count, total) in contributions(state).items():
+            totals[key][0] += count
+            totals[key][1] += total
+    with transaction.atomic():
+        stat_model.objects.all().delete()
+        stat_model.objects.bulk_create(
+            [stat_model(day=day, dimension=dimension, value=value, count=count, total=total)
+             for (day, dimension, value), (count, total) in totals.items() if count],
+            batch_size=1000,
+        )
+
+
+def bucket_start(day, bucket):
+    if bucket == 'week':
+        return day - datetime.timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def compute_stats(start=None, end=None, bucket='day', using=None):
+    """
+    Summarise the rollup rows for complaints submitted (and, for resolution
+    figures, resolved) between `start` and `end` inclusive.
+    """
+    from .models import ComplaintStat
+
+    rows = ComplaintStat.objects.using(using).exclude(count=0, total=0)
+    if start:
+        rows = rows.filter(day__gte=start)
+    if end:
+        rows = rows.filter(day__lte=end)
+
+    counts = {dimension: defaultdict(int) for dimension in DIMENSIONS}
+    trend = defaultdict(lambda: {'submitted': 0, 'resolved': 0})
+    histogram = defaultdict(int)
+    resolved = resolved_seconds = submitted = 0
+
+    for day, dimension, value, count, total in rows.values_list('day', 'dimension', 'value', 'count', 'total'):
+        if dimension in counts:
+            counts[dimension][value] += count
+        elif dimension == SUBMITTED:
+            submitted += count
+            trend[bucket_start(day, bucket)]['submitted'] += count
+        elif dimension == RESOLVED:
+            resolved += count
+            resolved_seconds += total
+            trend[bucket_start(day, bucket)]['resolved'] += count
+        elif dimension == RESOLVE_TIME:
+            histogram[int(value)] += count
+
+    resolution = {'count': resolved, 'mean_seconds': resolved_seconds / resolved if resolved else None}
+    for percentile in PERCENTILES:
+        resolution[f'p{percentile}_seconds'] = histogram_percentile(histogram, resolved, percentile)
+
+    stats = {'total': submitted}
+    for dimension in DIMENSIONS:
+        stats[f'by_{dimension}'] = {value: count for value, count in sorted(counts[dimension].items()) if count}
+    stats['resolution'] = resolution
+    stats['bucket'] = bucket
+    stats['trend'] = [{'bucket': key.isoformat(), **value} for key, value in sorted(trend.items())]
+    return stats
+
+
+def histogram_percentile(histogram, total, percentile):
+    if not total:
+        return None
+    target = math.ceil(total * percentile / 100)
+    seen = 0
+    for index in sorted(histogram):
+        seen += histogram[index]
+        if seen >= target:
+            return round(bin_estimate(index), 1)
+    return None
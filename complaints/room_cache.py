@@ -0,0 +1,47 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Every cached lookup is namespaced by a generation token. Replacing the token
+# (on any Room save/delete, see signals.py) orphans all earlier entries at once,
+# which also covers edits that change a room's key fields. With the default
+# local-memory backend each process keeps its own cache, so deployments running
+# several workers should point CACHES at a shared backend.
+GENERATION_KEY = 'rooms:generation'
+
+
+def _generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, uuid.uuid4().hex, None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def invalidate_rooms():
+    cache.set(GENERATION_KEY, uuid.uuid4().hex, None)
+
+
+def _cache_key(key):
+    raw = '\x1f'.join(str(key[field]) for field in sorted(key))
+    return f'rooms:{_generation()}:{hashlib.sha1(raw.encode("utf-8")).hexdigest()}'
+
+
+def lookup_room(**key):
+    """
+    Return {'id': ..., 'status': ...} for the room matching the given Room
+    field values, or None if there is none. Misses are cached too, so repeated
+    submissions for an unknown room do not hit the database either.
+    """
+    cache_key = _cache_key(key)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached or None
+
+    from .models import Room
+
+    room = Room.objects.filter(**key).values('id', 'status').first()
+    cache.set(cache_key, room or {}, settings.ROOM_CACHE_TIMEOUT)
+    return room
@@ -0,0 +1,52 @@
+"""
+Primary/replica database routing.
+
+Every write goes to the primary ('default'), including saves of objects that
+were loaded from the replica. Reporting reads (complaint lists, stats,
+exports, the admin changelist) pick their database explicitly with
+read_database() and .using(). That is the replica when one is configured
+(DATABASE_REPLICA_NAME) and the client has not written recently.
+ReadYourWritesMiddleware pins a client that made a successful write to the
+primary for REPLICA_PIN_SECONDS, so it sees its own writes while the replica
+catches up.
+"""
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+REPLICA = 'replica'
+PIN_COOKIE = 'read_primary'
+
+
+def replica_configured():
+    return REPLICA in connections.settings
+
+
+def read_database(request):
+    if replica_configured() and PIN_COOKIE not in request.COOKIES:
+        return REPLICA
+    return DEFAULT_DB_ALIAS
+
+
+class PrimaryReplicaRouter:
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both databases hold the same rows
+        if {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, REPLICA}:
+            return True
+        return None
+
+
+class ReadYourWritesMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in SAFE_METHODS and response.status_code < 400 and replica_configured():
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
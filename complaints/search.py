@@ -0,0 +1,64 @@
+import re
+
+from django.db import connections
+from django.db.models import F
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.settings import api_settings
+
+from .models import ComplaintSearchIndex
+
+_fts_tables = {}
+
+
+def fts_available(using):
+    # Whether migration 0014 could create the FTS5 table on this database
+    if using not in _fts_tables:
+        connection = connections[using]
+        with connection.cursor() as cursor:
+            tables = connection.introspection.table_names(cursor)
+        _fts_tables[using] = ComplaintSearchIndex._meta.db_table in tables
+    return _fts_tables[using]
+
+
+def search_terms(text):
+    return re.findall(r'\w+', text)
+
+
+def match_query(terms):
+    # Each term quoted (so user input is never parsed as FTS5 syntax) and
+    # prefix-matched; terms are implicitly ANDed
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+class FullTextSearchFilter(BaseFilterBackend):
+    """
+    ?q= full-text search over complaint descriptions. Uses the FTS5 index and
+    orders by relevance unless ?ordering= is given; without FTS5 it falls back
+    to requiring every term in the description.
+    """
+    search_param = 'q'
+
+    def filter_queryset(self, request, queryset, view):
+        terms = search_terms(request.query_params.get(self.search_param, ''))
+        if not terms:
+            return queryset
+
+        if not fts_available(queryset.db):
+            for term in terms:
+                queryset = queryset.filter(description__icontains=term)
+            return queryset
+
+        queryset = queryset.filter(search_index__description__match=match_query(terms))
+        queryset = queryset.annotate(search_rank=F('search_index__rank'))
+        if not request.query_params.get(api_settings.ORDERING_PARAM):
+            queryset = queryset.order_by('search_rank', '-submitted_at')
+        return queryset
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.search_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Full-text search over the complaint description, ranked by relevance.',
+            'schema': {'type': 'string'},
+        }]
@@ -1,66 +1,170 @@
-import hmac
-import hashlib
-from django.conf import settings
 from rest_framework import serializers
+from . import qr as qr_payload
 from .models import Room, Complaint, ComplaintImage, Department,Issue_Category
-from django.db import models
+from .images import attach_images
+from .room_cache import lookup_room
+from django.db import IntegrityError, models, transaction
+
+# Complaint snapshot field -> Room field
+ROOM_SNAPSHOT_MAP = {
+    'bed_number': 'bed_no',
+    'room_number': 'room_no',
+    'block': 'Block',
+    'floor': 'Floor_no',
+    'ward': 'ward',
+    'speciality': 'speciality',
+    'room_type': 'room_type',
+}
+ROOM_SNAPSHOT_FIELDS = list(ROOM_SNAPSHOT_MAP)
+# Fields that make two open complaints duplicates of each other
+DUPLICATE_FIELDS = ['issue_type'] + ROOM_SNAPSHOT_FIELDS
+DUPLICATE_OPEN_MESSAGE = 'A complaint with the same issue type is already open or in progress for this room.'
+
+
+def validate_room(data):
+    # The room is looked up through the room cache, so repeat submissions for
+    # the same bed skip the seven column query
+    room = lookup_room(
+        bed_no=data['bed_number'],
+        room_no=data['room_number'],
+        Block=data['block'],
+        Floor_no=data['floor'],
+        ward=data['ward'],
+        speciality=data['speciality'],
+        room_type=data['room_type']
+    )
+    if room is None:
+        raise serializers.ValidationError("Room not found with the provided details")
+    if room['status'] != 'active':
+        raise serializers.ValidationError("The specified room is not active")
+    # Update room_status to match room's status
+    data['room_status'] = room['status']
+
+
+def check_room(room):
+    if room is None:
+        raise serializers.ValidationError("Room not found with the provided details")
+    if room['status'] != 'active':
+        raise serializers.ValidationError("The specified room is not active")
+
+
+def apply_room_snapshot(data, room):
+    # `room` is a dict with the Room.KEY_FIELDS and status
+    for complaint_field, room_field in ROOM_SNAPSHOT_MAP.items():
+        data[complaint_field] = str(room[room_field])
+    data['room_status'] = room['status']
+
+
+def fill_room_from_qr(data, qr_data):
+    # Payloads with a room id load the room by primary key; older payloads
+    # carry the room fields themselves and go through the room cache
+    values = qr_payload.decode(qr_data)
+    if values is None:
+        raise serializers.ValidationError({'qr_code': 'QR code data has been tampered with or is invalid.'})
+    if 'id' in values:
+        room = Room.objects.filter(pk=values['id']).values(*Room.KEY_FIELDS, 'status').first()
+    else:
+        room = lookup_room(**{field: values[field] for field in Room.KEY_FIELDS})
+        if room is not None:
+            room = dict(values, status=room['status'])
+    check_room(room)
+    apply_room_snapshot(data, room)
+
+
+class UniqueConstraintMixin:
+    """
+    Uniqueness is enforced by database constraints rather than checked with a
+    query before every write. save() runs in a savepoint; when it fails with
+    an IntegrityError, unique_error() finds out which rule was broken (only
+    then querying for the clash) and the same validation error as before is
+    raised.
+    """
+
+    def save(self, **kwargs):
+        try:
+            with transaction.atomic():
+                return super().save(**kwargs)
+        except IntegrityError:
+            if self.instance is not None:
+                # ModelSerializer.update() has already applied the new values
+                values = {field.name: getattr(self.instance, field.name) for field in self.instance._meta.concrete_fields}
+            else:
+                values = dict(self.validated_data, **kwargs)
+            error = self.unique_error(values)
+            if error is None:
+                raise
+            # Shaped like an error raised from validate()
+            raise serializers.ValidationError(serializers.as_serializer_error(error))
+
+    def unique_error(self, values):
+        return None
+
+    def others(self):
+        queryset = self.Meta.model._default_manager.all()
+        return queryset.exclude(pk=self.instance.pk) if self.instance is not None else queryset
+
+
+class ComplaintUniqueMixin(UniqueConstraintMixin):
+    def unique_error(self, values):
+        # complaint_open_room_uniq
+        if values.get('status', 'open') not in Complaint.OPEN_STATUSES:
+            return None
+        if any(field not in values for field in DUPLICATE_FIELDS):
+            return None
+        if self.others().open().filter(**{field: values[field] for field in DUPLICATE_FIELDS}).exists():
+            return serializers.ValidationError(DUPLICATE_OPEN_MESSAGE)
+        return None
+
 
 class ComplaintImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = ComplaintImage
-        fields = ['image']  # you can also include 'id' if needed
+        fields = ['image', 'thumbnail', 'width', 'height']  # you can also include 'id' if needed
+        # Set by the image pipeline; null until the upload has been processed
+        read_only_fields = ['thumbnail', 'width', 'height']
 
     def to_internal_value(self, data):
         return super().to_internal_value(data)
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Until the pipeline has re-encoded it, `image` is the file as
+        # uploaded, EXIF (and any GPS position) included
+        if instance.processed_at is None:
+            data['image'] = None
+        return data
+
+
+class RoomSerializer(UniqueConstraintMixin, serializers.ModelSerializer):
+    duplicate_message = "A room with these exact details already exists. All fields (except status) must be unique together."
 
-class RoomSerializer(serializers.ModelSerializer):
     class Meta:
         model = Room
         fields = '__all__'
         read_only_fields = ('qr_code', 'dataenc')
 
-    def validate(self, data):
-        # Get all fields except status
-        bed_no = data.get('bed_no')
-        room_no = data.get('room_no')
-        Block = data.get('Block')
-        Floor_no = data.get('Floor_no')
-        ward = data.get('ward')
-        speciality = data.get('speciality')
-        room_type = data.get('room_type')
-
-        # Check if all required fields are present
-        if all([bed_no, room_no, Block, Floor_no, ward, speciality, room_type]):
-            # Check if a room with these exact fields already exists
-            existing_room = Room.objects.filter(
-                bed_no=bed_no,
-                room_no=room_no,
-                Block=Block,
-                Floor_no=Floor_no,
-                ward=ward,
-                speciality=speciality,
-                room_type=room_type
-            )
-
-            # If updating, exclude the current instance from the check
-            if self.instance:
-                existing_room = existing_room.exclude(pk=self.instance.pk)
+    def unique_error(self, values):
+        # room_key_uniq
+        if self.others().filter(**{field: values.get(field) for field in Room.KEY_FIELDS}).exists():
+            return serializers.ValidationError(self.duplicate_message)
+        return None
 
-            if existing_room.exists():
-                raise serializers.ValidationError(
-                    "A room with these exact details already exists. All fields (except status) must be unique together."
-                )
 
-        return data
+class RoomImportSerializer(RoomSerializer):
+    # Only validates; bulk imports check uniqueness for the whole batch at
+    # once, see provisioning.import_rooms
+    pass
 
 
-class DepartmentSerializer(serializers.ModelSerializer):
+class DepartmentSerializer(UniqueConstraintMixin, serializers.ModelSerializer):
     department_code = serializers.CharField(required=False)  # Make it optional for updates
+    duplicate_message = "A department with this name already exists."
 
     class Meta:
         model = Department
         fields = '__all__'
+        # Unique ignoring case, enforced by department_name_ci_uniq; see unique_error
+        extra_kwargs = {'department_name': {'validators': []}}
 
     def get_fields(self):
         fields = super().get_fields()
@@ -69,15 +173,10 @@ class DepartmentSerializer(serializers.ModelSerializer):
             fields['department_code'].read_only = True
         return fields
 
-    def validate_department_name(self, value):
-        # Ensure department name is unique (case-insensitive)
-        if self.instance:  # If updating
-            if Department.objects.exclude(pk=self.instance.pk).filter(department_name__iexact=value).exists():
-                raise serializers.ValidationError("A department with this name already exists.")
-        else:  # If creating
-            if Department.objects.filter(department_name__iexact=value).exists():
-                raise serializers.ValidationError("A department with this name already exists.")
-        return value
+    def unique_error(self, values):
+        if self.others().filter(department_name__iexact=values.get('department_name')).exists():
+            return serializers.ValidationError({'department_name': [self.duplicate_message]})
+        return None
 
     def validate_status(self, value):
         if value not in dict(Department.STATUS_CHOICES):
@@ -85,13 +184,15 @@ class DepartmentSerializer(serializers.ModelSerializer):
         return value
 
 
-class IssueCatSerializer(serializers.ModelSerializer):
+class IssueCatSerializer(UniqueConstraintMixin, serializers.ModelSerializer):
     department_name = serializers.CharField(source='department.department_name', read_only=True)
     issue_category_code = serializers.CharField(required=False)  # Updated field name
 
     class Meta:
         model = Issue_Category
         fields = '__all__'
+        # Enforced by the column and issue_category_name_ci_uniq; see unique_error
+        extra_kwargs = {'issue_category_name': {'validators': []}}
 
     def get_fields(self):
         fields = super().get_fields()
@@ -100,21 +201,17 @@ class IssueCatSerializer(serializers.ModelSerializer):
             fields['issue_category_code'].read_only = True
         return fields
 
-    def validate_issue_category_name(self, value):  # Updated field name
-        # Ensure category name is unique (case-insensitive)
-        if self.instance:  # If updating
-            if Issue_Category.objects.exclude(pk=self.instance.pk).filter(
-                department=self.initial_data.get('department', self.instance.department),
-                issue_category_name__iexact=value  # Updated field name
-            ).exists():
-                raise serializers.ValidationError("An issue category with this name already exists in this department.")
-        else:  # If creating
-            if Issue_Category.objects.filter(
-                department=self.initial_data.get('department'),
-                issue_category_name__iexact=value  # Updated field name
-            ).exists():
-                raise serializers.ValidationError("An issue category with this name already exists in this department.")
-        return value
+    def unique_error(self, values):
+        name = values.get('issue_category_name')
+        others = self.others()
+        if others.filter(department=values.get('department'), issue_category_name__iexact=name).exists():
+            message = "An issue category with this name already exists in this department."
+        elif others.filter(issue_category_name=name).exists():
+            # The name column is unique across departments as well
+            message = "An issue category with this name already exists."
+        else:
+            return None
+        return serializers.ValidationError({'issue_category_name': [message]})
 
     def validate_status(self, value):
         if value not in dict(Issue_Category.STATUS_CHOICES):
@@ -126,7 +223,7 @@ class IssueCatSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Cannot assign issue category to an inactive department")
         return value
 
-class ComplaintCreateSerializer(serializers.ModelSerializer):
+class ComplaintCreateSerializer(ComplaintUniqueMixin, serializers.ModelSerializer):
     images = ComplaintImageSerializer(many=True,write_only=True,required=False)
     
     # Add fields to receive QR data and signature from frontend
@@ -145,89 +242,101 @@ class ComplaintCreateSerializer(serializers.ModelSerializer):
 
         complaint = Complaint.objects.create(**validated_data)
 
-        for image_file in images_data:
-            ComplaintImage.objects.create(complaint=complaint, image=image_file)
+        # Stored as uploaded; resizing and WebP conversion happen in the background
+        attach_images(complaint, images_data)
 
         return complaint
 
     def validate(self, data):
-        # Perform existing room validation first
-        # Only validate room if room-related fields are being updated
-        if any(field in data for field in ['bed_number', 'room_number', 'block', 'floor', 'ward', 'speciality', 'room_type']):
-            try:
-                room = Room.objects.get(
-                    bed_no=data['bed_number'],
-                    room_no=data['room_number'],
-                    Block=data['block'],
-                    Floor_no=data['floor'],
-                    ward=data['ward'],
-                    speciality=data['speciality'],
-                    room_type=data['room_type']
-                )
-                if room.status != 'active':
-                    raise serializers.ValidationError("The specified room is not active")
-                # Update room_status to match room's status
-                data['room_status'] = room.status
-            except Room.DoesNotExist:
-                raise serializers.ValidationError("Room not found with the provided details")
-        
         # HMAC Verification Logic
         qr_data_from_qr = self.initial_data.get('qr_data_from_qr')
         qr_signature_from_qr = self.initial_data.get('qr_signature_from_qr')
 
         if qr_data_from_qr and qr_signature_from_qr:
-            expected_signature = hmac.new(
-                settings.QR_CODE_SECRET_KEY.encode('utf-8'),
-                qr_data_from_qr.encode('utf-8'),
-                hashlib.sha256
-            ).hexdigest()
-
-            if not hmac.compare_digest(expected_signature, qr_signature_from_qr):
+            # Accepts every payload format, see complaints.qr
+            if not qr_payload.verify(qr_data_from_qr, qr_signature_from_qr):
                 raise serializers.ValidationError({'qr_code': 'QR code data has been tampered with or is invalid.'})
+            # The signed payload identifies the room; its snapshot fields come
+            # from the server rather than from the request
+            fill_room_from_qr(data, qr_data_from_qr)
         elif not qr_data_from_qr and not qr_signature_from_qr and self.context['request'].method == 'POST':
             # If it's a POST request and QR data/signature are missing, it means
             # the request is not coming from a QR scan, so we don't apply this validation.
-            pass # Allow requests without QR data/signature
+            missing = [field for field in ROOM_SNAPSHOT_FIELDS if not data.get(field)]
+            if missing:
+                raise serializers.ValidationError({field: ['This field is required.'] for field in missing})
+            validate_room(data)
         else:
              raise serializers.ValidationError({'qr_code': 'QR data or signature missing for QR-based complaint submission.'})
 
-        # New validation: Prevent duplicate open/in-progress complaints for the same issue in the same room
-        issue_type = data.get('issue_type')
-        bed_number = data.get('bed_number')
-        room_number = data.get('room_number')
-        block = data.get('block')
-        floor = data.get('floor')
-        ward = data.get('ward')
-        speciality = data.get('speciality')
-        room_type = data.get('room_type')
-
-        if issue_type and bed_number and room_number and block and floor and ward and speciality and room_type:
-            existing_complaint = Complaint.objects.filter(
-                issue_type=issue_type,
-                bed_number=bed_number,
-                room_number=room_number,
-                block=block,
-                floor=floor,
-                ward=ward,
-                speciality=speciality,
-                room_type=room_type,
-                status__in=['open', 'in_progress'] # Check for open or in-progress status
-            ).exists()
-
-            if existing_complaint:
-                raise serializers.ValidationError(
-                    'A complaint with the same issue type is already open or in progress for this room.'
-                )
-
+        # Duplicate open/in-progress complaints for the same issue in the same
+        # room are rejected by complaint_open_room_uniq, see ComplaintUniqueMixin
         return data
 
     class Meta:
         model = Complaint
         fields = '__all__'
+        # Filled in from the room when the complaint comes with a signed QR payload
+        extra_kwargs = {field: {'required': False} for field in ['room_status'] + ROOM_SNAPSHOT_FIELDS}
 
    
 
-class ComplaintSerializer(serializers.ModelSerializer):
+class ComplaintBatchItemSerializer(ComplaintCreateSerializer):
+    """
+    One complaint of a kiosk batch. Only the checks that need no database run
+    here; rooms, duplicates and replays are checked for the whole batch in
+    bulk.ingest_complaints.
+    """
+    client_key = serializers.CharField(max_length=64)
+
+    def validate(self, data):
+        qr_data = data.pop('qr_data_from_qr', None)
+        qr_signature = data.pop('qr_signature_from_qr', None)
+        data.pop('images', None)
+        if qr_data and qr_signature:
+            values = qr_payload.decode(qr_data) if qr_payload.verify(qr_data, qr_signature) else None
+            if values is None:
+                raise serializers.ValidationError({'qr_code': 'QR code data has been tampered with or is invalid.'})
+            data['room_ref'] = values
+        elif not qr_data and not qr_signature:
+            missing = [field for field in ROOM_SNAPSHOT_FIELDS if not data.get(field)]
+            if missing:
+                raise serializers.ValidationError({field: ['This field is required.'] for field in missing})
+            data['room_ref'] = {
+                room_field: data[complaint_field] for complaint_field, room_field in ROOM_SNAPSHOT_MAP.items()
+            }
+        else:
+            raise serializers.ValidationError({'qr_code': 'QR data or signature missing for QR-based complaint submission.'})
+        return data
+
+
+class BulkStatusUpdateSerializer(serializers.Serializer):
+    # Either explicit ticket ids or a filter on the complaint list's filter fields
+    MAX_TICKETS = 1000
+
+    ticket_ids = serializers.ListField(
+        child=serializers.CharField(), required=False, allow_empty=False, max_length=MAX_TICKETS
+    )
+    filter = serializers.DictField(child=serializers.CharField(), required=False, allow_empty=False)
+    status = serializers.ChoiceField(choices=Complaint.STATUS_CHOICES)
+    remarks = serializers.CharField(required=False, allow_blank=True, default='')
+
+    def validate_filter(self, value):
+        allowed = self.context['filter_fields']
+        unknown = sorted(set(value) - set(allowed))
+        if unknown:
+            raise serializers.ValidationError(
+                f"Unknown filter field(s): {', '.join(unknown)}. Allowed: {', '.join(allowed)}."
+            )
+        return value
+
+    def validate(self, data):
+        if ('ticket_ids' in data) == ('filter' in data):
+            raise serializers.ValidationError('Provide either ticket_ids or filter.')
+        return data
+
+
+class ComplaintSerializer(ComplaintUniqueMixin, serializers.ModelSerializer):
     images = ComplaintImageSerializer(many=True, read_only=True)
     class Meta:
         model = Complaint
@@ -237,26 +346,11 @@ class ComplaintSerializer(serializers.ModelSerializer):
     def validate(self, data):
         # Only validate room if room-related fields are being updated
         if any(field in data for field in ['bed_number', 'room_number', 'block', 'floor', 'ward', 'speciality', 'room_type']):
-            try:
-                room = Room.objects.get(
-                    bed_no=data['bed_number'],
-                    room_no=data['room_number'],
-                    Block=data['block'],
-                    Floor_no=data['floor'],
-                    ward=data['ward'],
-                    speciality=data['speciality'],
-                    room_type=data['room_type']
-                )
-                if room.status != 'active':
-                    raise serializers.ValidationError("The specified room is not active")
-                # Update room_status to match room's status
-                data['room_status'] = room.status
-            except Room.DoesNotExist:
-                raise serializers.ValidationError("Room not found with the provided details")
+            validate_room(data)
         return data
 
 
-class ComplaintUpdateSerializer(serializers.ModelSerializer):
+class ComplaintUpdateSerializer(ComplaintUniqueMixin, serializers.ModelSerializer):
     images = ComplaintImageSerializer(many=True, write_only=True, required=False)
 
     class Meta:
@@ -271,13 +365,20 @@ class ComplaintUpdateSerializer(serializers.ModelSerializer):
         # Update complaint fields
         complaint = super().update(instance, validated_data)
 
-        # Create new images
-        for image_file in images_data:
-            ComplaintImage.objects.create(complaint=complaint, image=image_file)
+        # Create new images, processed in the background like on create
+        attach_images(complaint, images_data)
 
         return complaint
 
 class ComplaintImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = ComplaintImage
-        fields = ['image']
\ No newline at end of file
+        fields = ['image', 'thumbnail', 'width', 'height']
+        read_only_fields = ['thumbnail', 'width', 'height']
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Not served before processing, see the serializer above
+        if instance.processed_at is None:
+            data['image'] = None
+        return data
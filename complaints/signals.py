@@ -0,0 +1,101 @@
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from . import blobs, rollups, versions
+from .changes import mark_changed
+from .models import Complaint, ComplaintImage, Department, Issue_Category, Room
+from .room_cache import invalidate_rooms
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def invalidate_room_cache(sender, **kwargs):
+    invalidate_rooms()
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+@receiver(post_save, sender=Department)
+@receiver(post_delete, sender=Department)
+@receiver(post_save, sender=Issue_Category)
+@receiver(post_delete, sender=Issue_Category)
+def bump_model_version(sender, **kwargs):
+    versions.bump(sender)
+
+
+def saves_rollup_fields(update_fields):
+    return update_fields is None or not set(update_fields).isdisjoint(rollups.SNAPSHOT_FIELDS)
+
+
+@receiver(pre_save, sender=Complaint)
+def read_rollup_state(sender, instance, using, update_fields=None, **kwargs):
+    # New complaints contribute nothing so far
+    instance._rollup_state = None
+    if not instance._state.adding and saves_rollup_fields(update_fields):
+        instance._rollup_state = rollups.stored_state(sender, instance.pk, using)
+
+
+@receiver(post_save, sender=Complaint)
+def update_rollups(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        rollups.record(None, rollups.snapshot(instance))
+        return
+    old_state = instance._rollup_state
+    if old_state is None:
+        return
+    # Deferred fields and those left out of update_fields keep their stored value
+    new_state = {
+        field: instance.__dict__[field]
+        if field in instance.__dict__ and (update_fields is None or field in update_fields) else value
+        for field, value in old_state.items()
+    }
+    rollups.record(old_state, new_state)
+
+
+@receiver(post_delete, sender=Complaint)
+def remove_from_rollups(sender, instance, **kwargs):
+    rollups.record(rollups.snapshot(instance), None)
+
+
+@receiver(post_save, sender=Complaint)
+def sequence_saved_complaint(sender, instance, **kwargs):
+    mark_changed([instance.ticket_id])
+
+
+@receiver(post_delete, sender=Complaint)
+def sequence_deleted_complaint(sender, instance, **kwargs):
+    mark_changed([instance.ticket_id], deleted=True)
+
+
+@receiver(post_save, sender=ComplaintImage)
+@receiver(post_delete, sender=ComplaintImage)
+def sequence_complaint_images(sender, instance, **kwargs):
+    # Images are part of the serialized complaint; deleting the complaint
+    # cascades here first, and its own delete signal then marks it deleted
+    mark_changed([instance.complaint_id])
+
+
+@receiver(post_init, sender=ComplaintImage)
+@receiver(post_init, sender=Room)
+def remember_file_names(sender, instance, **kwargs):
+    instance._blob_names = blobs.referenced_names(instance)
+
+
+@receiver(post_save, sender=ComplaintImage)
+@receiver(post_save, sender=Room)
+def count_file_references(sender, instance, created, **kwargs):
+    old = {} if created else instance._blob_names
+    new = blobs.referenced_names(instance)
+    for field, name in new.items():
+        # A field deferred when the instance was loaded has no known old name
+        if created or (field in old and old[field] != name):
+            blobs.acquire([name])
+            blobs.release([old.get(field)], getattr(instance, field).storage)
+    instance._blob_names = new
+
+
+@receiver(post_delete, sender=ComplaintImage)
+@receiver(post_delete, sender=Room)
+def release_file_references(sender, instance, **kwargs):
+    for field, name in blobs.referenced_names(instance).items():
+        blobs.release([name], getattr(instance, field).storage)
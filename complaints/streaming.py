@@ -0,0 +1,42 @@
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+# Rows fetched (and serialized) per round trip when streaming a queryset
+STREAM_CHUNK_SIZE = 500
+
+
+def is_stream_requested(request):
+    return request.query_params.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+def iter_chunks(queryset, chunk_size):
+    # .iterator() keeps only one chunk of model instances alive at a time and
+    # still runs prefetch_related() lookups once per chunk
+    chunk = []
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(obj)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def stream_json_array(queryset, serializer_class, context=None, chunk_size=None):
+    """
+    Stream a queryset as a JSON array, serializing it chunk by chunk so memory
+    use does not grow with the number of rows.
+    """
+    chunk_size = chunk_size or STREAM_CHUNK_SIZE
+    encoder = JSONEncoder()
+
+    def generate():
+        yield '['
+        first = True
+        for chunk in iter_chunks(queryset, chunk_size):
+            for item in serializer_class(chunk, many=True, context=context).data:
+                yield ('' if first else ',') + encoder.encode(item)
+                first = False
+        yield ']'
+
+    return StreamingHttpResponse(generate(), content_type='application/json')
@@ -0,0 +1,102 @@
+"""
+Concurrent writer stress test for SQLite database profiles.
+
+Worker threads play the part of request threads submitting complaints. Each
+request is one transaction that reads before it writes, like the batch
+ingest: look the client key up, bump the ticket sequence, insert the
+complaint. At the end of every request the connection is handled the way
+Django's request_finished handler does it, so CONN_MAX_AGE takes effect.
+Used by `manage.py sqlite_stress`.
+"""
+import os
+import tempfile
+import threading
+import time
+
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+
+SCHEMA = [
+    'CREATE TABLE stress_sequence (id integer PRIMARY KEY, last_value integer NOT NULL)',
+    'INSERT INTO stress_sequence (id, last_value) VALUES (1, 0)',
+    'CREATE TABLE stress_complaint ('
+    'ticket_id integer PRIMARY KEY, client_key varchar(64) UNIQUE, description text NOT NULL)',
+]
+DESCRIPTION = 'Light not working, the switch sparks when pressed. ' * 8
+
+
+def submit(alias, client_key):
+    with transaction.atomic(using=alias):
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT ticket_id FROM stress_complaint WHERE client_key = %s', [client_key])
+            cursor.execute('UPDATE stress_sequence SET last_value = last_value + 1 WHERE id = 1')
+            cursor.execute('SELECT last_value FROM stress_sequence WHERE id = 1')
+            ticket_id = cursor.fetchone()[0]
+            cursor.execute(
+                'INSERT INTO stress_complaint (ticket_id, client_key, description) VALUES (%s, %s, %s)',
+                [ticket_id, client_key, DESCRIPTION],
+            )
+
+
+def worker(alias, number, requests, barrier, outcome):
+    committed = failed = 0
+    barrier.wait()
+    try:
+        for request in range(requests):
+            try:
+                submit(alias, f'{number}-{request}')
+                committed += 1
+            except OperationalError:  # database is locked
+                failed += 1
+            finally:
+                connections[alias].close_if_unusable_or_obsolete()
+    finally:
+        connections[alias].close()
+    outcome.append((committed, failed))
+
+
+def run(profile, threads=8, requests=100):
+    """
+    Run `threads` writers with `requests` submissions each against a fresh
+    database file configured with `profile` (a partial DATABASES entry).
+    Returns committed and failed counts, elapsed seconds, commits per second
+    and the journal mode in effect.
+    """
+    alias = 'stress'
+    with tempfile.TemporaryDirectory() as directory:
+        config = dict(profile, ENGINE='django.db.backends.sqlite3', NAME=os.path.join(directory, 'stress.sqlite3'))
+        # configure_settings fills in the defaults of every other DATABASES key
+        connections.settings[alias] = connections.configure_settings({DEFAULT_DB_ALIAS: {}, alias: config})[alias]
+        try:
+            with connections[alias].cursor() as cursor:
+                for statement in SCHEMA:
+                    cursor.execute(statement)
+                cursor.execute('PRAGMA journal_mode')
+                journal_mode = cursor.fetchone()[0]
+            connections[alias].close()
+
+            outcome = []
+            barrier = threading.Barrier(threads + 1)
+            pool = [
+                threading.Thread(target=worker, args=(alias, number, requests, barrier, outcome))
+                for number in range(threads)
+            ]
+            for thread in pool:
+                thread.start()
+            barrier.wait()
+            start = time.perf_counter()
+            for thread in pool:
+                thread.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+
+    committed = sum(result[0] for result in outcome)
+    return {
+        'committed': committed,
+        'failed': sum(result[1] for result in outcome),
+        'seconds': elapsed,
+        'per_second': committed / elapsed if elapsed else 0.0,
+        'journal_mode': journal_mode,
+    }
@@ -1,3 +1,1632 @@
-from django.test import TestCase
+import base64
+import csv
+import datetime
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+from contextlib import closing
+from io import BytesIO, StringIO
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection, connections, router, transaction
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from . import blobs, bulk, export, idempotency, provisioning, rollups, routers, stress, ticketing, versions
+from .models import Blob, Complaint, ComplaintChange, ComplaintEvent, ComplaintImage, ComplaintStat, IdempotencyKey, ImageJob, Department, Issue_Category, Room, build_qr_code
+from . import qr as qr_payload
+from .events import purge_expired as purge_expired_events
+from .images import MAX_ATTEMPTS, process_pending
+from .pagination import KeysetCursorPagination
+from .provisioning import import_rooms, summarize
+from .search import match_query
+from .serializers import DUPLICATE_OPEN_MESSAGE, RoomImportSerializer, RoomSerializer
+from .ticketing import allocator
+
+
+def make_complaint(**overrides):
+    data = {
+        'bed_number': '01',
+        'block': 'A',
+        'room_number': '101',
+        'floor': '1',
+        'ward': 'General',
+        'speciality': 'General',
+        'room_type': 'Standard',
+        'room_status': 'active',
+        'issue_type': 'Electrical',
+        'description': 'Light not working',
+        'priority': 'medium',
+    }
+    data.update(overrides)
+    return Complaint.objects.create(**data)
+
+
+def make_room(**overrides):
+    data = {
+        'bed_no': '01',
+        'room_no': '101',
+        'Block': 'A',
+        'Floor_no': 1,
+        'ward': 'General',
+        'speciality': 'General',
+        'room_type': 'Standard',
+        'status': 'active',
+    }
+    data.update(overrides)
+    return Room.objects.create(**data)
+
+
+class TempMediaMixin:
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+
+class ComplaintIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(20):
+            make_complaint(
+                room_number=str(100 + i),
+                ward=f'Ward {i % 3}',
+                status=['open', 'resolved', 'in_progress', 'closed'][i % 4],
+            )
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, plan)
+        self.assertNotIn('SCAN complaints_complaint\n', plan + '\n', plan)
+
+    def test_default_list_ordering_uses_index(self):
+        self.assertUsesIndex(Complaint.objects.order_by('-submitted_at')[:10], 'complaint_keyset_idx')
+
+    def test_filterset_fields_use_index(self):
+        cases = {
+            'status': ('open', 'complaint_status_sub_idx'),
+            'priority': ('high', 'complaint_priority_sub_idx'),
+            'issue_type': ('Electrical', 'complaint_issue_sub_idx'),
+            'ward': ('Ward 1', 'complaint_ward_sub_idx'),
+            'block': ('A', 'complaint_block_sub_idx'),
+        }
+        for field, (value, index_name) in cases.items():
+            with self.subTest(field=field):
+                queryset = Complaint.objects.filter(**{field: value}).order_by('-submitted_at')[:10]
+                self.assertUsesIndex(queryset, index_name)
+
+    def test_duplicate_open_complaint_check_uses_partial_index(self):
+        queryset = Complaint.objects.open().filter(
+            issue_type='Electrical',
+            bed_number='01',
+            room_number='100',
+            block='A',
+            floor='1',
+            ward='Ward 0',
+            speciality='General',
+            room_type='Standard',
+        )
+        self.assertUsesIndex(queryset, 'complaint_open_room_uniq')
+        self.assertEqual(queryset.count(), 1)
+        # Also under a table alias, as a subquery
+        outer = Complaint.objects.filter(ticket_id__in=queryset.values('ticket_id'))
+        self.assertIn('U0."status" IN (\'open\', \'in_progress\')', str(outer.query))
+        self.assertEqual(outer.count(), 1)
+
+
+class QueryCountTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(15):
+            complaint = make_complaint(room_number=str(200 + i), priority='high')
+            for n in range(3):
+                ComplaintImage.objects.create(complaint=complaint, image=f'complaint_images/{i}_{n}.png')
+        for d in range(3):
+            department = Department.objects.create(
+                department_code=f'D{d}', department_name=f'Department {d}', status='active'
+            )
+            for c in range(4):
+                Issue_Category.objects.create(
+                    issue_category_code=f'C{d}{c}', department=department,
+                    issue_category_name=f'Category {d}{c}', status='active',
+                )
+
+    def test_complaint_list(self):
+        # COUNT, page of complaints, prefetch of their images
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/complaints/', {'limit': 15})
+        self.assertEqual(len(response.data['results']), 15)
+        self.assertEqual(len(response.data['results'][0]['images']), 3)
+
+    def test_complaint_retrieve(self):
+        ticket_id = Complaint.objects.first().ticket_id
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/complaints/{ticket_id}/')
+        self.assertEqual(len(response.data['images']), 3)
+
+    def test_by_status_and_by_priority(self):
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/complaints/by_status/', {'status': 'open', 'limit': 15})
+        self.assertEqual(len(response.data['results']), 15)
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/complaints/by_priority/', {'priority': 'high', 'limit': 15})
+        self.assertEqual(len(response.data['results']), 15)
+
+    def test_issue_category_list(self):
+        # Version lookup for the ETag, COUNT and a single page joined to its departments
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/issue-category/')
+        self.assertEqual(
+            {row['department_name'] for row in response.data['results']},
+            {'Department 0', 'Department 1', 'Department 2'},
+        )
+
+
+class ByStatusPaginationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(12):
+            complaint = make_complaint(room_number=str(300 + i), priority='low')
+            ComplaintImage.objects.create(complaint=complaint, image=f'complaint_images/{i}.png')
+
+    def test_by_status_is_paginated(self):
+        response = self.client.get('/api/complaints/by_status/', {'status': 'open', 'limit': 5, 'offset': 10})
+        self.assertEqual(response.data['count'], 12)
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_by_priority_uses_default_limit(self):
+        response = self.client.get('/api/complaints/by_priority/', {'priority': 'low'})
+        self.assertEqual(response.data['count'], 12)
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_stream_returns_every_row_in_chunks(self):
+        with mock.patch('complaints.streaming.STREAM_CHUNK_SIZE', 5):
+            response = self.client.get('/api/complaints/by_status/', {'status': 'open', 'stream': 'true'})
+            self.assertTrue(response.streaming)
+            # One query for the rows plus one images prefetch per chunk of 5
+            with self.assertNumQueries(4):
+                rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(rows), 12)
+        self.assertEqual(rows[0]['ticket_id'], Complaint.objects.order_by('-submitted_at')[0].ticket_id)
+        self.assertEqual(len(rows[0]['images']), 1)
+
+    def test_stream_of_empty_result(self):
+        response = self.client.get('/api/complaints/by_priority/', {'priority': 'high', 'stream': '1'})
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), [])
+
+
+class KeysetCursorPaginationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(25):
+            make_complaint(room_number=str(400 + i), priority=['low', 'medium', 'high'][i % 3])
+
+    def walk(self, params):
+        tickets, url, pages = [], '/api/complaints/', 0
+        response = self.client.get(url, params)
+        while True:
+            pages += 1
+            self.assertNotIn('count', response.data)
+            tickets.extend(row['ticket_id'] for row in response.data['results'])
+            if not response.data['next']:
+                return tickets, pages
+            response = self.client.get(response.data['next'])
+
+    def test_walks_every_row_once_in_default_order(self):
+        tickets, pages = self.walk({'pagination': 'cursor', 'limit': 10})
+        expected = list(Complaint.objects.order_by('-submitted_at', '-ticket_id').values_list('ticket_id', flat=True))
+        self.assertEqual(tickets, expected)
+        self.assertEqual(pages, 3)
+
+    def test_honours_ordering_fields(self):
+        tickets, _ = self.walk({'pagination': 'cursor', 'limit': 4, 'ordering': 'priority,-submitted_at'})
+        expected = list(
+            Complaint.objects.order_by('priority', '-submitted_at', 'ticket_id').values_list('ticket_id', flat=True)
+        )
+        self.assertEqual(tickets, expected)
+
+    def test_previous_link_returns_the_earlier_page(self):
+        first = self.client.get('/api/complaints/', {'pagination': 'cursor', 'limit': 7})
+        self.assertIsNone(first.data['previous'])
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(back.data['results'], first.data['results'])
+        self.assertIsNone(back.data['previous'])
+        self.assertEqual(back.data['next'], first.data['next'])
+
+    def test_limit_offset_remains_the_default(self):
+        response = self.client.get('/api/complaints/')
+        self.assertEqual(response.data['count'], 25)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/complaints/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def cursor(self, payload):
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+    def test_tampered_cursor_values(self):
+        ordering = ['-submitted_at', '-ticket_id']
+        for values in (['garbage', 'x'], [None, 1], [{}, []], ['2026-01-01T00:00:00+00:00', None]):
+            with self.subTest(values=values):
+                response = self.client.get('/api/complaints/', {'cursor': self.cursor({'v': values, 'o': ordering})})
+                self.assertEqual(response.status_code, 404)
+
+    def test_cursor_for_another_ordering_is_rejected(self):
+        first = self.client.get('/api/complaints/', {'pagination': 'cursor', 'limit': 4})
+        cursor = parse_qs(urlsplit(first.data['next']).query)['cursor'][0]
+        response = self.client.get('/api/complaints/', {'cursor': cursor, 'ordering': 'priority'})
+        self.assertEqual(response.status_code, 404)
+        # Cursors without the ordering they were issued for are rejected too
+        response = self.client.get('/api/complaints/', {'cursor': self.cursor({'v': ['2026-01-01T00:00:00+00:00', 'x']})})
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_query_uses_keyset_index(self):
+        boundary = Complaint.objects.order_by('-submitted_at')[10]
+        ordering = ['-submitted_at', '-ticket_id']
+        queryset = Complaint.objects.order_by(*ordering).filter(
+            KeysetCursorPagination().keyset_filter(ordering, [boundary.submitted_at, boundary.ticket_id])
+        )[:11]
+        plan = queryset.explain()
+        self.assertIn('complaint_keyset_idx', plan, plan)
+        self.assertNotIn('TEMP B-TREE', plan, plan)
+
+
+class TicketIdTests(TempMediaMixin, TransactionTestCase):
+    def setUp(self):
+        allocator.reset()
+
+    def test_ids_are_sequential_per_day(self):
+        first, second = make_complaint(), make_complaint(room_number='102')
+        self.assertRegex(first.ticket_id, r'^SVN\d{6}00001$')
+        self.assertEqual(int(second.ticket_id[-5:]), 2)
+
+    def test_existing_ticket_id_is_not_overwritten(self):
+        complaint = make_complaint()
+        complaint.remarks = 'Checked'
+        complaint.save()
+        self.assertEqual(Complaint.objects.get().ticket_id, complaint.ticket_id)
+
+    def test_cached_block_is_used_inside_transactions(self):
+        first = allocator.next_id()
+        with transaction.atomic():
+            with self.assertNumQueries(0):
+                second = allocator.next_id()
+        # A rolled back transaction leaves a gap, never a number handed out twice
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                make_complaint()
+                raise RuntimeError
+        third = make_complaint().ticket_id
+        self.assertEqual([int(ticket_id[-5:]) for ticket_id in (first, second, third)], [1, 2, 4])
+
+    def test_admin_add_takes_ids_from_one_block(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.login(username='admin', password='pw')
+        form = {
+            'images-TOTAL_FORMS': '0', 'images-INITIAL_FORMS': '0',
+            'status': 'open', 'submitted_by': 'Staff',
+        }
+        with mock.patch('complaints.ticketing.reserve_block', wraps=ticketing.reserve_block) as reserve:
+            for number in range(3):
+                data = dict(complaint_form(make_room(room_no=str(300 + number))), **form)
+                response = self.client.post('/admin/complaints/complaint/add/', data)
+                self.assertEqual(response.status_code, 302)
+        reserve.assert_called_once()
+        self.assertEqual(Complaint.objects.count(), 3)
+
+    def test_api_creates_take_ids_from_one_block(self):
+        with mock.patch('complaints.ticketing.reserve_block', wraps=ticketing.reserve_block) as reserve:
+            for number in range(3):
+                room = make_room(room_no=str(400 + number))
+                response = self.client.post('/api/complaints/', complaint_form(room))
+                self.assertEqual(response.status_code, 201, response.content)
+            response = self.client.post(
+                '/api/complaints/', complaint_form(make_room(room_no='404')), headers={'Idempotency-Key': 'k-404'},
+            )
+            self.assertEqual(response.status_code, 201, response.content)
+        reserve.assert_called_once()
+        ticket_ids = sorted(Complaint.objects.values_list('ticket_id', flat=True))
+        self.assertEqual([int(ticket_id[-5:]) for ticket_id in ticket_ids], [1, 2, 3, 4])
+        self.assertEqual(IdempotencyKey.objects.get().response['ticket_id'], ticket_ids[-1])
+
+    def test_concurrent_creates_never_collide(self):
+        threads, per_thread = 8, 30
+        created, errors = [], []
+        start = threading.Barrier(threads)
+
+        def worker(n):
+            try:
+                start.wait()
+                ids = [make_complaint(room_number=f'{n}-{i}').ticket_id for i in range(per_thread)]
+                # IDs handed to a single thread only ever increase
+                self.assertEqual(ids, sorted(ids))
+                created.extend(ids)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(set(created)), threads * per_thread)
+        self.assertEqual(Complaint.objects.count(), threads * per_thread)
+
+
+class RoomQRCodeTests(TempMediaMixin, APITestCase):
+    def qr_files(self):
+        return sorted(Room._meta.get_field('qr_code').storage.listdir('qr_codes')[1])
+
+    def test_status_toggle_is_a_single_update(self):
+        room = make_room()
+        with mock.patch('complaints.models.render_qr_png') as render:
+            # get_object(), the UPDATE and the rooms version bump
+            with self.assertNumQueries(3):
+                response = self.client.post(f'/api/rooms/{room.pk}/update_status/', {'status': 'inactive'})
+        self.assertEqual(response.data['status'], 'inactive')
+        render.assert_not_called()
+        room.refresh_from_db()
+        self.assertEqual(room.status, 'inactive')
+        self.assertEqual(self.qr_files(), [room.qr_code.name.split('/')[-1]])
+
+    def test_unchanged_payload_reuses_the_image(self):
+        room = make_room()
+        name = room.qr_code.name
+        with mock.patch('complaints.models.render_qr_png') as render:
+            room.save()
+            self.client.put(f'/api/rooms/{room.pk}/', {
+                'bed_no': '01', 'room_no': '101', 'Block': 'A', 'Floor_no': 1, 'ward': 'General',
+                'speciality': 'General', 'room_type': 'Standard', 'status': 'inactive',
+            })
+        render.assert_not_called()
+        room.refresh_from_db()
+        self.assertEqual(room.qr_code.name, name)
+        self.assertEqual(len(self.qr_files()), 1)
+
+    def test_changed_payload_replaces_and_removes_the_old_image(self):
+        room = make_room()
+        old_name = room.qr_code.name
+        room.ward = 'Cardiology'
+        # Released files are deleted once the transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            room.save()
+        self.assertNotEqual(room.qr_code.name, old_name)
+        self.assertEqual(self.qr_files(), [room.qr_code.name.split('/')[-1]])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            room.delete()
+        self.assertEqual(self.qr_files(), [])
+
+    def test_prune_qr_codes_removes_unreferenced_files(self):
+        room = make_room()
+        storage = Room._meta.get_field('qr_code').storage
+        with open(room.qr_code.path, 'rb') as image:
+            storage.save('qr_codes/qr_code_11_room_01_43NmoNQ.png', image)
+        call_command('prune_qr_codes', stdout=mock.MagicMock())
+        self.assertEqual(self.qr_files(), [room.qr_code.name.split('/')[-1]])
+
+
+def room_row(**overrides):
+    row = {
+        'bed_no': '01', 'room_no': '101', 'Block': 'B', 'Floor_no': 2, 'ward': 'General',
+        'speciality': 'General', 'room_type': 'Standard', 'status': 'active',
+    }
+    row.update(overrides)
+    return row
+
+
+class RoomImportTests(TempMediaMixin, APITestCase):
+    def test_per_row_report(self):
+        make_room(Block='B', Floor_no=2, bed_no='09')
+        rows = [
+            room_row(bed_no='01'),
+            room_row(bed_no='02'),
+            room_row(bed_no='01'),            # duplicate within the batch
+            room_row(bed_no='09'),            # already in the database
+            room_row(bed_no='03', Floor_no='x'),
+        ]
+        response = self.client.post('/api/rooms/bulk_import/', rows, format='json')
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([row['status'] for row in response.data['rows']],
+                         ['created', 'created', 'error', 'error', 'error'])
+        self.assertIn('Floor_no', response.data['rows'][4]['errors'])
+
+        room = Room.objects.get(pk=response.data['rows'][0]['id'])
+        self.assertTrue(room.qr_code.storage.exists(room.qr_code.name))
+        self.assertEqual(room.dataenc, room.get_qr_payload())
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        versions.bump(Room)
+        # Uniqueness check, the bulk insert in a savepoint, then in a second
+        # one the QR bulk update, the QR file reference counts and the rooms
+        # version bump
+        with self.assertNumQueries(9):
+            import_rooms([room_row(bed_no=str(i)) for i in range(3)], workers=0)
+        with self.assertNumQueries(9):
+            import_rooms([room_row(bed_no=str(i), ward='ICU') for i in range(40)], workers=0)
+        self.assertEqual(Room.objects.count(), 43)
+
+    def test_failed_import_leaves_no_rooms_or_images(self):
+        storage = Room._meta.get_field('qr_code').storage
+        files = lambda: set(storage.listdir('qr_codes')[1]) if storage.exists('qr_codes') else set()
+        before = files()
+        with mock.patch('complaints.provisioning.blobs.acquire', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                import_rooms([room_row(bed_no=f'f{i}') for i in range(3)])
+        self.assertFalse(Room.objects.exists())
+        self.assertEqual(files(), before)
+
+    def test_rooms_added_concurrently_are_reported_as_duplicates(self):
+        store_rooms = provisioning._store_rooms
+
+        def racing_import(rooms, workers):
+            if not Room.objects.exists():
+                # Another import commits the same room after the check
+                make_room(**room_row(bed_no='2'))
+            store_rooms(rooms, workers)
+
+        with mock.patch('complaints.provisioning._store_rooms', side_effect=racing_import):
+            report = import_rooms([room_row(bed_no=str(i)) for i in range(1, 4)])
+        self.assertEqual([row['status'] for row in report], ['created', 'error', 'created'])
+        self.assertEqual(report[1]['errors']['non_field_errors'], [RoomImportSerializer.duplicate_message])
+        self.assertEqual(Room.objects.count(), 3)
+
+    def test_qr_codes_render_outside_the_transactions(self):
+        depth = len(connection.atomic_blocks)
+        render_qr_codes = provisioning.render_qr_codes
+
+        def render(*args, **kwargs):
+            self.assertEqual(len(connection.atomic_blocks), depth)
+            render_qr_codes(*args, **kwargs)
+
+        with mock.patch('complaints.provisioning.render_qr_codes', side_effect=render) as rendered:
+            self.assertEqual(summarize(import_rooms([room_row(bed_no=str(i)) for i in range(3)]))['created'], 3)
+        rendered.assert_called_once()
+
+    def test_api_import_is_capped(self):
+        with mock.patch('complaints.views.API_MAX_ROWS', 2):
+            response = self.client.post('/api/rooms/bulk_import/', [room_row(bed_no=str(i)) for i in range(3)], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('import_rooms', response.data['error'])
+        self.assertFalse(Room.objects.exists())
+
+    def test_api_import_renders_inline(self):
+        with mock.patch('complaints.provisioning.POOL_THRESHOLD', 1), \
+                mock.patch('complaints.provisioning.ProcessPoolExecutor') as pool:
+            response = self.client.post('/api/rooms/bulk_import/', [room_row(bed_no=str(i)) for i in range(3)], format='json')
+        self.assertEqual(response.data['created'], 3)
+        pool.assert_not_called()
+
+    def test_command_renders_csv_in_process_pool(self):
+        path = os.path.join(self.media_root, 'rooms.csv')
+        with open(path, 'w') as handle:
+            handle.write(','.join(room_row()) + '\n')
+            for i in range(6):
+                handle.write(','.join(str(value) for value in room_row(bed_no=str(i)).values()) + '\n')
+        with mock.patch('complaints.provisioning.POOL_THRESHOLD', 1):
+            call_command('import_rooms', path, '--workers', '2', stdout=mock.MagicMock())
+        self.assertEqual(Room.objects.count(), 6)
+        for room in Room.objects.all():
+            self.assertTrue(room.qr_code.storage.exists(room.qr_code.name))
+
+
+def complaint_form(room, **overrides):
+    data = {
+        'bed_number': room.bed_no, 'room_number': room.room_no, 'block': room.Block,
+        'floor': str(room.Floor_no), 'ward': room.ward, 'speciality': room.speciality,
+        'room_type': room.room_type, 'room_status': room.status, 'issue_type': 'Electrical',
+        'description': 'Light not working', 'priority': 'medium',
+    }
+    data.update(overrides)
+    return data
+
+
+class QRPayloadTests(TempMediaMixin, APITestCase):
+    def setUp(self):
+        self.room = make_room()
+
+    def test_compact_payload_round_trips(self):
+        data = self.room.get_qr_payload(qr_payload.COMPACT)
+        self.assertEqual(qr_payload.payload_version(data), qr_payload.COMPACT)
+        self.assertEqual(qr_payload.decode(data), {field: getattr(self.room, field) for field in qr_payload.ROOM_FIELDS})
+        self.assertEqual(len(qr_payload.sign(data)), 16)
+        self.assertNotIn('=', data)
+
+    def test_legacy_payload_still_decodes(self):
+        data = self.room.get_room_data()
+        self.assertEqual(qr_payload.payload_version(data), qr_payload.LEGACY)
+        self.assertEqual(qr_payload.decode(data)['ward'], 'General')
+        self.assertEqual(len(qr_payload.sign(data)), 64)
+
+    def test_compact_code_is_a_smaller_qr_version(self):
+        legacy = build_qr_code(qr_payload.build_url(self.room.get_qr_payload(qr_payload.LEGACY)))
+        compact = build_qr_code(qr_payload.build_url(self.room.get_qr_payload(qr_payload.COMPACT)))
+        self.assertLess(compact.version, legacy.version)
+
+    def test_complaint_accepts_both_formats_and_rejects_tampering(self):
+        for version, issue in ((qr_payload.LEGACY, 'Electrical'), (qr_payload.COMPACT, 'Plumbing')):
+            data = self.room.get_qr_payload(version)
+            response = self.client.post('/api/complaints/', complaint_form(
+                self.room, issue_type=issue, qr_data_from_qr=data, qr_signature_from_qr=qr_payload.sign(data),
+            ))
+            self.assertEqual(response.status_code, 201, response.data)
+
+        data = self.room.get_qr_payload(qr_payload.COMPACT)
+        response = self.client.post('/api/complaints/', complaint_form(
+            self.room, issue_type='Cleanliness', qr_data_from_qr=data, qr_signature_from_qr='A' * 16,
+        ))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('qr_code', response.data)
+
+
+class RoomCacheTests(TempMediaMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.room = make_room()
+
+    def submit(self, **overrides):
+        return self.client.post('/api/complaints/', complaint_form(self.room, **overrides))
+
+    def test_repeat_submission_skips_room_query(self):
+        with CaptureQueriesContext(connection) as first:
+            self.assertEqual(self.submit(issue_type='Electrical').status_code, 201)
+        with CaptureQueriesContext(connection) as second:
+            self.assertEqual(self.submit(issue_type='Plumbing').status_code, 201)
+        def room_queries(context):
+            return [q['sql'] for q in context.captured_queries if 'FROM "complaints_room"' in q['sql']]
+
+        self.assertEqual(len(room_queries(first)), 1)
+        self.assertEqual(room_queries(second), [])
+
+    def test_status_change_invalidates(self):
+        self.assertEqual(self.submit(issue_type='Electrical').status_code, 201)
+        self.client.post(f'/api/rooms/{self.room.pk}/update_status/', {'status': 'inactive'})
+        response = self.submit(issue_type='Plumbing')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('The specified room is not active', str(response.data))
+
+    def test_unknown_room_is_cached_until_rooms_change(self):
+        response = self.submit(bed_number='77')
+        self.assertIn('Room not found with the provided details', str(response.data))
+        import_rooms([room_row(bed_no='77', Block='A', Floor_no=1, room_no='101')], workers=0)
+        self.assertEqual(self.submit(bed_number='77').status_code, 201)
+
+    def test_delete_invalidates(self):
+        self.assertEqual(self.submit(issue_type='Electrical').status_code, 201)
+        self.room.delete()
+        self.assertEqual(self.submit(issue_type='Plumbing').status_code, 400)
+
+
+class QRNativeSubmissionTests(TempMediaMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.room = make_room(ward='Cardiology')
+
+    def post_from_qr(self, data, **fields):
+        body = {'issue_type': 'Electrical', 'description': 'Light not working', 'priority': 'high'}
+        body.update(fields, qr_data_from_qr=data, qr_signature_from_qr=qr_payload.sign(data))
+        return self.client.post('/api/complaints/', body)
+
+    def test_room_is_loaded_by_primary_key(self):
+        self.assertEqual(qr_payload.decode(self.room.dataenc)['id'], self.room.pk)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post_from_qr(self.room.dataenc, ward='Somewhere else')
+        self.assertEqual(response.status_code, 201, response.data)
+        room_queries = [q['sql'] for q in queries.captured_queries if 'FROM "complaints_room"' in q['sql']]
+        self.assertEqual(len(room_queries), 1)
+        self.assertIn('"complaints_room"."id" = ', room_queries[0])
+
+        complaint = Complaint.objects.get(ticket_id=response.data['ticket_id'])
+        self.assertEqual(
+            (complaint.bed_number, complaint.room_number, complaint.block, complaint.floor, complaint.ward),
+            ('01', '101', 'A', '1', 'Cardiology'),
+        )
+        self.assertEqual(complaint.room_status, 'active')
+
+    def test_payload_without_room_id_still_resolves(self):
+        response = self.post_from_qr(self.room.get_qr_payload(qr_payload.COMPACT))
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(Complaint.objects.get().ward, 'Cardiology')
+
+    def test_inactive_room_is_rejected(self):
+        self.room.status = 'inactive'
+        self.room.save(update_fields=['status'])
+        response = self.post_from_qr(self.room.dataenc)
+        self.assertIn('The specified room is not active', str(response.data))
+
+    def test_room_fields_required_without_qr(self):
+        response = self.client.post('/api/complaints/', {
+            'issue_type': 'Electrical', 'description': 'Light not working', 'priority': 'high',
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['ward'], ['This field is required.'])
+
+
+class FullTextSearchTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.leak = make_complaint(room_number='601', description='Tap leaking in the bathroom')
+        cls.lights = make_complaint(room_number='602', description='Lights flicker, light switch broken')
+        cls.both = make_complaint(room_number='603', description='Broken tap, water leaks everywhere, leak again')
+        make_complaint(room_number='604', description='Noisy neighbours')
+
+    def search(self, q, **params):
+        response = self.client.get('/api/complaints/', {'q': q, **params})
+        return [row['ticket_id'] for row in response.data['results']]
+
+    def test_ranked_stemmed_matches(self):
+        self.assertEqual(self.search('leak'), [self.both.ticket_id, self.leak.ticket_id])
+        self.assertEqual(self.search('broken tap'), [self.both.ticket_id])
+
+    def test_explicit_ordering_overrides_rank(self):
+        self.assertEqual(self.search('leak', ordering='submitted_at'), [self.leak.ticket_id, self.both.ticket_id])
+
+    def test_fts_syntax_in_input_is_harmless(self):
+        self.assertEqual(self.search('"light* (switch:'), [self.lights.ticket_id])
+
+    def test_index_follows_updates_and_deletes(self):
+        Complaint.objects.filter(pk=self.lights.pk).update(description='Door handle loose')
+        self.assertEqual(self.search('light'), [])
+        self.assertEqual(self.search('handle'), [self.lights.ticket_id])
+        Complaint.objects.filter(pk=self.leak.pk).delete()
+        self.assertEqual(self.search('leak'), [self.both.ticket_id])
+
+    def test_uses_fts_index(self):
+        plan = Complaint.objects.filter(search_index__description__match=match_query(['leak'])).explain()
+        self.assertIn('VIRTUAL TABLE', plan, plan)
+
+    def test_fallback_without_fts5(self):
+        with mock.patch('complaints.search.fts_available', return_value=False):
+            self.assertEqual(sorted(self.search('tap leak')), sorted([self.leak.ticket_id, self.both.ticket_id]))
+
+
+class ComplaintStatsTests(APITestCase):
+    def setUp(self):
+        self.complaints = [
+            make_complaint(room_number='701', ward='ICU', priority='high'),
+            make_complaint(room_number='702', ward='ICU', priority='low'),
+            make_complaint(room_number='703', ward='General', priority='high', block='B'),
+        ]
+
+    def resolve(self, complaint, hours):
+        # Resolved `hours` after submission, through the API like a supervisor would
+        with mock.patch('complaints.bulk.timezone.now', return_value=complaint.submitted_at + datetime.timedelta(hours=hours)):
+            self.client.post(f'/api/complaints/{complaint.ticket_id}/update_status/', {'status': 'resolved'})
+
+    def test_counts_follow_create_and_status_change(self):
+        self.resolve(self.complaints[0], 2)
+        with self.assertNumQueries(1):
+            stats = rollups.compute_stats()
+        self.assertEqual(stats['total'], 3)
+        self.assertEqual(stats['by_status'], {'open': 2, 'resolved': 1})
+        self.assertEqual(stats['by_priority'], {'high': 2, 'low': 1})
+        self.assertEqual(stats['by_ward'], {'General': 1, 'ICU': 2})
+        self.assertEqual(stats['by_block'], {'A': 2, 'B': 1})
+        self.assertEqual(stats['resolution']['count'], 1)
+        self.assertAlmostEqual(stats['resolution']['mean_seconds'], 7200, delta=1)
+
+    def test_percentiles_and_trend(self):
+        self.resolve(self.complaints[0], 1)
+        self.resolve(self.complaints[1], 2)
+        self.resolve(self.complaints[2], 10)
+        response = self.client.get('/api/complaints/stats/', {'bucket': 'month'})
+        resolution = response.data['resolution']
+        # Histogram estimates are within one bin (~19%) of the real value
+        self.assertAlmostEqual(resolution['p50_seconds'], 7200, delta=7200 * 0.2)
+        self.assertAlmostEqual(resolution['p95_seconds'], 36000, delta=36000 * 0.2)
+        month = timezone.localdate().replace(day=1).isoformat()
+        self.assertEqual(response.data['trend'], [{'bucket': month, 'submitted': 3, 'resolved': 3}])
+
+    def test_reopen_and_delete_are_subtracted(self):
+        self.resolve(self.complaints[0], 1)
+        self.client.post(f'/api/complaints/{self.complaints[0].ticket_id}/update_status/', {'status': 'open'})
+        Complaint.objects.get(pk=self.complaints[0].pk).delete()
+        stats = rollups.compute_stats()
+        self.assertEqual(stats['by_status'], {'open': 2})
+        self.assertEqual(stats['total'], 2)
+
+    def test_saves_of_stale_instances_are_counted_once(self):
+        first, second = (Complaint.objects.get(pk=self.complaints[0].pk) for _ in range(2))
+        for complaint in (first, second):
+            complaint.status = 'in_progress'
+            complaint.save()
+        # Deferred and left-out fields keep their stored value
+        deferred = Complaint.objects.defer('status').get(pk=self.complaints[1].pk)
+        deferred.priority = 'medium'
+        deferred.save(update_fields=['priority', 'remarks'])
+        stats = rollups.compute_stats()
+        self.assertEqual(stats['by_status'], {'open': 2, 'in_progress': 1})
+        self.assertEqual(stats['by_priority'], {'high': 2, 'medium': 1})
+        rollups.rebuild()
+        self.assertEqual(rollups.compute_stats(), stats)
+
+    def test_rebuild_matches_incremental(self):
+        self.resolve(self.complaints[1], 3)
+        incremental = rollups.compute_stats()
+        ComplaintStat.objects.all().delete()
+        call_command('rebuild_complaint_stats', stdout=mock.MagicMock())
+        self.assertEqual(rollups.compute_stats(), incremental)
+
+    def test_date_range_and_validation(self):
+        tomorrow = (timezone.localdate() + datetime.timedelta(days=1)).isoformat()
+        self.assertEqual(self.client.get('/api/complaints/stats/', {'from': tomorrow}).data['total'], 0)
+        self.assertEqual(self.client.get('/api/complaints/stats/', {'to': '2026-02-30'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/complaints/stats/', {'bucket': 'year'}).status_code, 400)
+
+
+def parse_sse(text):
+    return [
+        dict(line.split(': ', 1) for line in message.splitlines() if not line.startswith(':'))
+        for message in text.split('\n\n') if message.strip()
+    ]
+
+
+@override_settings(SSE_POLL_INTERVAL=0.01, SSE_MAX_DURATION=0.2)
+class ComplaintEventFeedTests(TempMediaMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        department = Department.objects.create(department_code='ELE', department_name='Electrical', status='active')
+        Issue_Category.objects.create(
+            issue_category_code='EL1', department=department, issue_category_name='Electrical', status='active'
+        )
+        self.icu = make_room(ward='ICU')
+        self.general = make_room(ward='General', room_no='102')
+
+    def submit(self, room, **overrides):
+        response = self.client.post('/api/complaints/', complaint_form(room, **overrides))
+        self.assertEqual(response.status_code, 201)
+        return response.data['ticket_id']
+
+    def feed(self, **params):
+        response = self.client.get('/api/complaints/events/', dict({'last_event_id': 0}, **params))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return parse_sse(b''.join(response.streaming_content).decode())[1:]  # skip the retry field
+
+    def test_create_and_status_change_are_logged(self):
+        ticket = self.submit(self.icu)
+        self.client.post(f'/api/complaints/{ticket}/update_status/', {'status': 'in_progress'})
+        # Remarks alone are not a status change
+        self.client.post(f'/api/complaints/{ticket}/update_status/', {'status': 'in_progress', 'remarks': 'x'})
+
+        events = self.feed()
+        self.assertEqual([event['event'] for event in events], ['created', 'status_changed'])
+        data = json.loads(events[1]['data'])
+        self.assertEqual((data['ticket_id'], data['status'], data['department']), (ticket, 'in_progress', 'ELE'))
+
+    def test_filters(self):
+        icu_ticket = self.submit(self.icu)
+        self.submit(self.general, issue_type='Plumbing')
+        self.assertEqual([json.loads(e['data'])['ticket_id'] for e in self.feed(ward='ICU')], [icu_ticket])
+        self.assertEqual(len(self.feed(department='ELE')), 1)
+        self.assertEqual(len(self.feed(ward=['ICU', 'General'])), 2)
+
+    def test_resume_from_last_event_id(self):
+        self.submit(self.icu)
+        first = ComplaintEvent.objects.get().pk
+        ticket = self.submit(self.general)
+        response = self.client.get('/api/complaints/events/', HTTP_LAST_EVENT_ID=str(first))
+        events = parse_sse(b''.join(response.streaming_content).decode())[1:]
+        self.assertEqual([json.loads(e['data'])['ticket_id'] for e in events], [ticket])
+        self.assertEqual(self.client.get('/api/complaints/events/', HTTP_LAST_EVENT_ID='abc').status_code, 400)
+
+    def test_new_connection_starts_at_the_end(self):
+        self.submit(self.icu)
+        response = self.client.get('/api/complaints/events/')
+        self.assertEqual(parse_sse(b''.join(response.streaming_content).decode()), [{'retry': '3000'}])
+
+    def submit_many(self, count):
+        tickets = []
+        for _ in range(count):
+            tickets.append(self.submit(self.icu))
+            Complaint.objects.update(status='resolved')  # frees the room for the next one
+        return tickets
+
+    def test_expired_events_are_purged(self):
+        tickets = self.submit_many(3)
+        first, second, third = ComplaintEvent.objects.order_by('pk')
+        ComplaintEvent.objects.filter(pk=first.pk).update(created_at=timezone.now() - datetime.timedelta(days=8))
+        call_command('purge_complaint_events', stdout=mock.MagicMock())
+        self.assertEqual(list(ComplaintEvent.objects.values_list('pk', flat=True)), [second.pk, third.pk])
+
+        # A client that last saw a purged event resumes from the oldest one kept
+        response = self.client.get('/api/complaints/events/', HTTP_LAST_EVENT_ID=str(first.pk - 1))
+        events = parse_sse(b''.join(response.streaming_content).decode())[1:]
+        self.assertEqual([json.loads(e['data'])['ticket_id'] for e in events], tickets[1:])
+
+    @mock.patch('complaints.events.PURGE_BATCH_SIZE', 2)
+    def test_purge_keeps_the_newest_event(self):
+        self.submit_many(5)
+        newest = ComplaintEvent.objects.latest('pk').pk
+        ComplaintEvent.objects.update(created_at=timezone.now() - datetime.timedelta(days=8))
+        self.assertEqual(purge_expired_events(), 4)
+        # Ids are never handed out twice, even once the log has been emptied
+        self.assertEqual(list(ComplaintEvent.objects.values_list('pk', flat=True)), [newest])
+        self.submit_many(1)
+        self.assertEqual(ComplaintEvent.objects.latest('pk').pk, newest + 1)
+
+    async def test_live_stream_under_asgi(self):
+        await sync_to_async(self.submit)(self.icu)
+        first = await ComplaintEvent.objects.alatest('pk')
+
+        response = await AsyncClient().get('/api/complaints/events/', {'last_event_id': first.pk - 1})
+        messages = []
+        async for chunk in response.streaming_content:
+            messages.append(chunk.decode())
+            if len(messages) == 2:
+                # Written while the stream is open
+                await sync_to_async(make_complaint_event)(first.ticket_id)
+        events = parse_sse(''.join(messages))[1:]
+        self.assertEqual([int(event['id']) for event in events], [first.pk, first.pk + 1])
+
+
+def make_complaint_event(ticket_id):
+    from .events import record_event
+    record_event(Complaint.objects.get(pk=ticket_id), ComplaintEvent.STATUS_CHANGED)
+
+
+class DeltaSyncTests(APITestCase):
+    def sync(self, since, **params):
+        response = self.client.get('/api/complaints/changes/', dict(params, since=since))
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_created_updated_and_deleted_since_token(self):
+        first, second, third = (make_complaint(room_number=str(800 + i)) for i in range(3))
+        token = self.sync(0)['next']
+
+        second.priority = 'high'
+        second.save()
+        deleted_id = third.ticket_id
+        third.delete()
+        fourth = make_complaint(room_number='804')
+
+        data = self.sync(token)
+        self.assertEqual([c['ticket_id'] for c in data['changed']], [second.ticket_id, fourth.ticket_id])
+        self.assertEqual(data['changed'][0]['priority'], 'high')
+        self.assertEqual(data['deleted'], [deleted_id])
+        self.assertFalse(data['has_more'])
+        self.assertEqual(self.sync(data['next'])['changed'], [])
+
+    def test_image_changes_count_as_a_complaint_change(self):
+        complaint = make_complaint()
+        token = self.sync(0)['next']
+        ComplaintImage.objects.create(complaint=complaint, image='complaint_images/x.png')
+        self.assertEqual([c['ticket_id'] for c in self.sync(token)['changed']], [complaint.ticket_id])
+
+    def test_each_complaint_appears_once_and_pages(self):
+        complaints = [make_complaint(room_number=str(810 + i)) for i in range(5)]
+        for complaint in complaints[:2]:
+            complaint.save()
+        page = self.sync(0, limit=3)
+        self.assertTrue(page['has_more'])
+        rest = self.sync(page['next'], limit=3)
+        self.assertFalse(rest['has_more'])
+        seen = [c['ticket_id'] for c in page['changed'] + rest['changed']]
+        self.assertCountEqual(seen, [c.ticket_id for c in complaints])
+        self.assertEqual(ComplaintChange.objects.count(), 5)
+
+    def test_invalid_token(self):
+        self.assertEqual(self.client.get('/api/complaints/changes/', {'since': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/complaints/changes/', {'since': '-1'}).status_code, 400)
+
+
+class ConditionalGetTests(TempMediaMixin, APITestCase):
+    def setUp(self):
+        self.department = Department.objects.create(department_code='ELE', department_name='Electrical', status='active')
+        Issue_Category.objects.create(
+            issue_category_code='EL1', department=self.department, issue_category_name='Wiring', status='active'
+        )
+
+    def test_unchanged_list_is_304_without_queryset(self):
+        first = self.client.get('/api/departments/')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first['Cache-Control'], 'no-cache')
+        with self.assertNumQueries(1):  # the version lookup only
+            response = self.client.get('/api/departments/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], first['ETag'])
+
+        response = self.client.get('/api/departments/', HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        detail = self.client.get('/api/departments/ELE/')
+        self.assertEqual(self.client.get('/api/departments/ELE/', HTTP_IF_NONE_MATCH=detail['ETag']).status_code, 304)
+
+    def test_save_and_delete_change_the_etag(self):
+        etag = self.client.get('/api/departments/')['ETag']
+        Department.objects.create(department_code='PLU', department_name='Plumbing', status='active')
+        response = self.client.get('/api/departments/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
+
+        etag = response['ETag']
+        Department.objects.get(pk='PLU').delete()
+        self.assertEqual(self.client.get('/api/departments/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_issue_categories_follow_department_changes(self):
+        etag = self.client.get('/api/issue-category/')['ETag']
+        self.department.department_name = 'Electric'
+        self.department.save()
+        response = self.client.get('/api/issue-category/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['department_name'], 'Electric')
+
+    def test_rooms_track_bulk_import(self):
+        etag = self.client.get('/api/rooms/')['ETag']
+        import_rooms([room_row(bed_no='01')], workers=0)
+        self.assertEqual(self.client.get('/api/rooms/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class FormBootstrapTests(TempMediaMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.room = make_room(ward='Cardiology')
+        electrical = Department.objects.create(department_code='ELE', department_name='Electrical', status='active')
+        Department.objects.create(department_code='OLD', department_name='Retired', status='inactive')
+        Issue_Category.objects.create(
+            issue_category_code='EL1', department=electrical, issue_category_name='Wiring', status='active'
+        )
+        Issue_Category.objects.create(
+            issue_category_code='EL2', department=electrical, issue_category_name='Switches', status='inactive'
+        )
+
+    def bootstrap(self, data=None, signature=None):
+        data = data or self.room.dataenc
+        return self.client.get('/api/complaints/bootstrap/', {
+            'data': data, 'signature': signature or qr_payload.sign(data),
+        })
+
+    def test_room_and_active_tree(self):
+        response = self.bootstrap()
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['room']['ward'], 'Cardiology')
+        self.assertEqual(body['room']['room_status'], 'active')
+        self.assertEqual(body['departments'], [{
+            'department_code': 'ELE', 'department_name': 'Electrical',
+            'issue_categories': [{'issue_category_code': 'EL1', 'issue_category_name': 'Wiring'}],
+        }])
+
+    def test_tree_is_cached_until_categories_change(self):
+        self.bootstrap()
+        # Room by primary key and the version lookup
+        with self.assertNumQueries(2):
+            self.bootstrap()
+        Issue_Category.objects.filter(pk='EL2').update(status='active')  # bypasses signals: still cached
+        self.assertEqual(len(self.bootstrap().json()['departments'][0]['issue_categories']), 1)
+        Issue_Category.objects.get(pk='EL2').save()
+        self.assertEqual(len(self.bootstrap().json()['departments'][0]['issue_categories']), 2)
+
+    def test_rejects_bad_signature_and_inactive_room(self):
+        self.assertEqual(self.bootstrap(signature='A' * 16).status_code, 400)
+        self.room.status = 'inactive'
+        self.room.save(update_fields=['status'])
+        self.assertEqual(self.bootstrap().status_code, 400)
+
+
+def photo_upload(name='photo.jpg', size=(800, 400)):
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from PIL import Image
+
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: rotate 90 degrees clockwise
+    exif[0x010F] = 'PhoneMaker'
+    buffer = BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, 'JPEG', exif=exif)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(IMAGE_PIPELINE_THREADS=0, IMAGE_MAX_DIMENSION=200, IMAGE_THUMBNAIL_SIZE=50)
+class ImagePipelineTests(TempMediaMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.room = make_room()
+
+    def submit_with_photo(self):
+        response = self.client.post('/api/complaints/', dict(complaint_form(self.room), images=[photo_upload()]))
+        self.assertEqual(response.status_code, 201)
+        return ComplaintImage.objects.get(complaint_id=response.data['ticket_id'])
+
+    def test_upload_is_queued_then_processed(self):
+        image = self.submit_with_photo()
+        original = image.image.name
+        self.assertIsNone(image.processed_at)
+        self.assertEqual(ImageJob.objects.get().image, image)
+        # The upload, metadata and all, is not exposed before processing
+        data = self.client.get(f'/api/complaints/{image.complaint_id}/').data
+        self.assertEqual(data['images'], [{'image': None, 'thumbnail': None, 'width': None, 'height': None}])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(process_pending(), 1)
+        image.refresh_from_db()
+        self.assertFalse(ImageJob.objects.exists())
+        self.assertTrue(image.image.name.endswith('.webp'))
+        self.assertFalse(image.image.storage.exists(original))
+        # Orientation applied (portrait now), scaled to fit 200px, metadata gone
+        self.assertEqual((image.width, image.height), (100, 200))
+        with image.image.open('rb') as handle:
+            from PIL import Image
+            stored = Image.open(handle)
+            self.assertEqual(stored.format, 'WEBP')
+            self.assertEqual(len(stored.getexif()), 0)
+        with image.thumbnail.open('rb') as handle:
+            self.assertEqual(Image.open(handle).size, (25, 50))
+
+        data = self.client.get(f'/api/complaints/{image.complaint_id}/').data
+        self.assertTrue(data['images'][0]['image'].endswith('.webp'))
+        self.assertTrue(data['images'][0]['thumbnail'].endswith('.webp'))
+
+    def test_failures_are_retried_then_given_up(self):
+        image = self.submit_with_photo()
+        image.image.storage.delete(image.image.name)
+        with self.assertLogs('complaints.images', 'ERROR'):
+            for _ in range(MAX_ATTEMPTS):
+                process_pending()
+        job = ImageJob.objects.get()
+        self.assertEqual((job.status, job.attempts), (ImageJob.FAILED, MAX_ATTEMPTS))
+        self.assertEqual(process_pending(), 0)
+
+    def test_upload_is_deleted_when_processing_gives_up(self):
+        image = self.submit_with_photo()
+        original = image.image.name
+        with self.assertLogs('complaints.images', 'ERROR'), \
+                mock.patch('complaints.images.prepare', side_effect=OSError('truncated')):
+            for attempt in range(MAX_ATTEMPTS):
+                with self.captureOnCommitCallbacks(execute=True):
+                    process_pending()
+                # Kept while the job is still retried
+                self.assertEqual(image.image.storage.exists(original), attempt < MAX_ATTEMPTS - 1)
+        image.refresh_from_db()
+        self.assertEqual(image.image.name, '')
+        self.assertFalse(Blob.objects.filter(name=original).exists())
+        self.assertEqual(ImageJob.objects.get().status, ImageJob.FAILED)
+
+    def test_command_backfills_existing_images(self):
+        complaint = make_complaint()
+        ComplaintImage.objects.create(complaint=complaint, image=photo_upload('old.jpg'))
+        call_command('process_image_jobs', '--backfill', '--once', stdout=mock.MagicMock())
+        self.assertIsNotNone(ComplaintImage.objects.get().processed_at)
+
+
+@override_settings(IMAGE_PIPELINE_THREADS=1, IMAGE_MAX_DIMENSION=200)
+class ImagePipelineThreadTests(TempMediaMixin, TransactionTestCase):
+    def test_pool_processes_upload_after_commit(self):
+        from . import images
+
+        room = make_room()
+        response = self.client.post('/api/complaints/', dict(complaint_form(room), images=[photo_upload()]))
+        self.assertEqual(response.status_code, 201)
+        pool, images._executor = images._executor, None
+        pool.shutdown(wait=True)
+        self.assertIsNotNone(ComplaintImage.objects.get().processed_at)
+        self.assertFalse(ImageJob.objects.exists())
+
+
+@override_settings(IMAGE_PIPELINE_THREADS=0)
+class MediaReuseRaceTests(TempMediaMixin, TransactionTestCase):
+    def test_reupload_during_delete_keeps_the_file(self):
+        first, second = make_complaint(room_number='921'), make_complaint(room_number='922')
+        name = ComplaintImage.objects.create(complaint=first, image=photo_upload('Screenshot_1.png')).image.name
+        storage = ComplaintImage._meta.get_field('image').storage
+        real_delete = blobs.delete_if_unreferenced
+        # Released and committed, the file delete still to come
+        with mock.patch('complaints.blobs.delete_if_unreferenced'):
+            first.delete()
+
+        stored, commit = threading.Event(), threading.Event()
+        errors = []
+
+        def upload_same_bytes():
+            try:
+                with transaction.atomic():
+                    ComplaintImage.objects.create(complaint=second, image=photo_upload('Screenshot_2.png'))
+                    stored.set()
+                    commit.wait(5)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        uploader = threading.Thread(target=upload_same_bytes)
+        uploader.start()
+        stored.wait(5)
+        threading.Timer(0.2, commit.set).start()
+        real_delete(name, storage)
+        uploader.join()
+
+        self.assertEqual(errors, [])
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(Blob.objects.get(name=name).refcount, 1)
+
+
+@override_settings(IMAGE_PIPELINE_THREADS=0)
+class MediaDedupTests(TempMediaMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.room = make_room()
+
+    def test_identical_uploads_share_one_refcounted_file(self):
+        first = make_complaint(room_number='901')
+        second = make_complaint(room_number='902')
+        for complaint in (first, second):
+            ComplaintImage.objects.create(complaint=complaint, image=photo_upload('Screenshot_1.png'))
+        names = set(ComplaintImage.objects.values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertRegex(name, r'^complaint_images/([0-9a-f]{2})/\1[0-9a-f]{62}\.png$')
+        self.assertEqual(Blob.objects.get(name=name).refcount, 2)
+
+        storage = ComplaintImage._meta.get_field('image').storage
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(Blob.objects.filter(name=name).exists())
+
+    def test_dedup_media_command(self):
+        from django.core.files.base import ContentFile
+        from django.core.files.storage import FileSystemStorage
+
+        # Files written before content addressing: two copies of one screenshot
+        legacy = FileSystemStorage()
+        content = photo_upload().read()
+        for name in ('complaint_images/Screenshot_a.png', 'complaint_images/Screenshot_b.png'):
+            legacy.save(name, ContentFile(content))
+        orphan = legacy.save('complaint_images/orphan.png', ContentFile(b'x'))
+        old = (timezone.now() - datetime.timedelta(days=1)).timestamp()
+        os.utime(legacy.path(orphan), (old, old))
+        complaints = [make_complaint(room_number=str(910 + i)) for i in range(2)]
+        ComplaintImage.objects.bulk_create([
+            ComplaintImage(complaint=complaints[0], image='complaint_images/Screenshot_a.png'),
+            ComplaintImage(complaint=complaints[1], image='complaint_images/Screenshot_b.png'),
+        ])
+
+        call_command('dedup_media', '--dry-run', stdout=mock.MagicMock())
+        self.assertTrue(legacy.exists('complaint_images/Screenshot_a.png'))
+
+        output = mock.MagicMock()
+        call_command('dedup_media', stdout=output)
+        names = set(ComplaintImage.objects.values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertEqual(Blob.objects.get(name=name).refcount, 2)
+        self.assertEqual(Blob.objects.get(name=self.room.qr_code.name).refcount, 1)
+        self.assertEqual(sorted(walk_media('complaint_images')), [name])
+        self.assertIn(f'reclaiming {len(content) + 1} bytes', output.write.call_args_list[-1][0][0])
+
+
+def walk_media(directory):
+    from .management.commands.dedup_media import walk
+
+    return list(walk(ComplaintImage._meta.get_field('image').storage, directory))
+
+
+class BulkStatusUpdateTests(APITestCase):
+    def setUp(self):
+        self.complaints = [make_complaint(room_number=str(950 + i), ward='ICU' if i < 3 else 'General') for i in range(5)]
+        self.tickets = [complaint.ticket_id for complaint in self.complaints]
+
+    def bulk(self, **body):
+        return self.client.post('/api/complaints/bulk_update_status/', body, format='json')
+
+    def test_ticket_ids_with_per_ticket_results(self):
+        self.bulk(ticket_ids=self.tickets[:1], status='resolved')
+        response = self.bulk(ticket_ids=self.tickets[:3] + ['SVN00000000000'], status='resolved', remarks='Shift end')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['updated'], response.data['unchanged'], response.data['not_found']), (2, 1, 1))
+        self.assertEqual(
+            [(r['ticket_id'], r['result']) for r in response.data['results']],
+            [(self.tickets[0], 'unchanged'), (self.tickets[1], 'updated'), (self.tickets[2], 'updated'),
+             ('SVN00000000000', 'not_found')],
+        )
+        complaint = Complaint.objects.get(pk=self.tickets[1])
+        self.assertEqual((complaint.status, complaint.remarks), ('resolved', 'Shift end'))
+        self.assertIsNotNone(complaint.resolved_at)
+
+    def test_filter_and_side_tables(self):
+        token = self.client.get('/api/complaints/changes/').data['next']
+        last_event = ComplaintEvent.objects.count()
+        response = self.bulk(filter={'ward': 'ICU', 'status': 'open'}, status='resolved')
+        self.assertEqual(response.data['updated'], 3)
+
+        stats = rollups.compute_stats()
+        self.assertEqual(stats['by_status'], {'open': 2, 'resolved': 3})
+        self.assertEqual(stats['resolution']['count'], 3)
+        self.assertEqual(len(self.client.get('/api/complaints/changes/', {'since': token}).data['changed']), 3)
+        self.assertEqual(ComplaintEvent.objects.count() - last_event, 3)
+
+        # Reopening clears the resolution again
+        self.bulk(filter={'ward': 'ICU'}, status='open')
+        self.assertIsNone(Complaint.objects.get(pk=self.tickets[0]).resolved_at)
+        self.assertEqual(rollups.compute_stats()['resolution']['count'], 0)
+
+    def test_query_count_does_not_grow_with_tickets(self):
+        with CaptureQueriesContext(connection) as few:
+            self.bulk(ticket_ids=self.tickets[:2], status='in_progress')
+        with CaptureQueriesContext(connection) as many:
+            self.bulk(ticket_ids=self.tickets[2:], status='in_progress')
+        self.assertEqual(len(few), len(many))
+
+    def test_validation(self):
+        self.assertEqual(self.bulk(status='resolved').status_code, 400)
+        self.assertEqual(self.bulk(ticket_ids=self.tickets, filter={'ward': 'ICU'}, status='resolved').status_code, 400)
+        self.assertEqual(self.bulk(filter={'description': 'x'}, status='resolved').status_code, 400)
+        self.assertEqual(self.bulk(ticket_ids=self.tickets, status='done').status_code, 400)
+
+    def test_filter_matching_too_many_changes_nothing(self):
+        with mock.patch('complaints.bulk.UPDATE_MAX_ROWS', 2):
+            response = self.bulk(filter={'ward': 'ICU'}, status='resolved')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('more than 2 complaints', response.data['error'])
+            self.assertEqual(self.bulk(filter={'ward': 'General'}, status='resolved').data['updated'], 2)
+        self.assertEqual(Complaint.objects.filter(status='resolved').count(), 2)
+
+    def test_single_and_bulk_updates_agree_on_resolution(self):
+        single, batch = self.tickets[:2]
+        self.bulk(ticket_ids=[single, batch], status='resolved')
+        self.client.post(f'/api/complaints/{single}/update_status/', {'status': 'on_hold'})
+        self.bulk(ticket_ids=[batch], status='on_hold')
+        fields = ('status', 'resolved_at', 'resolved_by')
+        self.assertEqual(
+            Complaint.objects.filter(pk=single).values(*fields).get(),
+            Complaint.objects.filter(pk=batch).values(*fields).get(),
+        )
+        self.assertIsNone(Complaint.objects.get(pk=single).resolved_at)
+
+
+class BatchIngestTests(TempMediaMixin, APITestCase):
+    def setUp(self):
+        self.room = make_room()
+        self.rooms = [make_room(bed_no=f'{i:02d}', room_no='120') for i in range(4)]
+
+    def item(self, room, key, **overrides):
+        data = self.room.get_qr_payload() if room is None else None
+        item = complaint_form(room or self.room, client_key=key, **overrides)
+        if data is not None:
+            item.update(qr_data_from_qr=data, qr_signature_from_qr=qr_payload.sign(data))
+        return item
+
+    def batch(self, items):
+        return self.client.post('/api/complaints/batch/', {'complaints': items}, format='json')
+
+    def test_created_duplicates_and_errors(self):
+        make_complaint(bed_number='03', room_number='120', client_key='stored')
+        response = self.batch([
+            self.item(None, 'qr'),
+            self.item(self.rooms[0], 'manual'),
+            self.item(self.rooms[0], 'manual'),
+            self.item(self.rooms[1], 'stored'),
+            self.item(self.rooms[2], 'second', issue_type='Plumbing'),
+            self.item(self.rooms[2], 'again', issue_type='Plumbing'),
+            self.item(self.rooms[3], 'nowhere', ward='Nowhere'),
+            {'client_key': 'broken', 'description': 'x'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['duplicate'], response.data['error']), (3, 2, 3))
+        results = response.data['results']
+        self.assertEqual([r['status'] for r in results], [
+            'created', 'created', 'duplicate', 'duplicate', 'created', 'error', 'error', 'error',
+        ])
+        self.assertEqual(results[2]['ticket_id'], results[1]['ticket_id'])
+        self.assertEqual(results[3]['ticket_id'], Complaint.objects.get(client_key='stored').ticket_id)
+        self.assertIn('priority', results[7]['errors'])
+
+        complaint = Complaint.objects.get(pk=results[0]['ticket_id'])
+        self.assertEqual((complaint.bed_number, complaint.room_status, complaint.submitted_by), ('01', 'active', 'Anonymous'))
+
+    def test_replaying_a_batch_creates_nothing(self):
+        items = [self.item(room, f'k{i}') for i, room in enumerate(self.rooms)]
+        first = self.batch(items).data
+        second = self.batch(items).data
+        self.assertEqual((first['created'], second['created'], second['duplicate']), (4, 0, 4))
+        self.assertEqual([r['ticket_id'] for r in first['results']], [r['ticket_id'] for r in second['results']])
+        self.assertEqual(Complaint.objects.count(), 4)
+
+    def test_losing_every_race_reports_items_for_resending(self):
+        make_complaint(bed_number='03', room_number='120', client_key='stored')
+        items = [self.item(self.rooms[0], 'a'), self.item(self.rooms[0], 'a'), self.item(self.rooms[3], 'stored')]
+        with mock.patch.object(Complaint.objects, 'bulk_create', side_effect=IntegrityError) as bulk_create:
+            response = self.batch(items)
+        self.assertEqual(bulk_create.call_count, 2)
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([r['status'] for r in results], ['error', 'error', 'duplicate'])
+        self.assertEqual(results[0]['errors']['non_field_errors'], [bulk.CONFLICT_MESSAGE])
+        self.assertEqual(Complaint.objects.count(), 1)
+
+    def test_query_count_does_not_grow_with_items(self):
+        self.batch([self.item(None, 'warm-up')])  # creates today's ticket sequence row
+        with CaptureQueriesContext(connection) as few:
+            self.batch([self.item(room, f'a{i}') for i, room in enumerate(self.rooms[:2])])
+        with CaptureQueriesContext(connection) as many:
+            self.batch([self.item(room, f'b{i}', issue_type='Plumbing') for i, room in enumerate(self.rooms)])
+        self.assertEqual(len(few), len(many))
+
+    def test_side_tables_and_search(self):
+        token = self.client.get('/api/complaints/changes/').data['next']
+        response = self.batch([
+            self.item(room, f'k{i}', description=f'Tap leaking in bathroom {i}') for i, room in enumerate(self.rooms)
+        ])
+        self.assertEqual(response.data['created'], 4)
+        self.assertEqual(rollups.compute_stats()['by_status'], {'open': 4})
+        self.assertEqual(len(self.client.get('/api/complaints/changes/', {'since': token}).data['changed']), 4)
+        self.assertEqual(ComplaintEvent.objects.filter(kind=ComplaintEvent.CREATED).count(), 4)
+        self.assertEqual(self.client.get('/api/complaints/', {'q': 'leak'}).data['count'], 4)
+
+    def test_validation(self):
+        self.assertEqual(self.client.post('/api/complaints/batch/', [], format='json').status_code, 400)
+        self.assertEqual(self.batch([]).status_code, 400)
+        self.assertEqual(self.batch([self.item(self.room, str(i)) for i in range(201)]).status_code, 400)
+
+
+class IdempotencyKeyTests(TempMediaMixin, APITestCase):
+    def setUp(self):
+        self.room = make_room()
+
+    def submit(self, key, **overrides):
+        return self.client.post('/api/complaints/', complaint_form(self.room, **overrides), HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_gets_stored_response_without_work(self):
+        first = self.submit('attempt-1')
+        self.assertEqual(first.status_code, 201, first.data)
+        with self.assertNumQueries(1):
+            retry = self.submit('attempt-1')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data['ticket_id'], first.data['ticket_id'])
+        self.assertEqual(Complaint.objects.count(), 1)
+
+    def test_key_reused_for_another_request(self):
+        self.submit('attempt-1')
+        self.assertEqual(self.submit('attempt-1', issue_type='Plumbing').status_code, 422)
+        self.assertEqual(Complaint.objects.count(), 1)
+
+    def test_failed_attempt_is_not_stored(self):
+        self.assertEqual(self.submit('attempt-1', ward='Nowhere').status_code, 400)
+        self.assertEqual(self.submit('attempt-1').status_code, 201)
+
+    def test_concurrent_attempt_loses_to_stored_key(self):
+        # The first complaint is still open, so the retry's insert fails on
+        # complaint_open_room_uniq before it gets to the key
+        first = self.submit('attempt-1')
+        real_replay = idempotency.replay
+        misses = [None]
+
+        def replay(key, fingerprint):
+            # The first lookup misses, as if the other attempt had not committed yet
+            return misses.pop() if misses else real_replay(key, fingerprint)
+
+        with mock.patch.object(idempotency, 'replay', side_effect=replay):
+            retry = self.submit('attempt-1')
+        self.assertEqual(retry.data['ticket_id'], first.data['ticket_id'])
+        self.assertEqual(Complaint.objects.count(), 1)
+
+    def test_expired_keys(self):
+        self.submit('attempt-1')
+        IdempotencyKey.objects.update(created_at=timezone.now() - datetime.timedelta(days=2))
+        Complaint.objects.update(status='resolved')
+        self.assertEqual(self.submit('attempt-1').status_code, 201)
+        self.assertEqual(Complaint.objects.count(), 2)
+
+        IdempotencyKey.objects.update(created_at=timezone.now() - datetime.timedelta(days=2))
+        call_command('purge_idempotency_keys', stdout=mock.MagicMock())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class UniqueConstraintTests(TempMediaMixin, APITestCase):
+    def setUp(self):
+        self.room = make_room()
+        self.department = Department.objects.create(department_code='ELE', department_name='Electrical', status='active')
+        Issue_Category.objects.create(
+            issue_category_code='LGT', department=self.department, issue_category_name='Lights', status='active'
+        )
+
+    def test_duplicate_room(self):
+        data = {field: getattr(self.room, field) for field in Room.KEY_FIELDS}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/rooms/', data)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['non_field_errors'], [RoomSerializer.duplicate_message])
+        # The clash is only looked up after the INSERT failed
+        self.assertTrue(queries[-1]['sql'].startswith('SELECT'))
+        self.assertEqual(Room.objects.count(), 1)
+
+        other = make_room(bed_no='02')
+        response = self.client.patch(f'/api/rooms/{other.pk}/', {'bed_no': '01'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['non_field_errors'], [RoomSerializer.duplicate_message])
+
+    def test_names_are_unique_ignoring_case(self):
+        response = self.client.post('/api/departments/', {'department_code': 'EL2', 'department_name': 'ELECTRICAL'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['department_name'], ['A department with this name already exists.'])
+
+        response = self.client.post('/api/issue-category/', {
+            'issue_category_code': 'LG2', 'department': 'ELE', 'issue_category_name': 'lights',
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data['issue_category_name'], ['An issue category with this name already exists in this department.']
+        )
+
+    def test_duplicate_open_complaint(self):
+        self.assertEqual(self.client.post('/api/complaints/', complaint_form(self.room)).status_code, 201)
+        response = self.client.post('/api/complaints/', complaint_form(self.room))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['non_field_errors'], [DUPLICATE_OPEN_MESSAGE])
+
+        # Reopening an older complaint for the same issue clashes as well
+        first = Complaint.objects.get()
+        self.client.post(f'/api/complaints/{first.ticket_id}/update_status/', {'status': 'resolved'})
+        second = self.client.post('/api/complaints/', complaint_form(self.room)).data['ticket_id']
+        response = self.client.post(f'/api/complaints/{first.ticket_id}/update_status/', {'status': 'open'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            '/api/complaints/bulk_update_status/', {'ticket_ids': [first.ticket_id], 'status': 'open'}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Complaint.objects.open().get().ticket_id, second)
+
+
+class SQLiteProfileTests(unittest.TestCase):
+    # Scratch databases of their own, outside Django's test database handling
+    def test_production_profile_commits_every_concurrent_write(self):
+        result = stress.run(settings.SQLITE_PRODUCTION_PROFILE, threads=4, requests=25)
+        self.assertEqual(result['journal_mode'], 'wal')
+        self.assertEqual((result['committed'], result['failed']), (100, 0))
+
+    def test_default_profile_is_untouched(self):
+        self.assertEqual(stress.run({}, threads=1, requests=5)['journal_mode'], 'delete')
+
+
+class ReadReplicaTests(TempMediaMixin, APITestCase):
+    # The replica is a snapshot of the empty test database taken before each
+    # test class, so reads served by it do not see rows the tests create
+    # Resolved in setUpClass, once the replica alias exists
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.replica_dir = tempfile.mkdtemp()
+        path = os.path.join(cls.replica_dir, 'replica.sqlite3')
+        primary = connections['default']
+        primary.ensure_connection()
+        with closing(sqlite3.connect(path)) as target:
+            primary.connection.backup(target)
+        connections.settings[routers.REPLICA] = dict(connections.settings['default'], NAME=path)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[routers.REPLICA].close()
+        del connections[routers.REPLICA]
+        del connections.settings[routers.REPLICA]
+        shutil.rmtree(cls.replica_dir)
+
+    def setUp(self):
+        self.room = make_room()
+        make_complaint(room_number='990')
+
+    def test_reporting_reads_use_the_replica(self):
+        self.assertEqual(self.client.get('/api/complaints/').data['count'], 0)
+        self.assertEqual(self.client.get('/api/complaints/by_status/', {'status': 'open'}).data['count'], 0)
+        self.assertEqual(self.client.get('/api/complaints/stats/').data['total'], 0)
+        # Everything else reads from the primary
+        ticket_id = Complaint.objects.get().ticket_id
+        self.assertEqual(self.client.get(f'/api/complaints/{ticket_id}/').status_code, 200)
+
+    def test_client_reads_its_own_writes(self):
+        response = self.client.post('/api/complaints/', complaint_form(self.room))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.cookies[routers.PIN_COOKIE]['max-age'], settings.REPLICA_PIN_SECONDS)
+        self.assertEqual(self.client.get('/api/complaints/').data['count'], 2)
+        self.assertEqual(self.client.get('/api/complaints/stats/').data['total'], 2)
+
+    def test_failed_write_does_not_pin(self):
+        response = self.client.post('/api/complaints/', complaint_form(self.room, ward='Nowhere'))
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+
+    def test_writes_of_replica_objects_go_to_the_primary(self):
+        complaint = Complaint.objects.get()
+        complaint._state.db = routers.REPLICA
+        self.assertEqual(router.db_for_write(Complaint, instance=complaint), 'default')
+
+    def test_admin_changelist(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='secret'))
+        response = self.client.get('/admin/complaints/complaint/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].queryset.db, routers.REPLICA)
+        self.assertEqual(response.context['cl'].result_count, 0)
+
+
+class ComplaintExportTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.complaints = [
+            make_complaint(room_number=str(700 + i), ward='ICU' if i % 2 else 'General', description=f'Issue, "{i}"')
+            for i in range(5)
+        ]
+        Complaint.objects.filter(pk=cls.complaints[0].pk).update(
+            submitted_at=timezone.make_aware(datetime.datetime(2026, 1, 15, 9, 0))
+        )
+
+    def export(self, **params):
+        response = self.client.get('/api/complaints/export/', params)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv_with_list_filters(self):
+        response, content = self.export(ward='ICU')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.DictReader(StringIO(content)))
+        # Oldest first whatever the list ordering, as from the command
+        self.assertEqual([row['ticket_id'] for row in rows], [c.ticket_id for c in self.complaints[1::2]])
+        self.assertEqual(rows[1]['description'], 'Issue, "3"')
+        _, reordered = self.export(ward='ICU', ordering='-submitted_at')
+        self.assertEqual(reordered, content)
+
+    def test_csv_cells_are_never_formulas(self):
+        Complaint.objects.filter(pk=self.complaints[1].pk).update(
+            description='=HYPERLINK("http://example.com")', remarks='+1', submitted_by='@admin', resolved_by='-x',
+        )
+        _, content = self.export(ward='ICU')
+        row = next(csv.DictReader(StringIO(content)))
+        self.assertEqual(
+            [row[field] for field in ('description', 'remarks', 'submitted_by', 'resolved_by')],
+            ['\'=HYPERLINK("http://example.com")', "'+1", "'@admin", "'-x"],
+        )
+        _, content = self.export(ward='ICU', file_format='jsonl')
+        self.assertEqual(json.loads(content.splitlines()[0])['remarks'], '+1')
+
+    def test_jsonl_with_date_range(self):
+        _, content = self.export(file_format='jsonl', **{'from': '2026-01-01', 'to': '2026-01-31'})
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['ticket_id'] for row in rows], [self.complaints[0].ticket_id])
+        self.assertTrue(rows[0]['submitted_at'].startswith('2026-01-15T'))
+
+    def test_rows_are_read_in_chunks(self):
+        with mock.patch.object(export, 'CHUNK_SIZE', 2):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/api/complaints/export/', {'file_format': 'jsonl'})
+                pieces = [piece.decode() for piece in response.streaming_content]
+        self.assertEqual([piece.count('\n') for piece in pieces], [2, 2, 1])
+        # One cursor read in chunks, and no prefetch of images for the value rows
+        self.assertEqual(len(queries), 1)
+
+    def test_validation(self):
+        self.assertEqual(self.client.get('/api/complaints/export/', {'file_format': 'xlsx'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/complaints/export/', {'from': '2026-13-01'}).status_code, 400)
+
+    def test_management_command(self):
+        output = StringIO()
+        call_command('export_complaints', '--format', 'csv', '--ward', 'General', '--from', '2026-02-01', stdout=output)
+        rows = list(csv.DictReader(StringIO(output.getvalue())))
+        self.assertEqual([row['ticket_id'] for row in rows], [c.ticket_id for c in self.complaints[2::2]])
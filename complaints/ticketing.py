@@ -0,0 +1,96 @@
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+TICKET_PREFIX = 'SVN'
+
+
+def reserve_block(day, size):
+    """
+    Reserve `size` consecutive sequence numbers for `day` and return the first.
+    The increment is a single UPDATE, so concurrent processes never receive
+    overlapping blocks.
+    """
+    from .models import TicketSequence
+
+    with transaction.atomic():
+        if not TicketSequence.objects.filter(day=day).update(last_value=F('last_value') + size):
+            try:
+                with transaction.atomic():
+                    TicketSequence.objects.create(day=day, last_value=size)
+            except IntegrityError:
+                # Another process created today's row first
+                TicketSequence.objects.filter(day=day).update(last_value=F('last_value') + size)
+            else:
+                return 1
+        last_value = TicketSequence.objects.values_list('last_value', flat=True).get(day=day)
+    return last_value - size + 1
+
+
+def format_ticket_id(day, value):
+    return f"{TICKET_PREFIX}{day:%y%m%d}{value:05d}"
+
+
+class TicketIdAllocator:
+    """
+    Hands out ticket IDs from a block of sequence numbers reserved in the
+    database, so most complaints get their ID without a round trip. IDs are
+    increasing within a process and sort by day, keeping primary key inserts
+    at the right edge of the index.
+    """
+
+    def __init__(self, block_size=None):
+        self.block_size = block_size or settings.TICKET_ID_BLOCK_SIZE
+        self._lock = threading.Lock()
+        self._day = None
+        self._next = self._end = 0
+
+    def next_id(self):
+        """
+        The next ID from the cached block. Numbers in the cache were reserved
+        by a committed transaction, so handing one out inside the caller's
+        transaction is safe: a rollback only leaves a gap. Only refilling the
+        cache needs autocommit; callers that create complaints in a
+        transaction take their ID before opening it, like perform_create.
+        """
+        day = timezone.localdate()
+        in_transaction = transaction.get_connection().in_atomic_block
+        with self._lock:
+            if day != self._day or self._next >= self._end:
+                if in_transaction:
+                    # A block reserved here would be rolled back with the
+                    # caller's transaction while its remainder lived on in the
+                    # cache, so take exactly one number that shares its fate
+                    return format_ticket_id(day, reserve_block(day, 1))
+                self._next = reserve_block(day, self.block_size)
+                self._end = self._next + self.block_size
+                self._day = day
+            value = self._next
+            self._next += 1
+        return format_ticket_id(day, value)
+
+    def next_ids(self, count):
+        # A reservation of its own for bulk inserts: one round trip for all
+        # `count` ids, consecutive, and rolled back with the caller if need be
+        day = timezone.localdate()
+        first = reserve_block(day, count)
+        return [format_ticket_id(day, first + offset) for offset in range(count)]
+
+    def reset(self):
+        with self._lock:
+            self._day = None
+            self._next = self._end = 0
+
+
+allocator = TicketIdAllocator()
+
+
+def next_ticket_id():
+    return allocator.next_id()
+
+
+def next_ticket_ids(count):
+    return allocator.next_ids(count) if count else []
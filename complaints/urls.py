@@ -9,8 +9,14 @@ router.register(r'complaints', views.ComplaintViewSet)
 router.register(r'departments', views.DepartmentViewSet)
 router.register(r'issue-category', views.IssueCatViewset)
 
+api_patterns = [
+    # Ahead of the router, which would read "events" as a ticket_id
+    path('complaints/events/', views.complaint_events, name='complaint-events'),
+    path('', include(router.urls)),
+]
+
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('', include(router.urls)),
-    path('api/', include(router.urls)),
+    path('', include(api_patterns)),
+    path('api/', include(api_patterns)),
 ]
\ No newline at end of file
@@ -1,18 +1,53 @@
+import os
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from django.utils import timezone
+from django.utils.dateparse import parse_date
 from rest_framework import generics, status, filters
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 from rest_framework.mixins import ListModelMixin, CreateModelMixin, RetrieveModelMixin, UpdateModelMixin,DestroyModelMixin
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Room, Complaint, Department, Issue_Category
-from .serializers import RoomSerializer, ComplaintSerializer, ComplaintCreateSerializer, ComplaintUpdateSerializer, DepartmentSerializer,IssueCatSerializer
-from .pagination import CustomLimitOffsetPagination
+from . import bulk, events, export, idempotency, rollups, routers
+from . import changes as change_log
+from . import qr as qr_payload
+from .bootstrap import bootstrap_json
+from .models import Room, Complaint, ComplaintEvent, Department, Issue_Category
+from .serializers import DUPLICATE_OPEN_MESSAGE, BulkStatusUpdateSerializer, RoomSerializer, ComplaintSerializer, ComplaintCreateSerializer, ComplaintUpdateSerializer, DepartmentSerializer,IssueCatSerializer
+from .pagination import SelectablePagination
+from .provisioning import API_MAX_ROWS, import_rooms, parse_rooms, summarize
+from .search import FullTextSearchFilter
+from .streaming import is_stream_requested, stream_json_array
+from .ticketing import next_ticket_id
+from .versions import ConditionalGetMixin
+
+def parse_date_range(request):
+    # ?from= and ?to= as dates; returns (params, error response)
+    params = {}
+    for param in ('from', 'to'):
+        value = request.query_params.get(param)
+        if value:
+            try:
+                params[param] = parse_date(value)
+            except ValueError:
+                params[param] = None
+            if params[param] is None:
+                return params, Response(
+                    {'error': f'Invalid {param} date, expected YYYY-MM-DD'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+    return params, None
+
 
 # Create your views here.
-class RoomViewSet(GenericViewSet, ListModelMixin, CreateModelMixin, RetrieveModelMixin, UpdateModelMixin,DestroyModelMixin):
+class RoomViewSet(ConditionalGetMixin, GenericViewSet, ListModelMixin, CreateModelMixin, RetrieveModelMixin, UpdateModelMixin,DestroyModelMixin):
     queryset = Room.objects.all()
+    version_models = [Room]
     serializer_class = RoomSerializer
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     filterset_fields = ['status', 'ward', 'speciality', 'room_type']
@@ -30,20 +65,48 @@ class RoomViewSet(GenericViewSet, ListModelMixin, CreateModelMixin, RetrieveMode
             )
             
         room.status = new_status
-        room.save()
+        # Status is not part of the QR payload, so this is a single UPDATE
+        room.save(update_fields=['status'])
         return Response(RoomSerializer(room).data)
 
+    @action(detail=False, methods=['post'])
+    def bulk_import(self, request):
+        # Either a JSON list of rooms as the body, or a CSV/JSON file upload
+        if isinstance(request.data, list):
+            rows = request.data
+        else:
+            upload = request.FILES.get('file')
+            if upload is None:
+                return Response(
+                    {'error': 'Send a JSON list of rooms or upload a CSV/JSON file as "file"'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            file_format = request.data.get('file_format') or os.path.splitext(upload.name)[1].lstrip('.').lower()
+            try:
+                rows = parse_rooms(upload.read(), file_format)
+            except ValueError as exc:
+                return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
-class DepartmentViewSet(GenericViewSet, ListModelMixin, CreateModelMixin, RetrieveModelMixin, UpdateModelMixin, DestroyModelMixin):
+        if len(rows) > API_MAX_ROWS:
+            return Response(
+                {'error': f'At most {API_MAX_ROWS} rooms per request; use manage.py import_rooms for larger imports'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(summarize(import_rooms(rows)))
+
+
+class DepartmentViewSet(ConditionalGetMixin, GenericViewSet, ListModelMixin, CreateModelMixin, RetrieveModelMixin, UpdateModelMixin, DestroyModelMixin):
     queryset = Department.objects.all()
+    version_models = [Department]
     serializer_class = DepartmentSerializer
     lookup_field = 'department_code'
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     filterset_fields = ['department_name','status']
     search_fields = ['department_code', 'department_name']
 
-class IssueCatViewset(GenericViewSet, ListModelMixin, CreateModelMixin, RetrieveModelMixin, UpdateModelMixin, DestroyModelMixin):
-    queryset = Issue_Category.objects.all()
+class IssueCatViewset(ConditionalGetMixin, GenericViewSet, ListModelMixin, CreateModelMixin, RetrieveModelMixin, UpdateModelMixin, DestroyModelMixin):
+    queryset = Issue_Category.objects.select_related('department')
+    version_models = [Issue_Category, Department]  # department_name is serialized too
     serializer_class = IssueCatSerializer
     lookup_field = 'issue_category_code'
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
@@ -51,15 +114,24 @@ class IssueCatViewset(GenericViewSet, ListModelMixin, CreateModelMixin, Retrieve
     search_fields = ['issue_category_code', 'department__department_name', 'issue_category_name']
 
 class ComplaintViewSet(GenericViewSet, ListModelMixin, CreateModelMixin, RetrieveModelMixin, UpdateModelMixin, DestroyModelMixin):
-    queryset = Complaint.objects.all().order_by('-submitted_at')
+    queryset = Complaint.objects.prefetch_related('images').order_by('-submitted_at')
     lookup_field = 'ticket_id'
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    # FullTextSearchFilter comes last so its relevance ordering wins over the default ordering
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter, FullTextSearchFilter]
     filterset_fields = ['status', 'priority', 'issue_type', 'ward', 'block']
     search_fields = ['ticket_id', 'room_number', 'bed_number', 'description']
     ordering_fields = ['submitted_at', 'priority', 'status']
     ordering = ['-submitted_at']  # default ordering
-    pagination_class = CustomLimitOffsetPagination
-    
+    pagination_class = SelectablePagination
+    # Reporting reads, served by the read replica if there is one
+    replica_actions = ['list', 'by_status', 'by_priority', 'stats', 'export']
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in self.replica_actions:
+            queryset = queryset.using(routers.read_database(self.request))
+        return queryset
+
     def get_serializer_class(self):
         if self.action == 'create':
             return ComplaintCreateSerializer
@@ -67,8 +139,57 @@ class ComplaintViewSet(GenericViewSet, ListModelMixin, CreateModelMixin, Retriev
             return ComplaintUpdateSerializer
         return ComplaintSerializer
 
+    def paginated_or_streamed(self, queryset):
+        # ?stream=true sends every matching row as a chunked JSON array for
+        # bulk consumers; everyone else gets the same pages as the main list
+        if is_stream_requested(self.request):
+            return stream_json_array(queryset, self.get_serializer_class(), self.get_serializer_context())
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+    def create(self, request, *args, **kwargs):
+        # Retries sent with the same Idempotency-Key get the first response
+        # back, see complaints.idempotency
+        key = request.headers.get(idempotency.HEADER)
+        if not key:
+            return super().create(request, *args, **kwargs)
+        if len(key) > idempotency.MAX_KEY_LENGTH:
+            return Response(
+                {'error': f'{idempotency.HEADER} must be at most {idempotency.MAX_KEY_LENGTH} characters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        fingerprint = idempotency.request_hash(request)
+        response = idempotency.replay(key, fingerprint)
+        if response is not None:
+            return response
+        # Stored by perform_create in the transaction that inserts the complaint
+        self.idempotency_key = (key, fingerprint)
+        try:
+            return super().create(request, *args, **kwargs)
+        except (IntegrityError, ValidationError):
+            # A concurrent attempt with the same key committed first. Its
+            # complaint usually fails this one on complaint_open_room_uniq
+            # before the key insert does, which surfaces as a ValidationError
+            response = idempotency.replay(key, fingerprint)
+            if response is None:
+                raise
+            return response
+
     def perform_create(self, serializer):
-        serializer.save(submitted_by=self.request.user.username if self.request.user.is_authenticated else "Anonymous")
+        # Taken before the transaction opens so it comes from the allocator's
+        # cached block, see ticketing.next_id
+        ticket_id = next_ticket_id()
+        with transaction.atomic():
+            complaint = serializer.save(ticket_id=ticket_id, submitted_by=self.request.user.username if self.request.user.is_authenticated else "Anonymous")
+            events.record_event(complaint, ComplaintEvent.CREATED)
+            if getattr(self, 'idempotency_key', None):
+                idempotency.store(*self.idempotency_key, status.HTTP_201_CREATED, serializer.data)
 
     @action(detail=True, methods=['post'])
     def update_status(self, request, ticket_id=None):
@@ -82,23 +203,151 @@ class ComplaintViewSet(GenericViewSet, ListModelMixin, CreateModelMixin, Retriev
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        update_data = {
-            'status': new_status,
-            'remarks': remarks
-        }
-
-        if new_status == 'resolved':
-            update_data.update({
-                'resolved_by': request.user.username if request.user.is_authenticated else None,
-                'resolved_at': timezone.now()
-            })
+        # The same status, remarks and resolution fields as bulk_update_status
+        update_data = bulk.status_update_values(
+            new_status, remarks, request.user.username if request.user.is_authenticated else None
+        )
 
+        old_status = complaint.status
         serializer = self.get_serializer(complaint, data=update_data, partial=True)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            serializer.save()
+            if new_status != old_status:
+                events.record_event(complaint, ComplaintEvent.STATUS_CHANGED)
         
         return Response(serializer.data)
 
+    @action(detail=False, methods=['post'])
+    def bulk_update_status(self, request):
+        # update_status for many tickets at once: one transaction, set-based
+        # UPDATEs, and no per-ticket serializer validation
+        serializer = BulkStatusUpdateSerializer(data=request.data, context={'filter_fields': self.filterset_fields})
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        if 'ticket_ids' in data:
+            complaints = Complaint.objects.filter(ticket_id__in=data['ticket_ids'])
+        else:
+            complaints = Complaint.objects.filter(**data['filter'])
+
+        try:
+            results = bulk.update_status(
+                complaints,
+                data['status'],
+                data['remarks'],
+                username=request.user.username if request.user.is_authenticated else None,
+                ticket_ids=data.get('ticket_ids'),
+            )
+        except IntegrityError:
+            # Reopening would leave two open complaints for the same issue
+            # and room (complaint_open_room_uniq); nothing was changed
+            return Response({'error': DUPLICATE_OPEN_MESSAGE}, status=status.HTTP_400_BAD_REQUEST)
+        except bulk.TooManyComplaints as exc:
+            return Response(
+                {'error': f'The filter matches more than {exc.args[0]} complaints; narrow it down'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(bulk.summarize(results))
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        # Offline kiosks upload their queued complaints as
+        # {"complaints": [...]}, each with a client_key; resending a batch
+        # only creates what is not stored yet
+        items = request.data.get('complaints') if isinstance(request.data, dict) else None
+        if not isinstance(items, list) or not items:
+            return Response(
+                {'error': 'Send the complaints as a non-empty "complaints" list'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > bulk.INGEST_MAX_ITEMS:
+            return Response(
+                {'error': f'At most {bulk.INGEST_MAX_ITEMS} complaints per batch'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        submitted_by = request.user.username if request.user.is_authenticated else "Anonymous"
+        return Response(bulk.summarize_ingest(bulk.ingest_complaints(items, submitted_by)))
+
+    @action(detail=False, methods=['get'])
+    def bootstrap(self, request):
+        # One round trip for the QR-linked complaint form: the room from the
+        # signed payload plus the active department -> issue category tree
+        qr_data = request.query_params.get('data')
+        signature = request.query_params.get('signature')
+        if not qr_data or not signature or not qr_payload.verify(qr_data, signature):
+            return Response(
+                {'qr_code': 'QR code data has been tampered with or is invalid.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return HttpResponse(bootstrap_json(qr_data), content_type='application/json')
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        # Delta sync: complaints created, updated or deleted after ?since=,
+        # in change order; `next` is the token for the following request
+        try:
+            since = change_log.parse_token(request.query_params.get('since'))
+            limit = min(int(request.query_params.get('limit') or change_log.DEFAULT_LIMIT), change_log.MAX_LIMIT)
+        except ValueError:
+            return Response(
+                {'error': 'since and limit must be non-negative integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if limit < 1:
+            return Response({'error': 'limit must be at least 1'}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows, has_more = change_log.changes_since(since, limit)
+        changed_ids = [row.ticket_id for row in rows if not row.deleted]
+        complaints = {
+            complaint.ticket_id: complaint
+            for complaint in self.get_queryset().order_by().filter(ticket_id__in=changed_ids)
+        }
+        serializer = self.get_serializer([complaints[ticket_id] for ticket_id in changed_ids if ticket_id in complaints], many=True)
+        return Response({
+            'since': str(since),
+            'next': str(rows[-1].pk) if rows else str(since),
+            'has_more': has_more,
+            'changed': serializer.data,
+            'deleted': [row.ticket_id for row in rows if row.deleted],
+        })
+
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        # Served from the ComplaintStat rollup table, see rollups.py
+        params, error = parse_date_range(request)
+        if error:
+            return error
+
+        bucket = request.query_params.get('bucket', 'day')
+        if bucket not in rollups.BUCKETS:
+            return Response(
+                {'error': 'Invalid bucket'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response(rollups.compute_stats(
+            params.get('from'), params.get('to'), bucket, using=routers.read_database(request)
+        ))
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        # Every complaint matching the list filters (and ?from=/?to= on the
+        # submission date) as one streamed CSV or JSONL file, see export.py
+        params, error = parse_date_range(request)
+        if error:
+            return error
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in export.CONTENT_TYPES:
+            return Response(
+                {'error': 'file_format must be csv or jsonl'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        queryset = export.in_date_range(self.filter_queryset(self.get_queryset()), params.get('from'), params.get('to'))
+        response = StreamingHttpResponse(export.stream(queryset, file_format), content_type=export.CONTENT_TYPES[file_format])
+        response['Content-Disposition'] = f'attachment; filename="complaints.{file_format}"'
+        return response
+
     @action(detail=False, methods=['get'])
     def by_status(self, request):
         status_filter = request.query_params.get('status')
@@ -108,9 +357,8 @@ class ComplaintViewSet(GenericViewSet, ListModelMixin, CreateModelMixin, Retriev
                 status=status.HTTP_400_BAD_REQUEST
             )
             
-        complaints = self.queryset.filter(status=status_filter)
-        serializer = self.get_serializer(complaints, many=True)
-        return Response(serializer.data)
+        complaints = self.get_queryset().filter(status=status_filter)
+        return self.paginated_or_streamed(complaints)
 
     @action(detail=False, methods=['get'])
     def by_priority(self, request):
@@ -121,6 +369,34 @@ class ComplaintViewSet(GenericViewSet, ListModelMixin, CreateModelMixin, Retriev
                 status=status.HTTP_400_BAD_REQUEST
             )
             
-        complaints = self.queryset.filter(priority=priority_filter)
-        serializer = self.get_serializer(complaints, many=True)
-        return Response(serializer.data)
+        complaints = self.get_queryset().filter(priority=priority_filter)
+        return self.paginated_or_streamed(complaints)
+
+
+async def complaint_events(request):
+    """
+    Server-Sent Events feed of complaint creations and status changes, for
+    dashboards that would otherwise poll the complaint list. Filter with
+    ?ward=, ?block= and ?department= (repeatable); resume with Last-Event-ID.
+    """
+    try:
+        last_id = events.parse_last_event_id(request)
+    except ValueError:
+        return HttpResponseBadRequest('Invalid Last-Event-ID')
+    filters = events.parse_filters(request.GET)
+    if last_id is None:
+        # A fresh connection only wants what happens from now on
+        last_id = await sync_to_async(events.latest_event_id)()
+
+    if isinstance(request, ASGIRequest):
+        stream = events.live_events(last_id, filters)
+    else:
+        # A WSGI worker cannot hold the connection open; send what is pending
+        # and let the client reconnect after the retry interval
+        pending = await sync_to_async(events.fetch_events)(last_id, filters)
+        stream = [events.retry_field()] + [events.format_event(event) for event in pending]
+
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # don't let nginx buffer the stream
+    return response
@@ -3,6 +3,10 @@ ASGI config for complaintsystem project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The live complaint event feed (/api/complaints/events/) holds its
+connections open only when served through this module, e.g.
+``uvicorn complaintsystem.asgi:application``.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -26,6 +26,15 @@ SECRET_KEY = 'django-insecure-_8&9w)pek%vf&9%w+)t9_@g$)s12m8&9n^330uda-lgg0*i+ir
 # Secret key for QR code HMAC
 QR_CODE_SECRET_KEY = 'YOUR_VERY_STRONG_RANDOM_QR_SECRET_KEY_HERE' # CHANGE THIS IN PRODUCTION
 
+# Complaint form the room QR codes link to, and the payload format written into
+# new codes (complaints.qr: 1 = legacy base64 JSON, 2 = compact, 3 = compact with
+# the room id). All formats are accepted on complaint submission.
+QR_CODE_BASE_URL = 'http://localhost:5173/ComplaintForm'
+QR_PAYLOAD_VERSION = 3
+
+# Ticket sequence numbers each process reserves from the database at a time
+TICKET_ID_BLOCK_SIZE = 20
+
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
@@ -56,6 +65,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'complaints.routers.ReadYourWritesMiddleware',
 ]
 
 ROOT_URLCONF = 'complaintsystem.urls'
@@ -85,9 +95,95 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file rather than the shared-cache in-memory default, so tests with
+        # concurrent writers see real SQLite locking
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+# SQLite tuned for many concurrent complaint submissions. Selected with
+# DATABASE_PROFILE=production in the environment; `manage.py sqlite_stress`
+# compares it with the plain configuration.
+SQLITE_PRODUCTION_PROFILE = {
+    'OPTIONS': {
+        # Seconds to wait for a competing writer before "database is locked"
+        'timeout': 20,
+        # Take the write lock at BEGIN. A deferred transaction that reads and
+        # then writes fails at once when another writer got in between; an
+        # immediate one waits for its turn at the start instead.
+        'transaction_mode': 'IMMEDIATE',
+        'init_command': ';'.join([
+            # Readers no longer block the writer or each other
+            'PRAGMA journal_mode=WAL',
+            # With WAL, fsync at checkpoints only; committed data survives an
+            # application crash, the last commits may be lost on power loss
+            'PRAGMA synchronous=NORMAL',
+            'PRAGMA cache_size=-65536',  # KiB, so 64 MiB of page cache per connection
+            'PRAGMA mmap_size=268435456',  # read through 256 MiB of memory-mapped I/O
+            'PRAGMA temp_store=MEMORY',
+        ]),
+    },
+    # Reuse connections (and their page cache) across requests
+    'CONN_MAX_AGE': 600,
+    'CONN_HEALTH_CHECKS': True,
+}
+
+DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'development')
+if DATABASE_PROFILE == 'production':
+    DATABASES['default'].update(SQLITE_PRODUCTION_PROFILE)
+
+# Optional read replica for reporting reads, see complaints.routers. In
+# production a copy kept up to date by replication; locally any second SQLite
+# file with the same schema stands in.
+DATABASE_REPLICA_NAME = os.environ.get('DATABASE_REPLICA_NAME')
+if DATABASE_REPLICA_NAME:
+    DATABASES['replica'] = dict(DATABASES['default'], NAME=DATABASE_REPLICA_NAME, TEST={'MIRROR': 'default'})
+
+DATABASE_ROUTERS = ['complaints.routers.PrimaryReplicaRouter']
+# Seconds a client keeps reading from the primary after a write
+REPLICA_PIN_SECONDS = 10
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local memory is per process; use a shared backend when running several workers
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'complaintsystem',
+    }
+}
+
+# Seconds a room lookup made during complaint submission stays cached
+ROOM_CACHE_TIMEOUT = 300
+
+
+# Live complaint event feed (/api/complaints/events/), needs an ASGI server.
+# Seconds between change log polls, between keepalive comments when idle, and
+# before a connection is closed for the client to reconnect
+SSE_POLL_INTERVAL = 1
+SSE_HEARTBEAT_INTERVAL = 15
+SSE_MAX_DURATION = 300
+# Milliseconds EventSource waits before reconnecting
+SSE_RETRY_MS = 3000
+# Seconds events are kept for clients resuming with Last-Event-ID, see
+# `manage.py purge_complaint_events`
+SSE_EVENT_RETENTION = 7 * 24 * 60 * 60
+
+
+# Complaint image pipeline (complaints.images). Threads per process that pick
+# up new uploads; 0 leaves every job to `manage.py process_image_jobs`
+IMAGE_PIPELINE_THREADS = 2
+IMAGE_MAX_DIMENSION = 1600  # pixels, longest side
+IMAGE_THUMBNAIL_SIZE = 320
+IMAGE_WEBP_QUALITY = 80
+
+
+# Seconds a complaint submission's response is kept for retries that send the
+# same Idempotency-Key header
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
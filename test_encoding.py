@@ -31,7 +31,7 @@ decoded_data = json.loads(decoded_json)
 print("\nDecoded data:", decoded_data)
 
 # Verify all fields are present
-expected_fields = ['bed_no', 'room_no', 'Block', 'Floor_no', 'ward', 'speciality', 'room_type', 'status']
+expected_fields = ['bed_no', 'room_no', 'Block', 'Floor_no', 'ward', 'speciality', 'room_type']
 missing_fields = [field for field in expected_fields if field not in decoded_data]
 if missing_fields:
     print("\nMissing fields:", missing_fields)